@@ -1,16 +1,40 @@
 from django.contrib import admin
+from django.db import transaction
+from django.utils import timezone
 from django.utils.html import format_html
+from .catalog import bump_version
+from .images import smallest_derivative_url
+from .search import update_object
+from .suggestions import update_questions
 from .models import (
     FAQComment, TrainingPackage, Weapon, 
-    Instructor, Booking, Testimonial, RangeLocation
+    Instructor, Booking, Testimonial, RangeLocation, OutboundEmail
 )
 
+
+def _update_and_reindex(queryset, **values):
+    """
+    queryset.update(**values), plus what the post_save signals it skips
+    would do: invalidate the cached pages and update the search index.
+    Returns the updated objects.
+    """
+    # The changelist filters may no longer match once the values change
+    pks = list(queryset.values_list('pk', flat=True))
+    queryset.update(**values)
+    bump_version(queryset.model)
+    objects = list(queryset.model.objects.filter(pk__in=pks).order_by('pk'))
+    for obj in objects:
+        update_object(obj)
+    return objects
+
+
 @admin.register(FAQComment)
 class FAQCommentAdmin(admin.ModelAdmin):
     list_display = ('user', 'short_content', 'parent_link', 'created_at', 'is_active', 'is_reply')
     list_filter = ('created_at', 'is_active', 'parent')
     search_fields = ('content', 'user__username')
     list_editable = ('is_active',)
+    list_select_related = ('user', 'parent')
     list_per_page = 20
     date_hierarchy = 'created_at'
     actions = ['approve_comments', 'disapprove_comments']
@@ -29,9 +53,9 @@ class FAQCommentAdmin(admin.ModelAdmin):
     short_content.short_description = 'Content'
 
     def parent_link(self, obj):
-        if obj.parent:
+        if obj.parent_id:
             return format_html('<a href="{}">{}</a>', 
-                             f'/admin/lessons/faqcomment/{obj.parent.id}/change/',
+                             f'/admin/lessons/faqcomment/{obj.parent_id}/change/',
                              obj.parent.short_content())
         return "-"
     parent_link.short_description = 'Parent Comment'
@@ -42,11 +66,13 @@ class FAQCommentAdmin(admin.ModelAdmin):
     is_reply.short_description = 'Is Reply?'
 
     def approve_comments(self, request, queryset):
-        queryset.update(is_active=True)
+        comments = _update_and_reindex(queryset, is_active=True)
+        transaction.on_commit(lambda: update_questions(comments))
     approve_comments.short_description = "Approve selected comments"
 
     def disapprove_comments(self, request, queryset):
-        queryset.update(is_active=False)
+        comments = _update_and_reindex(queryset, is_active=False)
+        transaction.on_commit(lambda: update_questions(comments))
     disapprove_comments.short_description = "Disapprove selected comments"
 
 
@@ -73,7 +99,8 @@ class WeaponAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 100px;"/>', obj.image.url)
+            # Smallest resized copy rather than the full upload
+            return format_html('<img src="{}" style="max-height: 100px;"/>', smallest_derivative_url(obj.image.name))
         return "-"
     image_preview.short_description = 'Preview'
 
@@ -99,7 +126,7 @@ class BookingAdmin(admin.ModelAdmin):
     )
     list_filter = ('payment_status', 'payment_method', 'date')
     search_fields = ('user__username', 'package__name', 'transaction_id')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('reminder_sent_at', 'registration_form', 'created_at', 'updated_at')
     date_hierarchy = 'date'
     list_select_related = ('user', 'package', 'weapon', 'instructor')
     
@@ -111,7 +138,7 @@ class BookingAdmin(admin.ModelAdmin):
             'fields': ('payment_method', 'payment_status', 'transaction_id', 'amount_paid')
         }),
         ('System Information', {
-            'fields': ('created_at', 'updated_at')
+            'fields': ('reminder_sent_at', 'registration_form', 'created_at', 'updated_at')
         }),
     )
 
@@ -143,11 +170,11 @@ class TestimonialAdmin(admin.ModelAdmin):
     short_content.short_description = 'Content'
 
     def approve_testimonials(self, request, queryset):
-        queryset.update(is_approved=True)
+        _update_and_reindex(queryset, is_approved=True)
     approve_testimonials.short_description = "Approve selected testimonials"
 
     def disapprove_testimonials(self, request, queryset):
-        queryset.update(is_approved=False)
+        _update_and_reindex(queryset, is_approved=False)
     disapprove_testimonials.short_description = "Disapprove selected testimonials"
 
 
@@ -163,6 +190,19 @@ class RangeLocationAdmin(admin.ModelAdmin):
     short_address.short_description = 'Address'
 
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ['retry_emails']
+
+    def retry_emails(self, request, queryset):
+        queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+    retry_emails.short_description = "Retry selected emails"
+
+
 # Admin site customization
 admin.site.site_header = "Ready Aim Learn Administration"
 admin.site.site_title = "Ready Aim Learn Admin Portal"
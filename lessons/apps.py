@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def refresh_search_index(sender, **kwargs):
+    from .search import sync_search_index
+
+    # The static FAQs are code, so every deploy's migrate reindexes them
+    sync_search_index()
 
 
 class LessonsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lessons'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .documents import resolve_registration_form
+        from .emails import warm_email_templates
+
+        # Inline email CSS at startup instead of on the first send
+        warm_email_templates()
+        # Pick (or generate) the registration form once per process
+        resolve_registration_form()
+        post_migrate.connect(refresh_search_index, sender=self)
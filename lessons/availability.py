@@ -0,0 +1,251 @@
+"""
+Availability engine shared by the booking views, forms and models.
+
+Each instructor-day is modelled as a sorted list of busy intervals
+(minutes since midnight), so conflict checks are a binary search instead
+of exact (date, time) comparisons against TIME_SLOTS.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Availability, Booking, SlotHold, SlotInventory
+from .schedule import TIME_SLOTS, get_schedule, to_minutes
+
+# Bookings in these states occupy a slot
+ACTIVE_BOOKING_STATUSES = ['pending', 'confirmed']
+
+# Longest range the calendar endpoint will answer in one response
+MAX_RANGE_DAYS = 60
+
+# Duration assumed when the caller does not know the package yet
+DEFAULT_SLOT_DURATION = 30
+
+# Longest lesson a package or booking may last
+MAX_LESSON_MINUTES = 240
+
+
+def get_buffer_minutes():
+    """Minimum gap required between two lessons of the same instructor"""
+    return getattr(settings, 'BOOKING_BUFFER_MINUTES', 0)
+
+
+def iter_dates(start_date, end_date):
+    """Yield every date from start_date to end_date inclusive"""
+    for offset in range((end_date - start_date).days + 1):
+        yield start_date + timedelta(days=offset)
+
+
+class DayIntervals:
+    """Busy intervals for one instructor-day, kept sorted by start minute"""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        self._max_ends = None
+        for start, end in intervals:
+            self.add(start, end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        """Insert a busy interval [start, end)"""
+        index = bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self._max_ends = None
+
+    def _prefix_max_ends(self):
+        if self._max_ends is None:
+            self._max_ends = []
+            running = -1
+            for end in self.ends:
+                running = max(running, end)
+                self._max_ends.append(running)
+        return self._max_ends
+
+    def overlaps(self, start, end, buffer=0):
+        """
+        Return True if [start, end) conflicts with any busy interval once
+        `buffer` minutes are kept free on either side.
+        """
+        start -= buffer
+        end += buffer
+        # Intervals starting before `end` are the only candidates; of
+        # those, the one reaching furthest decides the overlap.
+        index = bisect_left(self.starts, end)
+        if index == 0:
+            return False
+        return self._prefix_max_ends()[index - 1] > start
+
+    def free_minutes(self, start, buffer=0, limit=MAX_LESSON_MINUTES):
+        """Return the longest lesson (capped at `limit`) that can begin at `start`"""
+        if self.overlaps(start, start + 1, buffer):
+            return 0
+        index = bisect_left(self.starts, start + buffer)
+        if index == len(self.starts):
+            return limit
+        return min(limit, self.starts[index] - buffer - start)
+
+
+def load_busy_intervals(instructor, start_date, end_date, exclude_booking_id=None):
+    """
+    Return {date: DayIntervals} for an instructor.
+
+    Active bookings and unexpired checkout holds both count as busy; each
+    is read with a single query for the whole range.
+    """
+    bookings = Booking.objects.filter(
+        instructor=instructor,
+        date__range=(start_date, end_date),
+        status__in=ACTIVE_BOOKING_STATUSES
+    )
+    if exclude_booking_id:
+        bookings = bookings.exclude(pk=exclude_booking_id)
+
+    holds = SlotHold.objects.filter(
+        instructor=instructor,
+        date__range=(start_date, end_date),
+        expires_at__gt=timezone.now()
+    )
+
+    busy = defaultdict(DayIntervals)
+    for queryset in (bookings, holds):
+        for busy_date, busy_time, duration in queryset.values_list('date', 'time', 'duration'):
+            start = to_minutes(busy_time)
+            busy[busy_date].add(start, start + duration)
+    return busy
+
+
+def works_on(instructor, day, exceptions=None):
+    """Check the instructor's weekly schedule and special availability for a day"""
+    if not get_schedule(instructor).works_weekday(day):
+        return False
+    if exceptions is None:
+        exceptions = dict(Availability.objects.filter(
+            instructor=instructor,
+            date=day
+        ).values_list('date', 'is_available'))
+    return exceptions.get(day, True)
+
+
+def is_slot_available(instructor, day, start_time, duration,
+                      exclude_booking_id=None, check_conflicts=True):
+    """
+    Single entry point for "can this instructor take this lesson?".
+
+    Checks working days, working hours, availability exceptions and,
+    unless disabled, overlap with existing bookings and checkout holds
+    including buffer time.
+    """
+    if not works_on(instructor, day):
+        return False
+
+    if not get_schedule(instructor).within_hours(start_time):
+        return False
+
+    if not check_conflicts:
+        return True
+
+    busy = load_busy_intervals(instructor, day, day, exclude_booking_id)
+    start = to_minutes(start_time)
+    return not busy[day].overlaps(start, start + duration, get_buffer_minutes())
+
+
+def compute_capacities(instructor, start_date, end_date):
+    """
+    Compute slot capacity from live data for every day in a range.
+
+    Returns {date: [minutes, ...]} with one entry per TIME_SLOTS item: the
+    longest lesson that can start in that slot, or 0 when it is taken or
+    outside the instructor's schedule. Uses one Booking, one SlotHold and
+    one Availability query for the whole range.
+    """
+    busy = load_busy_intervals(instructor, start_date, end_date)
+
+    exceptions = dict(Availability.objects.filter(
+        instructor=instructor,
+        date__range=(start_date, end_date)
+    ).values_list('date', 'is_available'))
+
+    buffer = get_buffer_minutes()
+    working_slots = get_schedule(instructor).slots
+
+    capacities = {}
+    for day in iter_dates(start_date, end_date):
+        capacity = [0] * len(TIME_SLOTS)
+        if works_on(instructor, day, exceptions):
+            day_busy = busy.get(day) or DayIntervals()
+            for index, start, value in working_slots:
+                capacity[index] = day_busy.free_minutes(start, buffer)
+        capacities[day] = capacity
+    return capacities
+
+
+def get_capacities(instructor, start_date, end_date):
+    """
+    Return slot capacity for a range, read from SlotInventory where possible.
+
+    Days without an inventory row (outside the precomputed horizon) are
+    computed from live data.
+    """
+    capacities = dict(SlotInventory.objects.filter(
+        instructor=instructor,
+        date__range=(start_date, end_date)
+    ).values_list('date', 'capacity'))
+
+    missing = [day for day in iter_dates(start_date, end_date) if day not in capacities]
+    if missing:
+        computed = compute_capacities(instructor, missing[0], missing[-1])
+        for day in missing:
+            capacities[day] = computed[day]
+    return capacities
+
+
+def refresh_inventory(instructor, dates):
+    """Recompute the SlotInventory rows of an instructor for the given dates"""
+    today = timezone.now().date()
+    dates = sorted({day for day in dates if day >= today})
+    if not dates:
+        return
+
+    capacities = compute_capacities(instructor, dates[0], dates[-1])
+    for day in dates:
+        SlotInventory.objects.update_or_create(
+            instructor=instructor,
+            date=day,
+            defaults={'capacity': capacities[day]}
+        )
+
+
+def get_range_availability(instructor, start_date, end_date, min_date=None,
+                           duration=DEFAULT_SLOT_DURATION):
+    """
+    Return slot availability for an instructor over a date range.
+
+    Precomputed days cost a single indexed SlotInventory read; the rest
+    are computed from live bookings, holds and availability exceptions
+    (one query each) and the instructor's weekly schedule. Returns a list
+    of dicts, one per day, with the slot values where a lesson of
+    `duration` minutes fits.
+    """
+    capacities = get_capacities(instructor, start_date, end_date)
+
+    days = []
+    for day in iter_dates(start_date, end_date):
+        free_slots = []
+        if min_date is None or day >= min_date:
+            free_slots = [
+                value for (value, display), capacity in zip(TIME_SLOTS, capacities[day])
+                if capacity >= duration
+            ]
+        days.append({
+            'date': day,
+            'is_available': bool(free_slots),
+            'available_slots': free_slots,
+        })
+    return days
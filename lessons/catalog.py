@@ -0,0 +1,143 @@
+"""
+Cached catalog of active packages, weapons, instructors and locations.
+
+These tables change a few times a month but used to be queried on every
+page view. Every model the catalog is built from has a version token in
+the shared cache, replaced on post_save/post_delete (see signals.py), and
+each cached list is stored under the tokens of the models it was built
+from. A change made in one worker is therefore seen by every other worker
+on its next read; nothing has to be deleted, stale lists simply stop
+being looked up and expire.
+
+Tokens are random rather than counters so that two workers invalidating
+at the same moment, or a token evicted from the cache, can never bring an
+old version (and the list stored under it) back.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Instructor, RangeLocation, Testimonial, TrainingPackage, Weapon
+
+# Upper bound on how long an unused list stays in the cache
+CATALOG_CACHE_SECONDS = 60 * 60 * 24
+
+# Catalog name -> (models it is built from, function building the list, timeout)
+_ENTRIES = {}
+
+
+def catalog_entry(name, *models, timeout=CATALOG_CACHE_SECONDS):
+    """
+    Register a cached value rebuilt whenever one of `models` changes.
+
+    A shorter timeout suits values that also depend on data which does not
+    invalidate the catalog, such as bookings.
+    """
+    def decorator(build):
+        _ENTRIES[name] = (models, build, timeout)
+        return build
+    return decorator
+
+
+@catalog_entry('packages', TrainingPackage)
+def _active_packages():
+    return list(TrainingPackage.objects.filter(is_active=True))
+
+
+@catalog_entry('weapons', Weapon)
+def _active_weapons():
+    return list(Weapon.objects.filter(is_active=True))
+
+
+@catalog_entry('instructors', Instructor)
+def _active_instructors():
+    return list(Instructor.objects.filter(is_active=True).select_related('user'))
+
+
+@catalog_entry('locations', RangeLocation)
+def _active_locations():
+    return list(RangeLocation.objects.filter(is_active=True))
+
+
+@catalog_entry('instructor_profiles', Instructor, Testimonial)
+def _instructor_profiles():
+    return list(Instructor.objects.filter(is_active=True).select_related('user').annotate(
+        num_reviews=Count('testimonials')
+    ).order_by('-years_experience'))
+
+
+def catalog_models():
+    """Every model whose changes invalidate part of the catalog"""
+    return {model for models, build, timeout in _ENTRIES.values() for model in models}
+
+
+def _version_key(model):
+    return f"catalog:version:{model._meta.label_lower}"
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def get_versions(models):
+    """Current version token of each model, creating missing ones"""
+    keys = {model: _version_key(model) for model in models}
+    found = cache.get_many(keys.values())
+
+    versions = {}
+    for model, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            # Another worker may have created the token in the meantime
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions[model] = version
+    return versions
+
+
+def bump_version(model):
+    """Invalidate every cached list built from `model`, in all workers"""
+    cache.set(_version_key(model), _new_version(), None)
+
+
+def get_catalog(*names):
+    """
+    Return {name: list} for the requested catalog entries.
+
+    All version tokens are read with one get_many() and all lists with a
+    second one; only lists missing from the cache touch the database.
+    Entries are registered with @catalog_entry; other modules may add their
+    own (see lessons/featured.py).
+    """
+    entries = {name: _ENTRIES[name] for name in names}
+    versions = get_versions({model for models, build, timeout in entries.values() for model in models})
+    keys = {
+        name: ':'.join(['catalog', name] + [versions[model] for model in models])
+        for name, (models, build, timeout) in entries.items()
+    }
+
+    found = cache.get_many(keys.values())
+    catalog = {}
+    for name, key in keys.items():
+        if key in found:
+            catalog[name] = found[key]
+        else:
+            models, build, timeout = entries[name]
+            catalog[name] = build()
+            cache.set(key, catalog[name], timeout)
+    return catalog
+
+
+def get_catalog_list(name):
+    """Return a single catalog entry, e.g. get_catalog_list('locations')"""
+    return get_catalog(name)[name]
+
+
+def find_in_catalog(name, pk):
+    """Return the active object with primary key `pk` from a catalog list, or None"""
+    for obj in get_catalog_list(name):
+        if str(obj.pk) == str(pk):
+            return obj
+    return None
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose contents are private to one process
+PER_PROCESS_CACHES = [
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The catalog cache only invalidates across workers through a shared cache"""
+    if settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHES:
+        return [Warning(
+            "The default cache is private to each process, so catalog changes "
+            "made in one worker are not seen by the others.",
+            hint="Set CACHE_BACKEND to a shared backend such as Redis or Memcached.",
+            id='lessons.W001',
+        )]
+    return []
@@ -0,0 +1,80 @@
+"""
+Threaded FAQ comments, a page at a time.
+
+The FAQ page used to list every question ever asked, looking up each
+author separately, and could not show replies without a query per
+question. comment_threads() loads one page of questions, newest first,
+and all of their replies with authors in two queries whatever the size
+of the table. Older pages are found by keyset on (created_at, id), the
+same way as the dashboard (see dashboard.py), and fetched by the "load
+more" button from the faq_comments JSON endpoint.
+
+Threads are one level deep: a reply to a reply is attached to the
+question it belongs to (see thread_root()).
+"""
+from datetime import datetime
+
+from django.db.models import Prefetch, Q
+from django.urls import reverse
+
+from .models import FAQComment
+
+# Questions per page
+COMMENT_PAGE_SIZE = 10
+
+
+def encode_cursor(comment):
+    return f"{comment.created_at.isoformat()}_{comment.pk}"
+
+
+def decode_cursor(cursor):
+    """(created_at, pk) from encode_cursor(), or None for a missing or malformed cursor"""
+    try:
+        created_at, pk = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def thread_root(comment):
+    """The question a reply to `comment` belongs under"""
+    return comment.parent if comment.parent_id else comment
+
+
+def comment_threads(cursor=None, page_size=COMMENT_PAGE_SIZE):
+    """
+    Return (questions, next_cursor) for the page after `cursor`.
+
+    Each question has its active replies, oldest first, in `thread_replies`;
+    authors are loaded with both. `next_cursor` is None on the last page.
+    """
+    questions = FAQComment.objects.filter(parent__isnull=True, is_active=True)
+    position = decode_cursor(cursor)
+    if position:
+        created_at, pk = position
+        questions = questions.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    replies = FAQComment.objects.filter(is_active=True).select_related('user').order_by('created_at', 'pk')
+    rows = list(
+        questions.select_related('user').prefetch_related(
+            Prefetch('replies', queryset=replies, to_attr='thread_replies')
+        ).order_by('-created_at', '-pk')[:page_size + 1]
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def comment_data(comment, user_id=None):
+    """JSON-ready dict of one comment for the load more endpoint"""
+    return {
+        'id': comment.pk,
+        'author': comment.user.username,
+        'content': comment.content,
+        'created_at': comment.created_at.isoformat(),
+        # Only the author may delete; the page shows them a delete button
+        'delete_url': reverse('delete_comment', args=[comment.pk]) if user_id and comment.user_id == user_id else None,
+    }
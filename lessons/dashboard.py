@@ -0,0 +1,78 @@
+"""
+Bookings shown on the user dashboard.
+
+The dashboard lists every upcoming booking and one page of past ones,
+each with its package, instructor and location. All of that comes from
+a single joined query: past rows are numbered with ROW_NUMBER() and only
+the first PAST_PAGE_SIZE + 1 are kept (the extra row tells whether there
+is an older page), upcoming rows are always kept. Older pages are found
+by keyset on (date, time, id) rather than OFFSET, so no COUNT(*) is
+needed and page 20 costs the same as page 1.
+"""
+from datetime import date, time
+
+from django.db.models import BooleanField, Case, F, IntegerField, Q, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .models import Booking
+
+# Past bookings shown per page
+PAST_PAGE_SIZE = 5
+
+
+def encode_cursor(booking):
+    return f"{booking.date.isoformat()}_{booking.time.isoformat()}_{booking.pk}"
+
+
+def decode_cursor(cursor):
+    """(date, time, pk) from encode_cursor(), or None for a missing or malformed cursor"""
+    try:
+        day, start, pk = cursor.split('_')
+        return date.fromisoformat(day), time.fromisoformat(start), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _older_than(cursor):
+    day, start, pk = cursor
+    return Q(date__lt=day) | Q(date=day, time__lt=start) | Q(date=day, time=start, pk__lt=pk)
+
+
+def dashboard_bookings(user, today, cursor=None, page_size=PAST_PAGE_SIZE):
+    """
+    Return (upcoming, past, next_cursor) for `user`.
+
+    `upcoming` is in chronological order, `past` newest first and starting
+    after `cursor`; `next_cursor` is None on the last page.
+    """
+    upcoming = Q(date__gte=today)
+    past = Q(date__lt=today)
+    position = decode_cursor(cursor)
+    if position:
+        past &= _older_than(position)
+
+    rows = list(
+        Booking.objects.filter(user=user).filter(upcoming | past).annotate(
+            past_rank=Case(
+                When(upcoming, then=Value(0)),
+                default=Window(
+                    RowNumber(),
+                    partition_by=[Case(When(upcoming, then=Value(True)), default=Value(False), output_field=BooleanField())],
+                    order_by=[F('date').desc(), F('time').desc(), F('pk').desc()]
+                ),
+                output_field=IntegerField()
+            )
+        ).filter(
+            past_rank__lte=page_size + 1
+        ).select_related(
+            'package', 'instructor__user', 'location'
+        ).order_by('date', 'time', 'pk')
+    )
+
+    upcoming_bookings = [booking for booking in rows if booking.date >= today]
+    past_bookings = [booking for booking in reversed(rows) if booking.date < today]
+    next_cursor = None
+    if len(past_bookings) > page_size:
+        past_bookings = past_bookings[:page_size]
+        next_cursor = encode_cursor(past_bookings[-1])
+    return upcoming_bookings, past_bookings, next_cursor
@@ -0,0 +1,363 @@
+"""
+The printable registration form handed out on the legal page.
+
+The file used to be searched for on every download (and on every terms
+confirmation email) across half a dozen candidate paths, and when none
+existed it was re-drawn with reportlab, which is not even installed.
+resolve_registration_form() now picks the file once per process, at
+startup (see apps.py); without one, a plain fallback form is written to
+disk once and reused. file_response() serves it with validators, range
+support and optional X-Sendfile / X-Accel-Redirect offload.
+
+Confirmed bookings also get a copy prefilled with their details, built
+off the request path (see registration_forms.py). Those are stored under
+the SHA-256 of their contents, so identical forms share a file and a
+download is a plain file serve.
+"""
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import unicodedata
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+
+from .middleware import not_modified
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_FORM_NAME = 'registration_form.pdf'
+
+# Browsers revalidate after this long; a deploy can swap the file
+DOCUMENT_MAX_AGE = 60 * 60
+
+FALLBACK_LINES = [
+    "Registration Form",
+    "Ready Aim Learn",
+    "=" * 50,
+    "Student Information:",
+    "Full Name: ___________________________",
+    "Email: ___________________________",
+    "Phone: ___________________________",
+    "=" * 50,
+    "Course Details:",
+    "Course Name: ___________________________",
+    "Start Date: ___________________________",
+    "=" * 50,
+    "Instructor Section:",
+    "Instructor Signature: ___________________________",
+    "Date: ___________________________",
+    "Approval Stamp: ___________________________",
+    "",
+    "Instructions:",
+    "1. Please fill out all sections completely",
+    "2. Send the completed form to luisdavid313@gmail.com",
+    "3. Bring the signed form to your instructor for final approval",
+]
+
+# Prefilled per-booking form; placeholders are filled from
+# registration_forms.registration_form_fields(). Editing these lines
+# changes PREFILLED_VERSION, which rebuilds every stored form.
+PREFILLED_LINES = [
+    "Registration Form",
+    "Ready Aim Learn",
+    "=" * 50,
+    "Student Information:",
+    "Full Name: {name}",
+    "Email: {email}",
+    "Phone: ___________________________",
+    "=" * 50,
+    "Course Details:",
+    "Course Name: {package}",
+    "Start Date: {date} at {time}",
+    "Location: {location}",
+    "Booking Reference: #{booking_id}",
+    "=" * 50,
+    "Instructor Section:",
+    "Instructor: {instructor}",
+    "Instructor Signature: ___________________________",
+    "Date: ___________________________",
+    "Approval Stamp: ___________________________",
+    "",
+    "Instructions:",
+    "1. Check the details above and fill in the blank fields",
+    "2. Send the completed form to luisdavid313@gmail.com",
+    "3. Bring the signed form to your instructor for final approval",
+]
+
+# The standard PDF fonts only cover Windows-1252; other letters are
+# transliterated. Letters NFKD does not reduce to an ASCII base:
+TRANSLITERATIONS = {
+    'Ł': 'L', 'ł': 'l', 'Đ': 'D', 'đ': 'd', 'Ħ': 'H', 'ħ': 'h', 'ı': 'i',
+    'Ŧ': 'T', 'ŧ': 't', 'Ŀ': 'L', 'ŀ': 'l', 'ĸ': 'k', 'Ŋ': 'N', 'ŋ': 'n',
+    'Ə': 'E', 'ə': 'e', 'Ș': 'S', 'ș': 's', 'Ț': 'T', 'ț': 't',
+}
+for _upper, _latin in zip(
+    'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯІЇЄҐ',
+    ['A', 'B', 'V', 'G', 'D', 'E', 'E', 'Zh', 'Z', 'I', 'Y', 'K', 'L', 'M', 'N', 'O',
+     'P', 'R', 'S', 'T', 'U', 'F', 'Kh', 'Ts', 'Ch', 'Sh', 'Shch', '', 'Y', '', 'E',
+     'Yu', 'Ya', 'I', 'Yi', 'Ye', 'G'],
+):
+    TRANSLITERATIONS[_upper] = _latin
+    TRANSLITERATIONS[_upper.lower()] = _latin.lower()
+for _upper, _latin in zip(
+    'ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩ',
+    ['A', 'V', 'G', 'D', 'E', 'Z', 'I', 'Th', 'I', 'K', 'L', 'M', 'N', 'X', 'O', 'P',
+     'R', 'S', 'T', 'Y', 'F', 'Ch', 'Ps', 'O'],
+):
+    TRANSLITERATIONS[_upper] = _latin
+    TRANSLITERATIONS[_upper.lower()] = _latin.lower()
+TRANSLITERATIONS['ς'] = 's'
+
+# Text encoding of the generated PDFs, part of PREFILLED_VERSION
+PDF_TEXT_ENCODING = 'cp1252'
+
+PREFILLED_VERSION = hashlib.sha256(
+    json.dumps([PREFILLED_LINES, PDF_TEXT_ENCODING, TRANSLITERATIONS]).encode()
+).hexdigest()[:16]
+
+# Storage directory of the prefilled forms
+PREFILLED_FORMS_DIR = 'registration_forms'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def registration_form_candidates():
+    """Where a real registration form may have been put, in order of preference"""
+    candidates = [
+        os.path.join(settings.MEDIA_ROOT, 'documents', REGISTRATION_FORM_NAME),
+        os.path.join(settings.BASE_DIR, 'media', 'documents', REGISTRATION_FORM_NAME),
+        os.path.join(settings.BASE_DIR, 'static', 'documents', REGISTRATION_FORM_NAME),
+    ]
+    if settings.STATIC_ROOT:
+        candidates += [
+            os.path.join(settings.STATIC_ROOT, 'documents', REGISTRATION_FORM_NAME),
+            os.path.join(settings.STATIC_ROOT, 'lessons', 'documents', REGISTRATION_FORM_NAME),
+        ]
+    candidates += [
+        os.path.join(settings.BASE_DIR, REGISTRATION_FORM_NAME),
+        os.path.join(settings.BASE_DIR, 'assets', REGISTRATION_FORM_NAME),
+        os.path.join(settings.BASE_DIR, 'lessons', 'media', 'documents', REGISTRATION_FORM_NAME),
+    ]
+    return candidates
+
+
+def get_fallback_path():
+    return getattr(
+        settings,
+        'REGISTRATION_FORM_FALLBACK_PATH',
+        os.path.join(tempfile.gettempdir(), 'ready-aim-learn', REGISTRATION_FORM_NAME)
+    )
+
+
+def pdf_text(text):
+    """
+    `text` in the Windows-1252 encoding of the standard PDF fonts.
+
+    Other letters lose their accents (Ő -> O) or are transliterated
+    (Łukasz -> Lukasz, Иван -> Ivan); only what has no Latin reading
+    becomes '?'.
+    """
+    encoded = bytearray()
+    for char in text:
+        try:
+            encoded += char.encode(PDF_TEXT_ENCODING)
+            continue
+        except UnicodeEncodeError:
+            pass
+        if char in TRANSLITERATIONS:
+            encoded += TRANSLITERATIONS[char].encode('ascii')
+            continue
+        for part in unicodedata.normalize('NFKD', char):
+            if unicodedata.combining(part):
+                continue
+            part = TRANSLITERATIONS.get(part, part)
+            encoded += part.encode(PDF_TEXT_ENCODING, errors='replace')
+    return bytes(encoded)
+
+
+def build_fallback_pdf(lines=FALLBACK_LINES):
+    """A one-page letter-size PDF with `lines` of Helvetica text"""
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    text = ['BT', '/F1 12 Tf', '100 750 Td']
+    for index, line in enumerate(lines):
+        if index:
+            text.append('0 -20 Td')
+        text.append(f"({escape(line)}) Tj")
+    text.append('ET')
+    stream = pdf_text('\n'.join(text))
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+        b'/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def write_fallback_form(path):
+    """Write the fallback form to `path` unless it is already there"""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so no process sees half a file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(build_fallback_pdf())
+        os.replace(temp_path, path)
+    return path
+
+
+@lru_cache(maxsize=None)
+def resolve_registration_form():
+    """Path of the registration form served and attached to emails"""
+    for path in registration_form_candidates():
+        if os.path.isfile(path):
+            return path
+    logger.warning("No registration form found, serving the generated fallback")
+    return write_fallback_form(get_fallback_path())
+
+
+def store_content_addressed(data, storage=None):
+    """Save `data` under its SHA-256 and return the storage name"""
+    storage = storage or default_storage
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{PREFILLED_FORMS_DIR}/{digest[:2]}/{digest}.pdf"
+    if not storage.exists(name):
+        # Another worker saving the same form concurrently gets a suffixed copy
+        name = storage.save(name, ContentFile(data))
+    return name
+
+
+def render_prefilled_form(fields):
+    """Build and store the prefilled form for one booking's `fields`; returns the storage name"""
+    return store_content_addressed(
+        build_fallback_pdf([line.format(**fields) for line in PREFILLED_LINES])
+    )
+
+
+def _sendfile_header(path):
+    """(header, value) offloading `path` to the front-end server, or None"""
+    header = getattr(settings, 'SENDFILE_HEADER', None)
+    if header == 'X-Sendfile':
+        return header, path
+    if header == 'X-Accel-Redirect':
+        # nginx serves an `internal` location mapped onto SENDFILE_ROOT
+        root = os.path.abspath(settings.SENDFILE_ROOT)
+        relative = os.path.relpath(os.path.abspath(path), root)
+        if relative.startswith('..'):
+            return None
+        return header, settings.SENDFILE_URL_PREFIX.rstrip('/') + '/' + relative.replace(os.sep, '/')
+    return None
+
+
+def _requested_range(request, size, etag, mtime):
+    """(start, end) inclusive for a satisfiable single Range, 'invalid', or None for the full file"""
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        # The client's copy is stale; send the whole file instead of a piece of it
+        date = parse_http_date_safe(if_range)
+        if (date is None and etag not in parse_etags(if_range)) or (date is not None and date != mtime):
+            return None
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Multiple ranges and other units are allowed to be ignored
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or (last and int(last) < start):
+            return 'invalid'
+    else:
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            return 'invalid'
+    return start, end
+
+
+class _FileRange:
+    """File-like view of bytes start..end of an open file"""
+
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self.file = f
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_response(request, path, filename, content_type='application/pdf', as_attachment=True, private=False):
+    """
+    Serve a file from disk with ETag/Last-Modified, 304s and single byte ranges.
+
+    Set SENDFILE_HEADER to 'X-Sendfile' (Apache, lighttpd) or
+    'X-Accel-Redirect' (nginx, with SENDFILE_ROOT and SENDFILE_URL_PREFIX)
+    to let the front-end server send the bytes. Per-user files are sent
+    with `private` so shared caches do not keep them.
+    """
+    stat = os.stat(path)
+    size, mtime = stat.st_size, int(stat.st_mtime)
+    etag = f'"{size:x}-{mtime:x}"'
+
+    offload = _sendfile_header(path)
+    if not_modified(request, etag, mtime):
+        response = HttpResponseNotModified()
+    elif offload:
+        # The front-end server handles ranges itself
+        response = HttpResponse(content_type=content_type)
+        response[offload[0]] = offload[1]
+    else:
+        requested = _requested_range(request, size, etag, mtime)
+        if requested == 'invalid':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        f = open(path, 'rb')
+        if requested is None:
+            response = FileResponse(f, content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = requested
+            response = FileResponse(_FileRange(f, start, end), content_type=content_type, status=206)
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+
+    if response.status_code != 304:
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = f"{'private' if private else 'public'}, max-age={DOCUMENT_MAX_AGE}"
+    return response
@@ -0,0 +1,242 @@
+"""
+Outbound email rendering and queue.
+
+Every email is a pair of templates, emails/<name>.txt and emails/<name>.html,
+rendered by build_email(). The HTML templates extend emails/base.html and
+are loaded through lessons.template_loaders.EmailLoader, so the shared
+stylesheet is inlined once per process rather than per message.
+
+Views hand the built messages to queue_email()/queue_emails() instead of
+calling send(), so no request waits on an SMTP handshake. The
+send_queued_emails worker drains the OutboundEmail table in batches, each
+delivered with one send_messages() call over a connection the worker keeps
+open between batches, and retries failures with exponential backoff.
+"""
+import base64
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Messages claimed and sent per send_messages() call
+BATCH_SIZE = 50
+
+# Delivery attempts before a message is marked as failed
+MAX_ATTEMPTS = 5
+
+# Delay before the first retry; doubled after every failed attempt
+RETRY_BACKOFF_SECONDS = 60
+
+# How long a worker owns the messages it picked up before another worker
+# may take them over
+CLAIM_SECONDS = 300
+
+# Every email the site sends, as emails/<name>.txt + emails/<name>.html
+EMAIL_TEMPLATES = [
+    'booking_confirmation',
+    'booking_cancellation',
+    'booking_reminder',
+    'paypal_confirmation',
+    'contact',
+    'contact_confirmation',
+    'registration',
+    'terms_confirmation',
+]
+
+
+def warm_email_templates():
+    """Compile (and inline the CSS of) every email template ahead of the first send"""
+    for name in EMAIL_TEMPLATES:
+        get_template(f'emails/{name}.txt')
+        get_template(f'emails/{name}.html')
+
+
+def render_email(name, context):
+    """Render the text and HTML bodies of an email; returns (text, html)"""
+    text = get_template(f'emails/{name}.txt').render(context)
+    html = get_template(f'emails/{name}.html').render(context)
+    return text.strip() + '\n', html
+
+
+def build_email(name, subject, recipients, context, from_email=None):
+    """Build the EmailMultiAlternatives for one of EMAIL_TEMPLATES"""
+    text, html = render_email(name, context)
+    email = EmailMultiAlternatives(
+        subject,
+        text,
+        from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients
+    )
+    email.attach_alternative(html, "text/html")
+    return email
+
+
+def _to_outbound(message, now):
+    html_body = ''
+    for content, mimetype in getattr(message, 'alternatives', []):
+        if mimetype == 'text/html':
+            html_body = content
+
+    attachments = []
+    for filename, content, mimetype in message.attachments:
+        if isinstance(content, str):
+            content = content.encode()
+        attachments.append([filename, base64.b64encode(content).decode('ascii'), mimetype])
+
+    return OutboundEmail(
+        subject=message.subject,
+        body=message.body,
+        html_body=html_body,
+        from_email=message.from_email or '',
+        to=list(message.to),
+        attachments=attachments,
+        next_attempt_at=now,
+    )
+
+
+def queue_emails(messages):
+    """
+    Store several EmailMessages in the outbox with one INSERT.
+
+    Messages produced by one request share next_attempt_at, so a worker
+    claims them together and delivers them in a single send_messages()
+    call.
+    """
+    now = timezone.now()
+    return OutboundEmail.objects.bulk_create([_to_outbound(message, now) for message in messages])
+
+
+def queue_email(message):
+    """Store an EmailMessage in the outbox and return the OutboundEmail"""
+    return queue_emails([message])[0]
+
+
+def build_message(outbound, connection=None):
+    """Rebuild the EmailMultiAlternatives stored in an OutboundEmail"""
+    message = EmailMultiAlternatives(
+        outbound.subject,
+        outbound.body,
+        outbound.from_email or None,
+        outbound.to,
+        connection=connection
+    )
+    if outbound.html_body:
+        message.attach_alternative(outbound.html_body, "text/html")
+    for filename, content, mimetype in outbound.attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def claim_batch(batch_size=BATCH_SIZE, now=None):
+    """
+    Pick up to `batch_size` due messages for this worker.
+
+    Claiming pushes next_attempt_at forward by CLAIM_SECONDS with a
+    conditional update, so concurrent workers never send the same message
+    and messages of a crashed worker become due again on their own.
+    """
+    now = now or timezone.now()
+    candidates = list(OutboundEmail.objects.filter(
+        status='pending',
+        next_attempt_at__lte=now
+    ).order_by('next_attempt_at', 'pk')[:batch_size])
+
+    claimed = []
+    for outbound in candidates:
+        lease = now + timedelta(seconds=CLAIM_SECONDS)
+        updated = OutboundEmail.objects.filter(
+            pk=outbound.pk,
+            status='pending',
+            next_attempt_at=outbound.next_attempt_at
+        ).update(next_attempt_at=lease)
+        if updated:
+            outbound.next_attempt_at = lease
+            claimed.append(outbound)
+    return claimed
+
+
+def _record_failure(outbound, error):
+    outbound.attempts += 1
+    outbound.last_error = str(error)
+    if outbound.attempts >= MAX_ATTEMPTS:
+        outbound.status = 'failed'
+        logger.error(f"Giving up on email {outbound.pk} after {outbound.attempts} attempts: {error}")
+    else:
+        delay = RETRY_BACKOFF_SECONDS * (2 ** (outbound.attempts - 1))
+        outbound.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        logger.warning(f"Email {outbound.pk} failed, retrying in {delay}s: {error}")
+    outbound.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+_worker_connection = None
+
+
+def get_worker_connection():
+    """
+    Return this process's pooled mail connection.
+
+    The same connection is reused for every batch a worker sends. One that
+    sat idle for longer than EMAIL_POOL_IDLE_SECONDS is closed first, since
+    most servers drop idle sessions anyway.
+    """
+    global _worker_connection
+    if _worker_connection is None:
+        _worker_connection = get_connection(collect_errors=True)
+
+    idle_seconds = getattr(_worker_connection, 'idle_seconds', lambda: None)()
+    if idle_seconds is not None and idle_seconds > getattr(settings, 'EMAIL_POOL_IDLE_SECONDS', 60):
+        _worker_connection.close()
+    return _worker_connection
+
+
+def close_worker_connection():
+    """Close the pooled connection, e.g. when the worker exits"""
+    global _worker_connection
+    if _worker_connection is not None:
+        _worker_connection.close()
+        _worker_connection = None
+
+
+def send_batch(batch_size=BATCH_SIZE, connection=None):
+    """
+    Send one batch of due messages with a single send_messages() call.
+
+    Uses the worker's pooled connection unless one is given and leaves it
+    open for the next batch. Returns (sent, failed).
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    connection = connection or get_worker_connection()
+    messages = [build_message(outbound, connection) for outbound in batch]
+    try:
+        connection.open()
+        connection.send_messages(messages)
+        errors = getattr(connection, 'errors', {})
+    except Exception as e:
+        errors = {index: e for index in range(len(batch))}
+        connection.close()
+
+    now = timezone.now()
+    sent = failed = 0
+    for index, outbound in enumerate(batch):
+        if index in errors:
+            failed += 1
+            _record_failure(outbound, errors[index])
+            continue
+
+        sent += 1
+        outbound.status = 'sent'
+        outbound.attempts += 1
+        outbound.sent_at = now
+        outbound.last_error = ''
+        outbound.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+    return sent, failed
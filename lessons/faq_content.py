@@ -0,0 +1,143 @@
+"""
+The questions answered on the FAQ page.
+
+They used to be written out in faq.html. Keeping them here lets the page,
+the search index (search.py) and the similar-question suggester share
+one copy. Each entry gets a stable anchor on the page, faq-<slug>.
+"""
+from django.utils.text import slugify
+
+# (section title, [(question, answer), ...]) in page order
+FAQ_SECTIONS = [
+    ('General Questions', [
+        (
+            'What should I bring to my first lesson?',
+            'For your first lesson, you only need to bring yourself and comfortable clothing '
+            '(avoid low-cut tops). We provide all firearms, ammunition, eye and ear '
+            'protection, and any other necessary equipment.'
+        ),
+        (
+            'Is prior experience required?',
+            'No prior experience is necessary. Our beginner courses are designed specifically '
+            'for first-time shooters. We start with the absolute basics in a comfortable, '
+            'judgment-free environment.'
+        ),
+        (
+            'What is the minimum age for training?',
+            'We accept students aged 12 and older for our training programs. Minors must be '
+            'accompanied by a parent or legal guardian who will also participate in the '
+            'training session.'
+        ),
+        (
+            'Are your instructors certified?',
+            'Yes, all our instructors are NRA-certified and have extensive experience in '
+            'firearms training. They undergo regular training to stay current with the latest '
+            'safety protocols and teaching methods.'
+        ),
+        (
+            'What types of firearms do you use for training?',
+            'We primarily use 9mm handguns for beginner training as they offer a good balance '
+            'of control and manageable recoil. As students progress, we introduce other '
+            'firearms including revolvers, rifles, and shotguns based on individual '
+            'interests.'
+        ),
+    ]),
+    ('Safety & Procedures', [
+        (
+            'What safety measures do you have in place?',
+            'Safety is our top priority. We maintain strict protocols including: 1:1 '
+            'instructor supervision, unloaded firearms until ready to shoot, clearly marked '
+            'safe zones, and comprehensive safety briefings before every session.'
+        ),
+        (
+            'Can I bring my own firearm?',
+            'Yes, after completing at least one beginner session with our equipment. All '
+            'personal firearms must be unloaded and cased when arriving, and will be '
+            'inspected by our staff before use.'
+        ),
+        (
+            "What if I'm nervous about handling a gun?",
+            "It's completely normal to feel nervous. Our instructors are specially trained to "
+            'help first-timers overcome anxiety. We start with unloaded firearms and progress '
+            'at your comfort level.'
+        ),
+        (
+            'Do you offer training for people with disabilities?',
+            'Yes, our facility is wheelchair accessible and our instructors have experience '
+            'adapting training methods for various physical abilities. Please contact us in '
+            'advance so we can best accommodate your needs.'
+        ),
+    ]),
+    ('Booking & Payments', [
+        (
+            'How do I book a lesson?',
+            'You can book lessons online through our website, by phone, or in person at our '
+            'facility. We recommend booking at least 48 hours in advance.'
+        ),
+        (
+            'What is your cancellation policy?',
+            'We require 24 hours notice for cancellations to receive a full refund. Late '
+            'cancellations may be charged 50% of the lesson fee. No-shows will be charged the '
+            'full amount.'
+        ),
+        (
+            'Do you offer gift certificates?',
+            'Yes, we offer gift certificates that can be purchased for any amount or specific '
+            'package. They make excellent gifts for birthdays, holidays, or special '
+            'occasions.'
+        ),
+        (
+            'Are there any discounts available?',
+            'We offer 10% discounts for military, law enforcement, and first responders. We '
+            'also have package deals that provide savings when booking multiple sessions at '
+            'once.'
+        ),
+        (
+            'What payment methods do you accept?',
+            'We accept all major credit cards, debit cards, cash, and Venmo. Payment is '
+            'required at time of booking to secure your appointment.'
+        ),
+    ]),
+    ('After Training', [
+        (
+            'Will I receive any certification?',
+            "Yes, upon completing any of our courses you'll receive a certificate of "
+            'completion. For those interested in concealed carry permits, we offer '
+            'state-approved certification courses.'
+        ),
+        (
+            'How often should I take refresher courses?',
+            'We recommend at least one refresher session every 6 months to maintain skills. '
+            'Many students choose to train monthly to continually improve their proficiency.'
+        ),
+        (
+            'Can I purchase a firearm after training?',
+            "While we don't sell firearms, we can provide guidance on purchasing your first "
+            'firearm and connect you with reputable dealers in the area.'
+        ),
+    ]),
+]
+
+
+def faq_sections():
+    """FAQ_SECTIONS as dicts for the template, each entry with its anchor"""
+    return [
+        {
+            'title': title,
+            'entries': [
+                {
+                    'section': title,
+                    'question': question,
+                    'answer': answer,
+                    'anchor': f"faq-{slugify(question)}",
+                }
+                for question, answer in items
+            ],
+        }
+        for title, items in FAQ_SECTIONS
+    ]
+
+
+def faq_entries():
+    """Every static FAQ, in page order"""
+    return [entry for section in faq_sections() for entry in section['entries']]
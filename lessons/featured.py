@@ -0,0 +1,84 @@
+"""
+Random package picks for the home page and the package detail page.
+
+order_by('?') made the database number and sort every active package on
+each hit. Instead the active package ids, with their weights, come from
+the catalog cache, the pick is made in Python and only the chosen rows
+are fetched, by primary key.
+
+Weights default to uniform. Point FEATURED_PACKAGE_WEIGHTS at a function
+taking a list of package ids and returning {id: weight} to change that,
+e.g. 'lessons.featured.recent_booking_weights'.
+"""
+from datetime import timedelta
+import heapq
+import random
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .catalog import catalog_entry, get_catalog_list
+from .models import Booking, TrainingPackage
+
+# Packages shown in the featured / related blocks
+FEATURED_COUNT = 3
+
+# Weights may depend on bookings, which do not invalidate the catalog,
+# so they are recomputed at least this often
+WEIGHTS_CACHE_SECONDS = 15 * 60
+
+# Bookings counted by recent_booking_weights
+RECENT_BOOKING_DAYS = 30
+
+
+def uniform_weights(package_ids):
+    """Every package equally likely"""
+    return {pk: 1 for pk in package_ids}
+
+
+def recent_booking_weights(package_ids):
+    """Favour packages booked often in the last RECENT_BOOKING_DAYS days"""
+    since = timezone.now() - timedelta(days=RECENT_BOOKING_DAYS)
+    counts = dict(Booking.objects.filter(
+        package_id__in=package_ids,
+        created_at__gte=since
+    ).values_list('package').annotate(Count('id')).order_by())
+    # Never-booked packages keep a chance of being shown
+    return {pk: 1 + counts.get(pk, 0) for pk in package_ids}
+
+
+def get_weight_function():
+    path = getattr(settings, 'FEATURED_PACKAGE_WEIGHTS', None)
+    return import_string(path) if path else uniform_weights
+
+
+@catalog_entry('package_weights', TrainingPackage, timeout=WEIGHTS_CACHE_SECONDS)
+def _package_weights():
+    package_ids = list(
+        TrainingPackage.objects.filter(is_active=True).order_by().values_list('pk', flat=True)
+    )
+    return get_weight_function()(package_ids)
+
+
+def weighted_sample(weights, count):
+    """Pick up to `count` distinct keys with probability proportional to their weight"""
+    # Efraimidis-Spirakis: give each key random() ** (1 / weight), keep the largest
+    keyed = (
+        (random.random() ** (1 / weight), pk)
+        for pk, weight in weights.items()
+        if weight > 0
+    )
+    return [pk for key, pk in heapq.nlargest(count, keyed)]
+
+
+def select_featured_packages(count=FEATURED_COUNT, exclude=None):
+    """Return `count` randomly chosen active packages, optionally excluding one id"""
+    weights = get_catalog_list('package_weights')
+    if exclude is not None:
+        weights = {pk: weight for pk, weight in weights.items() if pk != exclude}
+
+    chosen = weighted_sample(weights, count)
+    packages = TrainingPackage.objects.order_by().in_bulk(chosen)
+    return [packages[pk] for pk in chosen if pk in packages]
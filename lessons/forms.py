@@ -4,6 +4,8 @@ from django.core.validators import validate_email
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from datetime import time as dt_time
+from django.forms.models import ModelChoiceIterator
+from .catalog import get_catalog_list
 from .models import (
     FAQComment, Booking, TrainingPackage, Weapon,
     Testimonial, Instructor, RangeLocation, Availability
@@ -28,22 +30,72 @@ class FAQCommentForm(forms.ModelForm):
             raise ValidationError(_("Comment must be at least 5 characters"))
         return content
 
+class CatalogChoiceIterator(ModelChoiceIterator):
+    """Build choices from the cached catalog list instead of the queryset"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.catalog_items():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.catalog_items()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.catalog_items())
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField over one of the cached catalog lists.
+
+    Rendering and validating the field read the list from lessons.catalog,
+    so neither runs a query; `queryset` is kept only for code that expects
+    a ModelChoiceField to have one.
+    """
+    iterator = CatalogChoiceIterator
+
+    def __init__(self, catalog, queryset, **kwargs):
+        self.catalog = catalog
+        super().__init__(queryset=queryset, **kwargs)
+
+    def catalog_items(self):
+        return get_catalog_list(self.catalog)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        for obj in self.catalog_items():
+            if str(obj.pk) == str(value):
+                return obj
+        raise ValidationError(
+            self.error_messages['invalid_choice'],
+            code='invalid_choice',
+            params={'value': value},
+        )
+
 class BookingForm(forms.ModelForm):
-    package = forms.ModelChoiceField(
+    package = CatalogChoiceField(
+        'packages',
         queryset=TrainingPackage.objects.filter(is_active=True),
         widget=forms.RadioSelect(),
         required=True,
         empty_label=None
     )
     
-    weapon = forms.ModelChoiceField(
+    weapon = CatalogChoiceField(
+        'weapons',
         queryset=Weapon.objects.filter(is_active=True),
         widget=forms.RadioSelect(),
         required=False,
         empty_label=None
     )
     
-    instructor = forms.ModelChoiceField(
+    instructor = CatalogChoiceField(
+        'instructors',
         queryset=Instructor.objects.filter(is_active=True),
         widget=forms.Select(attrs={
             'class': 'form-control',
@@ -52,7 +104,8 @@ class BookingForm(forms.ModelForm):
         required=True
     )
     
-    location = forms.ModelChoiceField(
+    location = CatalogChoiceField(
+        'locations',
         queryset=RangeLocation.objects.filter(is_active=True),
         widget=forms.RadioSelect(),
         required=False,
@@ -117,11 +170,12 @@ class BookingForm(forms.ModelForm):
         
         self.fields['time'].choices = self.get_initial_time_choices()
         
+        packages = self.fields['package'].catalog_items()
         if 'package' in self.initial:
             package = self.initial['package']
             self.fields['duration'].initial = package.duration
-        elif self.fields['package'].queryset.exists():
-            self.fields['duration'].initial = self.fields['package'].queryset.first().duration
+        elif packages:
+            self.fields['duration'].initial = packages[0].duration
 
     def get_initial_time_choices(self):
         return [
@@ -138,9 +192,19 @@ class BookingForm(forms.ModelForm):
     def clean(self):
         cleaned_data = super().clean()
         package = cleaned_data.get('package')
+        instructor = cleaned_data.get('instructor')
+        date = cleaned_data.get('date')
+        time = cleaned_data.get('time')
         
         if package and not cleaned_data.get('duration'):
             cleaned_data['duration'] = package.duration
+        
+        if instructor and date and time:
+            schedule = instructor.schedule
+            if not schedule.works_weekday(date):
+                self.add_error('date', _("The selected instructor does not work on this day."))
+            elif not schedule.within_hours(dt_time.fromisoformat(time)):
+                self.add_error('time', _("The selected time is outside the instructor's working hours."))
             
         return cleaned_data
 
@@ -165,7 +229,8 @@ class BookingForm(forms.ModelForm):
         return time
 
 class QuickBookingForm(forms.Form):
-    package = forms.ModelChoiceField(
+    package = CatalogChoiceField(
+        'packages',
         queryset=TrainingPackage.objects.filter(is_active=True),
         widget=forms.Select(attrs={
             'class': 'form-control'
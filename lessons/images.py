@@ -0,0 +1,148 @@
+"""
+Resized copies of uploaded package, weapon, instructor and location images.
+
+Uploads used to be sent at their original size wherever they appeared.
+When one is saved, generate_derivatives() writes WebP and JPEG copies at
+IMAGE_WIDTHS next to it (packages/range.jpg -> packages/range.640w.webp,
+packages/range.640w.jpg, ...) plus a small JSON file listing them, which
+the {% responsive_image %} tag turns into srcset/sizes with width and
+height attributes. `manage.py build_image_derivatives` does the same for
+images uploaded before this existed.
+
+This module does not import the models, so process pool workers can load
+it before Django is set up.
+"""
+from io import BytesIO
+import json
+import logging
+import os
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Model label -> image field resized on upload
+IMAGE_FIELDS = {
+    'lessons.TrainingPackage': 'image',
+    'lessons.Weapon': 'image',
+    'lessons.Instructor': 'profile_picture',
+    'lessons.RangeLocation': 'image',
+}
+
+# Widths generated, capped at the width of the upload
+IMAGE_WIDTHS = (320, 640, 960, 1280)
+
+# (file extension, Pillow format, save options), in order of preference
+IMAGE_FORMATS = [
+    ('webp', 'WEBP', {'quality': 80}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+
+# How long a lookup of an image without derivatives is remembered
+MISSING_CACHE_SECONDS = 60
+
+
+def derivative_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f"{root}.{width}w.{extension}"
+
+
+def manifest_name(name):
+    root, _ = os.path.splitext(name)
+    return f"{root}.sizes.json"
+
+
+def _cache_key(name):
+    return f"image-derivatives:{name}"
+
+
+def _save(storage, name, content):
+    # Keep the predictable name instead of getting a random suffix
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def _encode(image, image_format, options):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten transparent areas onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, storage=None):
+    """
+    Write every derivative of the stored image `name` and return its manifest.
+
+    Returns None when the file is missing or not an image.
+    """
+    storage = storage or default_storage
+    try:
+        with storage.open(name) as f:
+            image = Image.open(f)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read image {name}: {str(e)}")
+        return None
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+    width, height = image.size
+    sizes = []
+    for target in sorted({min(w, width) for w in IMAGE_WIDTHS}):
+        target_height = max(1, round(height * target / width))
+        resized = image if target == width else image.resize((target, target_height), Image.LANCZOS)
+        for extension, image_format, options in IMAGE_FORMATS:
+            _save(storage, derivative_name(name, target, extension), _encode(resized, image_format, options))
+        sizes.append([target, target_height])
+
+    manifest = {
+        'width': width,
+        'height': height,
+        'sizes': sizes,
+        'formats': [extension for extension, image_format, options in IMAGE_FORMATS],
+    }
+    _save(storage, manifest_name(name), json.dumps(manifest).encode())
+    cache.delete(_cache_key(name))
+    return manifest
+
+
+def get_derivatives(name, storage=None):
+    """Manifest written by generate_derivatives(), or None if there is none yet"""
+    key = _cache_key(name)
+    manifest = cache.get(key)
+    if manifest is None:
+        storage = storage or default_storage
+        try:
+            with storage.open(manifest_name(name)) as f:
+                manifest = json.loads(f.read())
+        except (OSError, ValueError):
+            manifest = {}
+        cache.set(key, manifest, None if manifest else MISSING_CACHE_SECONDS)
+    return manifest or None
+
+
+def smallest_derivative_url(name, extension='jpg', storage=None):
+    """URL of the smallest derivative, falling back to the original"""
+    storage = storage or default_storage
+    manifest = get_derivatives(name, storage)
+    if not manifest:
+        return storage.url(name)
+    return storage.url(derivative_name(name, manifest['sizes'][0][0], extension))
+
+
+def image_names(model, field):
+    """Distinct non-empty file names stored in `field` of `model`"""
+    return list(
+        model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+        .order_by().values_list(field, flat=True).distinct()
+    )
@@ -0,0 +1,107 @@
+"""
+SMTP backend used by the outbound email worker.
+
+Django's SMTP backend has a single timeout and stops at the first message
+that fails, leaving the caller unable to tell which messages of a batch
+went out. PooledEmailBackend sends a whole batch over one connection
+(and, when the caller opens it first, keeps it for the next batch),
+bounds connecting and sending with separate timeouts, and records
+failures per message in `errors`.
+"""
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+
+class PooledEmailBackend(EmailBackend):
+    """SMTP backend with connect/send timeouts and per-message error reporting"""
+
+    def __init__(self, connect_timeout=None, send_timeout=None, collect_errors=False, **kwargs):
+        super().__init__(**kwargs)
+        self.collect_errors = collect_errors
+        self.connect_timeout = (
+            connect_timeout if connect_timeout is not None
+            else getattr(settings, 'EMAIL_CONNECT_TIMEOUT', 10)
+        )
+        self.send_timeout = (
+            send_timeout if send_timeout is not None
+            else getattr(settings, 'EMAIL_SEND_TIMEOUT', 30)
+        )
+        # Position in the last send_messages() call -> exception
+        self.errors = {}
+        self.last_used = None
+
+    def open(self):
+        # Connecting, STARTTLS and login are bounded by the connect timeout;
+        # every command after that by the send timeout
+        self.timeout = self.connect_timeout
+        opened = super().open()
+        if opened:
+            self.connection.sock.settimeout(self.send_timeout)
+            self.last_used = time.monotonic()
+        return opened
+
+    def idle_seconds(self):
+        """Seconds since the connection was last used, or None if closed"""
+        if self.connection is None or self.last_used is None:
+            return None
+        return time.monotonic() - self.last_used
+
+    def send_messages(self, email_messages):
+        """
+        Send every message over one connection and return how many went out.
+
+        A failing message does not stop the rest: its exception is stored in
+        self.errors under its position. If the server drops the connection,
+        it is reopened once for the remaining messages. Unless the backend
+        was created with collect_errors=True (or fail_silently), the first
+        error is raised once every message has been tried.
+        """
+        self.errors = {}
+        if not email_messages:
+            return 0
+        with self._lock:
+            try:
+                new_conn_created = self.open()
+            except OSError as e:
+                if not self.collect_errors:
+                    raise
+                self.errors = {index: e for index in range(len(email_messages))}
+                return 0
+            if not self.connection or new_conn_created is None:
+                return 0
+
+            num_sent = 0
+            try:
+                for index, message in enumerate(email_messages):
+                    try:
+                        if self._send(message):
+                            num_sent += 1
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                        # The server rejected this message; the session is still usable
+                        self.errors[index] = e
+                    except OSError as e:
+                        # Timeouts and dropped connections: start a fresh session
+                        self.errors[index] = e
+                        self.close()
+                        try:
+                            self.open()
+                        except OSError:
+                            for remaining in range(index + 1, len(email_messages)):
+                                self.errors[remaining] = e
+                            break
+                    except Exception as e:
+                        self.errors[index] = e
+                self.last_used = time.monotonic()
+            finally:
+                # Like Django's backend, only close a connection opened here;
+                # callers that open() first keep it for the next batch
+                if new_conn_created:
+                    self.close()
+
+            # Callers that do not read self.errors get Django's usual exception
+            if self.errors and not (self.fail_silently or self.collect_errors):
+                raise next(iter(self.errors.values()))
+        return num_sent
@@ -0,0 +1,89 @@
+from datetime import date, time as dt_time
+from decimal import Decimal
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+from django.utils import timezone
+
+from lessons.emails import EMAIL_TEMPLATES, render_email
+from lessons.models import Booking, Instructor, RangeLocation, TrainingPackage
+from lessons.template_loaders import load_stylesheet
+
+
+def sample_context():
+    """Unsaved objects covering every variable the email templates use"""
+    user = User(username='sample', first_name='Sam', last_name='Shooter', email='sam@example.com')
+    booking = Booking(
+        user=user,
+        package=TrainingPackage(name='Basic Pistol', price=Decimal('100.00'), duration=60),
+        instructor=Instructor(user=User(username='coach', first_name='Alex', last_name='Coach')),
+        location=RangeLocation(name='Main Range'),
+        date=date(2026, 1, 5),
+        time=dt_time(10, 30),
+        duration=60,
+        payment_method='cash',
+        status='confirmed',
+    )
+    return {
+        'booking': booking,
+        'user': user,
+        'user_email': user.email,
+        'customer_name': user.get_full_name(),
+        'form_data': {
+            'name': 'Sam Shooter',
+            'email': 'sam@example.com',
+            'phone': '555-0100',
+            'message': 'Do you rent ear protection?',
+        },
+        'packages_url': 'http://localhost:8000/packages',
+        'download_url': 'http://localhost:8000/legal/download-form/',
+        'timestamp': timezone.now(),
+        'has_pdf_attachment': True,
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare per-message email render cost with and without the cached, pre-inlined templates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=500,
+            help='Messages rendered per template and strategy'
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        context = sample_context()
+
+        # Without caching every message re-reads, re-inlines and recompiles
+        # its templates, which is what inlining CSS per send costs
+        uncached = Engine(loaders=[
+            'lessons.template_loaders.EmailLoader',
+            'django.template.loaders.app_directories.Loader',
+        ])
+
+        def render_uncached(name):
+            load_stylesheet.cache_clear()
+            uncached.get_template(f'emails/{name}.txt').render(Context(context))
+            uncached.get_template(f'emails/{name}.html').render(Context(context))
+
+        self.stdout.write(f"{'template':<24}{'per-send (us)':>16}{'cached (us)':>16}{'speedup':>10}")
+        for name in EMAIL_TEMPLATES:
+            per_send = self.measure(lambda: render_uncached(name), count)
+            cached = self.measure(lambda: render_email(name, context), count)
+            self.stdout.write(
+                f"{name:<24}{per_send:>16.1f}{cached:>16.1f}{per_send / cached:>9.1f}x"
+            )
+
+    def measure(self, render, count):
+        """Average microseconds per call after one warm-up call"""
+        render()
+        start = time.perf_counter()
+        for _ in range(count):
+            render()
+        return (time.perf_counter() - start) / count * 1e6
+
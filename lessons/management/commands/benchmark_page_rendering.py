@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+# Public pages; gallery keeps its own layout and serves as a baseline
+PAGES = [
+    'lessons/home.html',
+    'lessons/packages.html',
+    'lessons/about.html',
+    'lessons/faq.html',
+    'lessons/legal.html',
+    'lessons/privacy.html',
+    'lessons/contact.html',
+    'lessons/gallery.html',
+    'booking/booking.html',
+]
+
+
+class Command(BaseCommand):
+    help = "Report the HTML size and render time of the pages built on the site layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=200,
+            help='Renders per page'
+        )
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+
+        self.stdout.write(f"{'page':<28}{'bytes':>10}{'render (us)':>14}")
+        for name in PAGES:
+            template = get_template(name)
+            html = template.render({}, request)
+            start = time.perf_counter()
+            for _ in range(options['count']):
+                template.render({}, request)
+            elapsed = (time.perf_counter() - start) / options['count'] * 1e6
+            self.stdout.write(f"{name:<28}{len(html.encode()):>10}{elapsed:>14.1f}")
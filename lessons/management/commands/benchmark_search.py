@@ -0,0 +1,88 @@
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from lessons.search import (
+    FTSIndex, InvertedIndex, Document, create_fts_table, fts5_available, query_terms
+)
+
+# Vocabulary of the synthetic documents, roughly the site's own
+WORDS = (
+    "pistol rifle shotgun revolver safety lesson beginner advanced instructor range "
+    "booking package training certified holster ammunition target grip stance sight "
+    "recoil trigger cleaning license concealed carry refund cancel schedule private "
+    "group women youth accessible parking question answer price discount gift card "
+    "weekend morning evening equipment protection ear eye brass caliber nine mm"
+).split()
+
+QUERIES = ['safety', 'pis', 'beginner pistol', 'conc carry', 'instructor cert', 'refund canc', 'gift', 'eye prot']
+
+
+def vocabulary(size, rng):
+    """
+    Made-up words with the site's words from rank 50 on, so they are as
+    common as topic words, not as common as "the"
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    made_up = sorted({''.join(rng.choices(letters, k=rng.randint(2, 9))) for _ in range(size)} - set(WORDS))
+    rng.shuffle(made_up)
+    return made_up[:50] + WORDS + made_up[50:size - len(WORDS)]
+
+
+def synthetic_documents(count, seed=1, vocabulary_size=30000):
+    rng = random.Random(seed)
+    words = vocabulary(vocabulary_size, rng)
+    # Word frequencies fall off with rank as in natural text
+    weights = list(itertools.accumulate(1 / (rank + 1) ** 1.07 for rank in range(len(words))))
+    for pk in range(1, count + 1):
+        title = ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(0, 6)))
+        body = ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(10, 60)))
+        yield Document('comment', pk, title, body, f'/faq/#comment-{pk}')
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Report search latency (p50/p95) of both index backends on synthetic documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=100000, help='Synthetic documents indexed')
+        parser.add_argument('--rounds', type=int, default=50, help='Times each query is run')
+
+    def measure(self, name, index):
+        samples = []
+        for _ in range(self.rounds):
+            for query in QUERIES:
+                start = time.perf_counter()
+                index.search(query_terms(query), 10)
+                samples.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{name:<12}p50 {percentile(samples, 0.5):7.2f} ms   p95 {percentile(samples, 0.95):7.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        self.rounds = options['rounds']
+        count = options['documents']
+
+        start = time.perf_counter()
+        index = InvertedIndex(synthetic_documents(count))
+        self.stdout.write(f"Built the in-process index of {count} documents in {time.perf_counter() - start:.1f} s")
+        self.measure('in-process', index)
+
+        if not fts5_available():
+            self.stdout.write("FTS5 is not available on this database; skipped")
+            return
+        # A scratch table, rolled back with everything else
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                create_fts_table(cursor, 'lessons_search_benchmark')
+            index = FTSIndex('lessons_search_benchmark')
+            index.insert(list(synthetic_documents(count)))
+            self.measure('FTS5', index)
+            transaction.set_rollback(True)
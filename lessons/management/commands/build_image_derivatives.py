@@ -0,0 +1,47 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from lessons.images import IMAGE_FIELDS, generate_derivatives, get_derivatives, image_names
+
+
+class Command(BaseCommand):
+    help = "Create the resized WebP/JPEG copies of uploaded images that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes resizing images in parallel (1 resizes in this process)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate copies that already exist'
+        )
+
+    def handle(self, *args, **options):
+        names = []
+        for label, field in IMAGE_FIELDS.items():
+            names += image_names(apps.get_model(label), field)
+        if not options['force']:
+            names = [name for name in names if get_derivatives(name) is None]
+
+        if options['workers'] > 1 and len(names) > 1:
+            # Workers only read and write files; they set Django up again in
+            # case the platform starts them fresh instead of forking
+            with ProcessPoolExecutor(options['workers'], initializer=django.setup) as pool:
+                results = list(pool.map(generate_derivatives, names, chunksize=4))
+        else:
+            results = [generate_derivatives(name) for name in names]
+
+        failed = [name for name, manifest in zip(names, results) if manifest is None]
+        for name in failed:
+            self.stderr.write(f"Could not resize {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Resized {len(names) - len(failed)} of {len(names)} images"
+        ))
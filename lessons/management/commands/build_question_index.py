@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from lessons.suggestions import build_question_index, get_index_dir
+
+
+class Command(BaseCommand):
+    help = "Rebuild the similar-question matrix of the FAQ page from every FAQ and active question"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--if-needed',
+            action='store_true',
+            help='Only rebuild once enough questions were added since the last build (for cron)'
+        )
+
+    def handle(self, *args, **options):
+        count = build_question_index(if_needed=options['if_needed'])
+        if count is None:
+            self.stdout.write("Question index is up to date")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} questions in {get_index_dir()}"))
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from lessons.registration_forms import FORM_BATCH_SIZE, build_registration_forms
+
+
+class Command(BaseCommand):
+    help = "Build prefilled registration forms for confirmed bookings (run every few minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes rendering forms in parallel (1 renders in this process)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=FORM_BATCH_SIZE,
+            help='Bookings loaded and rendered per batch'
+        )
+
+    def handle(self, *args, **options):
+        count = build_registration_forms(workers=options['workers'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Built {count} registration forms"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lessons.services import reap_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Delete expired checkout holds so their slots become bookable again (run every minute)"
+
+    def handle(self, *args, **options):
+        count = reap_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Reaped {count} expired slot holds"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from lessons.search import sync_search_index, use_fts5
+
+
+class Command(BaseCommand):
+    help = "Reindex every FAQ, FAQ comment, training package and testimonial for site search"
+
+    def handle(self, *args, **options):
+        count = sync_search_index(rebuild=True)
+        backend = 'FTS5' if use_fts5() else 'in-process'
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} documents ({backend} index)"))
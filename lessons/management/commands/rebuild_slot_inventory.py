@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from lessons.availability import compute_capacities
+from lessons.models import Instructor, SlotInventory
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed slot inventory and verify it against live bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weeks',
+            type=int,
+            default=getattr(settings, 'SLOT_INVENTORY_WEEKS', 8),
+            help='Number of weeks ahead to precompute'
+        )
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Compare the stored inventory with live data without rebuilding'
+        )
+
+    def handle(self, *args, **options):
+        start_date = timezone.now().date()
+        end_date = start_date + timedelta(weeks=options['weeks']) - timedelta(days=1)
+        instructors = list(Instructor.objects.filter(is_active=True))
+
+        if not options['verify_only']:
+            self.rebuild(instructors, start_date, end_date)
+
+        mismatches = self.verify(instructors, start_date, end_date)
+        if mismatches:
+            for instructor, day in mismatches[:20]:
+                self.stderr.write(f"Stale inventory: {instructor} on {day}")
+            raise CommandError(f"{len(mismatches)} inventory rows do not match live data")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Slot inventory verified for {len(instructors)} instructors "
+            f"from {start_date} to {end_date}"
+        ))
+
+    def rebuild(self, instructors, start_date, end_date):
+        with transaction.atomic():
+            SlotInventory.objects.all().delete()
+            for instructor in instructors:
+                capacities = compute_capacities(instructor, start_date, end_date)
+                SlotInventory.objects.bulk_create([
+                    SlotInventory(instructor=instructor, date=day, capacity=capacity)
+                    for day, capacity in capacities.items()
+                ])
+        self.stdout.write(f"Rebuilt inventory for {len(instructors)} instructors")
+
+    def verify(self, instructors, start_date, end_date):
+        mismatches = []
+        for instructor in instructors:
+            live = compute_capacities(instructor, start_date, end_date)
+            stored = dict(SlotInventory.objects.filter(
+                instructor=instructor,
+                date__range=(start_date, end_date)
+            ).values_list('date', 'capacity'))
+            for day, capacity in live.items():
+                if day in stored and stored[day] != capacity:
+                    mismatches.append((instructor, day))
+        return mismatches
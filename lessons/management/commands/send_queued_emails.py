@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lessons.emails import BATCH_SIZE, close_worker_connection, send_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbound emails in batches over one pooled SMTP connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of messages sent per send_messages() call'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting once it is drained'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait between polls when the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = send_batch(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+
+                if sent or failed:
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            close_worker_connection()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {total_sent} emails, {total_failed} failed"
+        ))
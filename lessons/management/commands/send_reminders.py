@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from lessons.reminders import REMINDER_BATCH_SIZE, REMINDER_WINDOW_HOURS, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = "Queue reminder emails for confirmed lessons starting soon (run every hour)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=REMINDER_WINDOW_HOURS,
+            help='Remind about lessons starting within this many hours'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REMINDER_BATCH_SIZE,
+            help='Bookings loaded and queued per batch'
+        )
+
+    def handle(self, *args, **options):
+        count = send_due_reminders(hours=options['hours'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Queued {count} lesson reminders"))
@@ -0,0 +1,204 @@
+"""
+In-process static file serving for deployments without a front proxy.
+
+StaticFilesMiddleware answers requests under STATIC_URL before sessions,
+CSRF or URL resolution run. Files collected by collectstatic are indexed
+once per process: hashed names (see storage.py) are sent with a one-year
+immutable Cache-Control, other names with a short max-age, and every
+response carries an ETag and Last-Modified so revalidation costs a 304.
+When the client accepts it, the precompressed .br or .gz sibling is sent
+instead of the original.
+
+With DEBUG on, files are looked up in the source directories first, so
+edits show up without running collectstatic; they are revalidated on
+every request rather than cached.
+
+QueryBudgetMiddleware is a development aid: it reports the queries each
+view runs and flags views that go over their budget in query_budgets.py.
+"""
+from functools import lru_cache
+import json
+import mimetypes
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from .query_budgets import check_budget
+from .query_stats import record_queries
+
+# Cache-Control for hashed names, whose contents never change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Unhashed names (favicon.ico, links from outside the templates)
+STATIC_MAX_AGE = 60
+
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+class StaticFile:
+    """One static file and its precompressed variants"""
+
+    def __init__(self, path, immutable):
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.immutable = immutable
+        # encoding ('' for none) -> (path, size, mtime)
+        self.variants = {}
+        for encoding, suffix in [('', '')] + ENCODINGS:
+            try:
+                stat = os.stat(path + suffix)
+            except OSError:
+                continue
+            self.variants[encoding] = (path + suffix, stat.st_size, int(stat.st_mtime))
+
+    def cache_control(self):
+        if self.immutable:
+            return IMMUTABLE_CACHE_CONTROL
+        if settings.DEBUG:
+            return 'no-cache'
+        return f"public, max-age={STATIC_MAX_AGE}"
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts (q > 0)"""
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+@lru_cache(maxsize=None)
+def collected_files(root):
+    """Index STATIC_ROOT once per process: {relative url path: StaticFile}"""
+    hashed = set()
+    manifest = os.path.join(root, 'staticfiles.json')
+    if os.path.exists(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            hashed = set(json.load(f).get('paths', {}).values())
+
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(('.gz', '.br')) or name == 'staticfiles.json':
+                continue
+            path = os.path.join(directory, name)
+            url_path = os.path.relpath(path, root).replace(os.sep, '/')
+            files[url_path] = StaticFile(path, immutable=url_path in hashed)
+    return files
+
+
+def find_static_file(url_path):
+    url_path = posixpath.normpath(url_path).lstrip('/')
+    if url_path.startswith('..'):
+        return None
+    if settings.DEBUG:
+        path = finders.find(url_path)
+        if path:
+            return StaticFile(path, immutable=False)
+    if settings.STATIC_ROOT and os.path.isdir(settings.STATIC_ROOT):
+        return collected_files(str(settings.STATIC_ROOT)).get(url_path)
+    return None
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        return '*' in tags or etag in tags or etag.removeprefix('W/') in [
+            tag.removeprefix('W/') for tag in tags
+        ]
+    modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return modified_since is not None and mtime <= modified_since
+
+
+def serve_static_file(request, static_file):
+    accepted = accepted_encodings(request)
+    encoding = next(
+        (coding for coding, suffix in ENCODINGS
+         if coding in static_file.variants and coding in accepted),
+        ''
+    )
+    path, size, mtime = static_file.variants[encoding]
+    etag = f'"{size:x}-{mtime:x}{"-" + encoding if encoding else ""}"'
+
+    if not_modified(request, etag, mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+        response.headers.pop('Content-Disposition', None)
+        response['Content-Length'] = size
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = static_file.cache_control()
+    if len(static_file.variants) > 1:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class StaticFilesMiddleware:
+    """Serve STATIC_URL from STATIC_ROOT with long-lived caching and precompression"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        prefix = settings.STATIC_URL
+        if (
+            request.method in ('GET', 'HEAD')
+            and prefix.startswith('/')
+            and request.path_info.startswith(prefix)
+        ):
+            static_file = find_static_file(request.path_info[len(prefix):])
+            if static_file is not None:
+                return serve_static_file(request, static_file)
+        return self.get_response(request)
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries of every request and check them against query_budgets.py.
+
+    Adds X-Query-Count, X-Query-Duplicates and X-Query-Time (ms) headers.
+    A view over its budget is logged, or raises QueryBudgetExceeded with
+    QUERY_BUDGET_STRICT on. Enabled by QUERY_BUDGET_ENABLED, which follows
+    DEBUG; in production the middleware removes itself at startup.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as stats:
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        response['X-Query-Count'] = stats.count
+        response['X-Query-Duplicates'] = stats.duplicates
+        response['X-Query-Time'] = f"{stats.duration * 1000:.1f}"
+
+        match = request.resolver_match
+        # The admin is staff-only and has no budgets
+        if match is not None and match.url_name and 'admin' not in match.namespaces:
+            check_budget(match.url_name, stats, elapsed)
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 03:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0010_paypaltransaction_booking_paypal_txn_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('capacity', models.JSONField(default=list, help_text='Longest lesson in minutes that can start at each time slot (0 = taken)', verbose_name='Slot Capacity')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('instructor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_inventory', to='lessons.instructor')),
+            ],
+            options={
+                'verbose_name': 'Slot Inventory',
+                'verbose_name_plural': 'Slot Inventory',
+                'ordering': ['date'],
+                'unique_together': {('instructor', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-17 03:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0011_slotinventory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('time', models.TimeField(verbose_name='Time')),
+                ('duration', models.PositiveIntegerField(verbose_name='Duration (minutes)')),
+                ('expires_at', models.DateTimeField(verbose_name='Expires At')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('instructor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='lessons.instructor')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Slot Hold',
+                'verbose_name_plural': 'Slot Holds',
+                'ordering': ['expires_at'],
+                'indexes': [models.Index(fields=['instructor', 'date'], name='lessons_slo_instruc_8cace1_idx'), models.Index(fields=['expires_at'], name='lessons_slo_expires_dad339_idx')],
+            },
+        ),
+    ]
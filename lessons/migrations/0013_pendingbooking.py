@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-17 03:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0012_slothold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingBooking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invoice_id', models.CharField(max_length=64, unique=True, verbose_name='Invoice ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('time', models.TimeField(verbose_name='Time')),
+                ('duration', models.PositiveIntegerField(verbose_name='Duration (minutes)')),
+                ('notes', models.TextField(blank=True, null=True, verbose_name='Notes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_booking', to='lessons.booking')),
+                ('hold', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_booking', to='lessons.slothold')),
+                ('instructor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_bookings', to='lessons.instructor')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_bookings', to='lessons.rangelocation')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_bookings', to='lessons.trainingpackage')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_bookings', to=settings.AUTH_USER_MODEL)),
+                ('weapon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_bookings', to='lessons.weapon')),
+            ],
+            options={
+                'verbose_name': 'Pending Booking',
+                'verbose_name_plural': 'Pending Bookings',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
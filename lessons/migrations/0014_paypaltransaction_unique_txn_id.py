@@ -0,0 +1,22 @@
+# Generated by Django 5.2 on 2026-10-17 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0013_pendingbooking'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paypaltransaction',
+            name='lessons_pay_txn_id_1d2748_idx',
+        ),
+        migrations.AlterField(
+            model_name='paypaltransaction',
+            name='txn_id',
+            field=models.CharField(max_length=100, unique=True, verbose_name='Transaction ID'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0016_booking_reminder_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='registration_form',
+            field=models.CharField(blank=True, help_text='Storage name of the PDF built by build_registration_forms', max_length=100, verbose_name='Prefilled Registration Form'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='registration_form_version',
+            field=models.CharField(blank=True, help_text='Layout and booking details the form was built from; blank means rebuild', max_length=16, verbose_name='Registration Form Version'),
+        ),
+    ]
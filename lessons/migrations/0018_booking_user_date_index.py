@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 04:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0017_booking_registration_form'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'date', 'time'], name='lessons_boo_user_id_0d77cb_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 04:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0018_booking_user_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='faqcomment',
+            index=models.Index(fields=['parent', 'is_active', 'created_at'], name='lessons_faq_parent__fd672e_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_table(apps, schema_editor):
+    """FTS5 table of lessons/search.py; other databases use the in-process index"""
+    from lessons.search import create_fts_table
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            create_fts_table(cursor)
+        except OperationalError:
+            # SQLite built without FTS5
+            pass
+
+
+def drop_search_table(apps, schema_editor):
+    from lessons.search import FTS_TABLE
+
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0019_faqcomment_thread_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
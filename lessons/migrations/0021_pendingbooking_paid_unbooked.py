@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-17 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0020_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingbooking',
+            name='paid_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True, verbose_name='Unbooked Amount'),
+        ),
+        migrations.AddField(
+            model_name='pendingbooking',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Paid At'),
+        ),
+        migrations.AddField(
+            model_name='pendingbooking',
+            name='paid_txn_id',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Unbooked Transaction ID'),
+        ),
+    ]
@@ -5,7 +5,10 @@ from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from django.conf import settings
 from datetime import time
+import hashlib
+from .schedule import get_schedule
 
 
 class TrainingPackage(models.Model):
@@ -156,9 +159,14 @@ class Instructor(models.Model):
     def get_absolute_url(self):
         return reverse('instructor_detail', kwargs={'pk': self.pk})
 
+    @property
+    def schedule(self):
+        """Compiled weekly schedule, shared across availability checks"""
+        return get_schedule(self)
+
     def get_available_days_list(self):
         """Return available days as a list of integers"""
-        return [int(day.strip()) for day in self.available_days.split(',') if day.strip()]
+        return self.schedule.weekdays
 
 
 class RangeLocation(models.Model):
@@ -329,6 +337,23 @@ class Booking(models.Model):
         verbose_name=_('Special Requests'),
         blank=True
     )
+    reminder_sent_at = models.DateTimeField(
+        verbose_name=_('Reminder Sent At'),
+        null=True,
+        blank=True
+    )
+    registration_form = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_('Prefilled Registration Form'),
+        help_text=_('Storage name of the PDF built by build_registration_forms')
+    )
+    registration_form_version = models.CharField(
+        max_length=16,
+        blank=True,
+        verbose_name=_('Registration Form Version'),
+        help_text=_('Layout and booking details the form was built from; blank means rebuild')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -343,6 +368,9 @@ class Booking(models.Model):
             models.Index(fields=['payment_status']),
             models.Index(fields=['user', 'status']),
             models.Index(fields=['paypal_txn_id']),
+            models.Index(fields=['status', 'date', 'time']),
+            # User dashboard: a customer's bookings by (date, time)
+            models.Index(fields=['user', 'date', 'time']),
         ]
 
     def __str__(self):
@@ -353,6 +381,10 @@ class Booking(models.Model):
 
     def clean(self):
         """Validate booking constraints"""
+        # Missing fields are reported by field validation
+        if self.date is None or self.time is None:
+            return
+        
         # Ensure bookings are made at least 24 hours in advance
         booking_datetime = timezone.make_aware(
             timezone.datetime.combine(self.date, self.time))
@@ -380,25 +412,15 @@ class Booking(models.Model):
 
     def is_instructor_available(self):
         """Check if instructor is available for this booking"""
-        # Check regular availability
-        weekday = self.date.weekday()
-        if weekday not in self.instructor.get_available_days_list():
-            return False
-        
-        # Check time slot
-        if (self.time < self.instructor.start_time or 
-            self.time > self.instructor.end_time):
-            return False
-        
-        # Check special availability exceptions
-        try:
-            availability = Availability.objects.get(
-                instructor=self.instructor,
-                date=self.date
-            )
-            return availability.is_available
-        except Availability.DoesNotExist:
-            return True
+        from .availability import ACTIVE_BOOKING_STATUSES, is_slot_available
+        return is_slot_available(
+            self.instructor,
+            self.date,
+            self.time,
+            self.duration or self.package.duration,
+            exclude_booking_id=self.pk,
+            check_conflicts=self.status in ACTIVE_BOOKING_STATUSES
+        )
 
     @property
     def datetime(self):
@@ -423,6 +445,184 @@ class Booking(models.Model):
         self.save()
 
 
+class SlotHold(models.Model):
+    """Temporary reservation of a slot while the customer pays"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='slot_holds'
+    )
+    instructor = models.ForeignKey(
+        Instructor,
+        on_delete=models.CASCADE,
+        related_name='slot_holds'
+    )
+    date = models.DateField(verbose_name=_('Date'))
+    time = models.TimeField(verbose_name=_('Time'))
+    duration = models.PositiveIntegerField(verbose_name=_('Duration (minutes)'))
+    expires_at = models.DateTimeField(verbose_name=_('Expires At'))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Slot Hold')
+        verbose_name_plural = _('Slot Holds')
+        ordering = ['expires_at']
+        indexes = [
+            models.Index(fields=['instructor', 'date']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"Hold by {self.user.username} on {self.date} {self.time} until {self.expires_at}"
+
+    def is_expired(self):
+        """Check if the hold no longer blocks the slot"""
+        return self.expires_at <= timezone.now()
+
+
+class PendingBooking(models.Model):
+    """
+    Booking draft waiting for PayPal payment.
+
+    The draft is identified by a deterministic invoice ID which is sent to
+    PayPal as `invoice`, so the IPN callback, the return URL and the JS
+    confirmation can all find it with one indexed lookup.
+    """
+    invoice_id = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name=_('Invoice ID')
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='pending_bookings'
+    )
+    package = models.ForeignKey(
+        TrainingPackage,
+        on_delete=models.CASCADE,
+        related_name='pending_bookings'
+    )
+    weapon = models.ForeignKey(
+        Weapon,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pending_bookings'
+    )
+    instructor = models.ForeignKey(
+        Instructor,
+        on_delete=models.CASCADE,
+        related_name='pending_bookings'
+    )
+    location = models.ForeignKey(
+        RangeLocation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pending_bookings'
+    )
+    date = models.DateField(verbose_name=_('Date'))
+    time = models.TimeField(verbose_name=_('Time'))
+    duration = models.PositiveIntegerField(verbose_name=_('Duration (minutes)'))
+    notes = models.TextField(blank=True, null=True, verbose_name=_('Notes'))
+    hold = models.OneToOneField(
+        SlotHold,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pending_booking'
+    )
+    booking = models.OneToOneField(
+        Booking,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pending_booking'
+    )
+    # Set when PayPal captured the money but the slot was gone, so the
+    # payment can be refunded or rebooked by hand
+    paid_txn_id = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name=_('Unbooked Transaction ID')
+    )
+    paid_amount = models.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name=_('Unbooked Amount')
+    )
+    paid_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Paid At'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Pending Booking')
+        verbose_name_plural = _('Pending Bookings')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Pending booking {self.invoice_id} for {self.user.username}"
+
+    @staticmethod
+    def make_invoice_id(user_id, package_id, instructor_id, date, time):
+        """
+        Derive the invoice ID of a draft from what it books.
+
+        Submitting the same draft twice yields the same ID, so it reuses
+        one row and PayPal sees one invoice instead of two.
+        """
+        key = ':'.join([
+            settings.SECRET_KEY, str(user_id), str(package_id),
+            str(instructor_id), date.isoformat(), time.isoformat(),
+        ])
+        return f"RAL-{hashlib.sha256(key.encode()).hexdigest()[:24]}"
+
+    def to_booking(self):
+        """Build the unsaved, paid Booking this draft turns into"""
+        return Booking(
+            user=self.user,
+            package=self.package,
+            weapon=self.weapon,
+            instructor=self.instructor,
+            location=self.location,
+            date=self.date,
+            time=self.time,
+            duration=self.duration,
+            payment_method='paypal',
+            notes=self.notes or '',
+            status='confirmed',
+            payment_status='completed',
+        )
+
+
+class SlotInventory(models.Model):
+    """Precomputed free time slots for one instructor on one day"""
+    instructor = models.ForeignKey(
+        Instructor,
+        on_delete=models.CASCADE,
+        related_name='slot_inventory'
+    )
+    date = models.DateField(verbose_name=_('Date'))
+    capacity = models.JSONField(
+        default=list,
+        verbose_name=_('Slot Capacity'),
+        help_text=_('Longest lesson in minutes that can start at each time slot (0 = taken)')
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['instructor', 'date']
+        verbose_name = _('Slot Inventory')
+        verbose_name_plural = _('Slot Inventory')
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.instructor} - slots on {self.date}"
+
+
 class FAQComment(models.Model):
     """Model for FAQ comments and replies"""
     user = models.ForeignKey(
@@ -462,15 +662,17 @@ class FAQComment(models.Model):
         indexes = [
             models.Index(fields=['is_active']),
             models.Index(fields=['created_at']),
+            # FAQ threads: a page of questions and the replies under them
+            models.Index(fields=['parent', 'is_active', 'created_at']),
         ]
 
     def __str__(self):
-        prefix = f"Reply to #{self.parent.id}" if self.parent else "Comment"
+        prefix = f"Reply to #{self.parent_id}" if self.parent_id else "Comment"
         return f"{prefix} by {self.user.username} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
     
     def is_reply(self):
         """Check if this comment is a reply"""
-        return self.parent is not None
+        return self.parent_id is not None
     
     def get_absolute_url(self):
         """Get URL to the comment's position on FAQ page"""
@@ -537,6 +739,7 @@ class PayPalTransaction(models.Model):
     )
     txn_id = models.CharField(
         max_length=100,
+        unique=True,
         verbose_name=_('Transaction ID')
     )
     payment_status = models.CharField(
@@ -558,7 +761,6 @@ class PayPalTransaction(models.Model):
         verbose_name = _('PayPal Transaction')
         verbose_name_plural = _('PayPal Transactions')
         indexes = [
-            models.Index(fields=['txn_id']),
             models.Index(fields=['payment_status']),
         ]
 
@@ -566,6 +768,45 @@ class PayPalTransaction(models.Model):
         return f"PayPal Transaction {self.txn_id} for Booking #{self.booking_id}"
 
 
+
+class OutboundEmail(models.Model):
+    """Email waiting to be delivered by the send_queued_emails worker"""
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name=_('Subject'))
+    body = models.TextField(verbose_name=_('Text Body'))
+    html_body = models.TextField(blank=True, verbose_name=_('HTML Body'))
+    from_email = models.CharField(max_length=255, blank=True, verbose_name=_('From'))
+    to = models.JSONField(default=list, verbose_name=_('Recipients'))
+    # [filename, base64 content, mimetype] triples
+    attachments = models.JSONField(default=list, blank=True, verbose_name=_('Attachments'))
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name=_('Status')
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_('Attempts'))
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name=_('Next Attempt At'))
+    last_error = models.TextField(blank=True, verbose_name=_('Last Error'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Sent At'))
+
+    class Meta:
+        verbose_name = _('Outbound Email')
+        verbose_name_plural = _('Outbound Emails')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
 def create_initial_data():
     """Function to create initial data"""
     # Create sample training package
@@ -0,0 +1,153 @@
+"""
+Shared response cache for the public pages.
+
+Pages are rendered once with their per-user parts (login state, CSRF
+tokens, flash messages) left as holes, marked in the templates with
+{% hole "name" %} ... {% endhole %} from the page_cache tag library. The
+result is cached under the version tokens of the models the page shows
+(see catalog.py), so the same signals that invalidate the catalog
+invalidate the page. Each request then only renders the holes, with its
+own user and CSRF token, and splices them into the cached page.
+
+Everything outside a hole must be the same for every visitor. As a
+safety net a render that used the CSRF token or the flash messages
+outside a hole is served but not cached.
+
+Only the query parameters a view reads are part of the key, so made-up
+query strings are served the page cached for the plain URL instead of
+each filling the cache with a copy.
+"""
+import base64
+from functools import wraps
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import RequestContext
+from django.template.loader import get_template
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
+
+from .catalog import get_versions
+
+_MARKER = re.compile(r'<!--page-hole:([A-Za-z0-9_=-]+)-->')
+
+# (template name, hole name) -> HoleNode, filled in as templates are compiled
+_holes = {}
+
+
+def get_page_cache_seconds():
+    """Upper bound on how long a page is served without being re-rendered"""
+    return getattr(settings, 'PAGE_CACHE_SECONDS', 60 * 60)
+
+
+def register_hole(node):
+    _holes[(node.template_name, node.name)] = node
+
+
+def is_capturing(context):
+    """True while a page is being rendered for the cache"""
+    return getattr(getattr(context, 'request', None), '_page_cache_capture', False)
+
+
+def hole_marker(node, values):
+    payload = json.dumps([node.template_name, node.name, values])
+    return f"<!--page-hole:{base64.urlsafe_b64encode(payload.encode()).decode()}-->"
+
+
+def find_hole(template_name, name):
+    if (template_name, name) not in _holes:
+        # Compiling the template registers its holes in this process
+        get_template(template_name)
+    return _holes[(template_name, name)]
+
+
+def fill_holes(request, content):
+    """Render every hole of a captured page for this request"""
+    def render(match):
+        template_name, name, values = json.loads(base64.urlsafe_b64decode(match.group(1)))
+        return find_hole(template_name, name).render_for(request, values)
+    return _MARKER.sub(render, content)
+
+
+def render_hole(node, request, values):
+    """Render a hole's contents outside its page, with context processors applied"""
+    template = get_template(node.template_name).template
+    context = RequestContext(request, values)
+    with context.render_context.push_state(template):
+        with context.bind_template(template):
+            return node.nodelist.render(context)
+
+
+def _page_key(view, request, models, query_params):
+    versions = get_versions(models)
+    query = urlencode([(name, request.GET.getlist(name)) for name in query_params], doseq=True)
+    path = hashlib.sha256(f"{request.path}?{query}".encode()).hexdigest()
+    return ':'.join(
+        ['page', f"{view.__module__}.{view.__name__}", path]
+        + [versions[model] for model in models]
+    )
+
+
+def _capture(view, request, args, kwargs):
+    csrf_before = request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False)
+    request._page_cache_capture = True
+    try:
+        response = view(request, *args, **kwargs)
+    finally:
+        request._page_cache_capture = False
+
+    storage = getattr(request, '_messages', None)
+    cacheable = (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # Per-user output rendered outside a hole
+        and request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False) == csrf_before
+        and not getattr(storage, 'used', False)
+    )
+    return response, cacheable
+
+
+def cache_public_page(*models, query_params=()):
+    """
+    Serve GET requests of a view from the shared page cache.
+
+    `models` are the models whose changes must re-render the page, and
+    `query_params` the names of the GET parameters the view reads.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            key = _page_key(view, request, models, query_params)
+            page = cache.get(key)
+            if page is None:
+                response, cacheable = _capture(view, request, args, kwargs)
+                if not hasattr(response, 'content') or response.streaming:
+                    return response
+                content = response.content.decode(response.charset)
+                if cacheable:
+                    cache.set(key, {
+                        'content': content,
+                        'content_type': response['Content-Type'],
+                    }, get_page_cache_seconds())
+                response.content = fill_holes(request, content)
+                response['X-Page-Cache'] = 'miss'
+            else:
+                response = HttpResponse(
+                    fill_holes(request, page['content']),
+                    content_type=page['content_type']
+                )
+                response['X-Page-Cache'] = 'hit'
+
+            # The holes make the final HTML differ per session
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
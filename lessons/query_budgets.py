@@ -0,0 +1,114 @@
+"""
+Query and latency budgets of the lessons views, by URL name.
+
+QueryBudgetMiddleware (and the route walk in tests.py) compare every
+request against these numbers, so a change that adds a query per row or
+per template include fails a test instead of showing up in production.
+Budgets are the query counts measured with the seed data of
+QueryBudgetTests plus a little headroom; a view missing from the table
+gets DEFAULT_QUERY_BUDGET. Session, user and allauth social account
+lookups count towards the budget of signed-in views.
+
+When a view legitimately needs more queries, raise its number here in
+the same change.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_BUDGET = 6
+
+# Wall-clock milliseconds; only logged, timing is too noisy to test
+DEFAULT_LATENCY_BUDGET_MS = 500
+
+# Same statement run more often than this in one request is reported as an N+1
+DUPLICATE_QUERY_LIMIT = 3
+
+QUERY_BUDGETS = {
+    # Public pages: session and user for the header, then cached content
+    'home': 5,
+    'packages': 4,
+    'package_detail': 3,
+    'gallery': 3,
+    'about': 4,
+    'instructor_detail': 3,
+    'faq': 4,
+    'faq_comments': 5,
+    # Built from the database only when the matrix is missing
+    'similar_questions': 2,
+    'testimonials': 3,
+    'contact': 3,
+    'legal': 3,
+    'privacy': 3,
+    'download_registration_form': 2,
+    # Booking flow
+    'booking': 6,
+    'booking_with_package': 6,
+    'quick_booking': 4,
+    'booking_confirmation': 4,
+    'booking_detail': 5,
+    'cancel_booking': 5,
+    'check_availability': 4,
+    'api_check_availability': 4,
+    'availability_calendar': 4,
+    'search': 1,
+    'process_payment': 4,
+    'payment_confirm': 4,
+    'payment_methods': 4,
+    'payment_success': 4,
+    'payment_cancel': 5,
+    # Accounts
+    'login': 3,
+    'logout': 5,
+    'signup': 3,
+    'user_dashboard': 5,
+    'profile_settings': 4,
+    'change_password': 4,
+    'password_change_done': 3,
+    # Deleting looks up the replies it cascades to
+    'delete_comment': 6,
+}
+
+LATENCY_BUDGETS_MS = {
+    'booking': 800,
+    'availability_calendar': 800,
+}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(url_name):
+    return QUERY_BUDGETS.get(url_name, DEFAULT_QUERY_BUDGET)
+
+
+def latency_budget(url_name):
+    return LATENCY_BUDGETS_MS.get(url_name, DEFAULT_LATENCY_BUDGET_MS)
+
+
+def budget_problems(url_name, stats, elapsed_ms=None):
+    """Human-readable list of the budgets `stats` goes over"""
+    problems = []
+    budget = query_budget(url_name)
+    if stats.count > budget:
+        problems.append(f"{stats.count} queries (budget {budget})")
+    repeated = stats.repeated(more_than=DUPLICATE_QUERY_LIMIT)
+    if repeated:
+        problems.append(f"{len(repeated)} statement(s) run more than {DUPLICATE_QUERY_LIMIT} times")
+    if elapsed_ms is not None and elapsed_ms > latency_budget(url_name):
+        problems.append(f"{elapsed_ms:.0f} ms (budget {latency_budget(url_name)} ms)")
+    return problems
+
+
+def check_budget(url_name, stats, elapsed_ms=None):
+    """Log, or raise with QUERY_BUDGET_STRICT, when a request of `url_name` is over budget"""
+    problems = budget_problems(url_name, stats, elapsed_ms)
+    if problems:
+        message = f"View {url_name} over budget: {', '.join(problems)}\n{stats.report()}"
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return problems
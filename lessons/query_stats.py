@@ -0,0 +1,73 @@
+"""
+Per-request database query accounting.
+
+record_queries() wraps every query run on the default connection while
+it is active and collects the count, the total time and a fingerprint of
+each statement. The fingerprint is the SQL with its parameters left out
+and IN lists collapsed, so the same query run once per row of a loop
+(an N+1) shows up as one fingerprint with many executions.
+QueryBudgetMiddleware uses it for every request; tests can use it
+directly:
+
+    with record_queries() as stats:
+        self.client.get(url)
+    self.assertFalse(stats.repeated())
+"""
+from collections import Counter
+from contextlib import contextmanager
+import hashlib
+import re
+import time
+
+from django.db import connection
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+
+
+def fingerprint(sql):
+    """Short stable id of a statement, ignoring its parameters"""
+    normalized = _IN_LIST.sub('(%s, ...)', ' '.join(sql.split()))
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        # fingerprint -> first SQL seen, for reports
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.statements.setdefault(key, sql)
+
+    @property
+    def duplicates(self):
+        """Executions beyond the first of every fingerprint"""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def repeated(self, more_than=1):
+        """{fingerprint: executions} for statements run more than `more_than` times"""
+        return {key: count for key, count in self.fingerprints.items() if count > more_than}
+
+    def report(self):
+        lines = [f"{self.count} queries, {self.duration * 1000:.1f} ms"]
+        for key, count in self.fingerprints.most_common():
+            if count > 1:
+                lines.append(f"  {count}x [{key}] {self.statements[key][:200]}")
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries(using=None):
+    stats = QueryStats()
+    with (using or connection).execute_wrapper(stats):
+        yield stats
@@ -0,0 +1,80 @@
+"""
+Prefilled registration forms for confirmed bookings.
+
+The build_registration_forms command (run every few minutes, like
+send_queued_emails) picks up confirmed bookings whose form is missing or
+was built from an older PREFILLED_VERSION, renders the PDFs in a process
+pool and records their content-addressed names on the bookings. Editing
+the layout in documents.py therefore regenerates every form on the next
+run, and a booking whose date, time, package, instructor or location
+changes has its version cleared (see signals.py) so it is rebuilt too.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import transaction
+
+from .documents import PREFILLED_VERSION, render_prefilled_form
+from .models import Booking
+
+# Bookings loaded and rendered per round trip
+FORM_BATCH_SIZE = 200
+
+# Booking fields printed on the form; a change to any of them means a rebuild
+FORM_BOOKING_FIELDS = ['date', 'time', 'package_id', 'instructor_id', 'location_id']
+
+
+def registration_form_fields(booking):
+    """Plain values for documents.PREFILLED_LINES (related objects already loaded)"""
+    user = booking.user
+    return {
+        'booking_id': booking.pk,
+        'name': user.get_full_name() or user.username,
+        'email': user.email or '-',
+        'package': booking.package.name,
+        'date': f"{booking.date:%B} {booking.date.day}, {booking.date.year}",
+        'time': f"{booking.time:%I:%M %p}",
+        'location': booking.location.name if booking.location else '-',
+        'instructor': booking.instructor.user.get_full_name() or booking.instructor.user.username,
+    }
+
+
+def forms_to_build():
+    """Confirmed bookings without an up-to-date prefilled form"""
+    return Booking.objects.filter(status='confirmed').exclude(
+        registration_form_version=PREFILLED_VERSION
+    ).select_related('user', 'package', 'instructor__user', 'location')
+
+
+def build_registration_forms(workers=1, batch_size=FORM_BATCH_SIZE):
+    """Render every missing or outdated form and return how many were built"""
+    pool = None
+    if workers > 1:
+        # Workers only render and write files; they set Django up again in
+        # case the platform starts them fresh instead of forking
+        pool = ProcessPoolExecutor(workers, initializer=django.setup)
+    render = pool.map if pool else map
+
+    built = 0
+    last_pk = 0
+    due = forms_to_build().order_by('pk')
+    try:
+        while True:
+            batch = list(due.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            names = render(render_prefilled_form, [registration_form_fields(booking) for booking in batch])
+            with transaction.atomic():
+                for booking, name in zip(batch, names):
+                    # A booking edited while its form was rendering keeps its
+                    # cleared version and is picked up again on the next run.
+                    # update() skips save(), so no booking signals fire.
+                    built += Booking.objects.filter(
+                        pk=booking.pk,
+                        updated_at=booking.updated_at
+                    ).update(registration_form=name, registration_form_version=PREFILLED_VERSION)
+    finally:
+        if pool:
+            pool.shutdown()
+    return built
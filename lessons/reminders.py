@@ -0,0 +1,99 @@
+"""
+Lesson reminders for confirmed bookings starting soon.
+
+The send_reminders command (run hourly) walks the due bookings in
+primary-key batches. Each batch is one joined SELECT, one UPDATE that
+stamps reminder_sent_at, and one INSERT into the outbox, so the cost per
+booking stays flat however many lessons are coming up. Bookings already
+stamped are skipped, which makes re-runs and overlapping runs harmless.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .emails import build_email, queue_emails
+from .models import Booking
+
+# How far ahead of a lesson the reminder goes out
+REMINDER_WINDOW_HOURS = 24
+
+# Bookings loaded, stamped and queued per round trip
+REMINDER_BATCH_SIZE = 500
+
+
+def upcoming_window(start, end):
+    """Q matching bookings whose date + time falls in [start, end)"""
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    if start.date() == end.date():
+        return Q(date=start.date(), time__gte=start.time(), time__lt=end.time())
+    return (
+        Q(date=start.date(), time__gte=start.time())
+        | Q(date__gt=start.date(), date__lt=end.date())
+        | Q(date=end.date(), time__lt=end.time())
+    )
+
+
+def due_reminders(now=None, hours=REMINDER_WINDOW_HOURS):
+    """Confirmed bookings starting within `hours` that have not been reminded"""
+    now = now or timezone.now()
+    return Booking.objects.filter(
+        upcoming_window(now, now + timedelta(hours=hours)),
+        status='confirmed',
+        reminder_sent_at__isnull=True
+    ).select_related('user', 'package', 'instructor__user', 'location')
+
+
+def build_reminder_email(booking):
+    """Build the reminder for one booking (related objects already loaded)"""
+    user = booking.user
+    return build_email(
+        'booking_reminder',
+        f"Reminder: your lesson on {booking.date:%B} {booking.date.day} at {booking.time:%I:%M %p}",
+        [user.email],
+        {
+            'booking': booking,
+            'customer_name': user.get_full_name() or user.username,
+        }
+    )
+
+
+def _queue_batch(batch, stamp):
+    with transaction.atomic():
+        ids = [booking.pk for booking in batch]
+        # Stamp first; another run that got here earlier keeps its rows
+        Booking.objects.filter(
+            pk__in=ids,
+            reminder_sent_at__isnull=True
+        ).update(reminder_sent_at=stamp)
+        claimed = set(Booking.objects.filter(
+            pk__in=ids,
+            reminder_sent_at=stamp
+        ).values_list('pk', flat=True))
+
+        messages = [
+            build_reminder_email(booking)
+            for booking in batch
+            if booking.pk in claimed and booking.user.email
+        ]
+        if messages:
+            queue_emails(messages)
+    return len(messages)
+
+
+def send_due_reminders(now=None, hours=REMINDER_WINDOW_HOURS, batch_size=REMINDER_BATCH_SIZE):
+    """Queue a reminder for every due booking and return how many were queued"""
+    due = due_reminders(now, hours).order_by('pk')
+    # Each run stamps its own rows, so overlapping runs can tell them apart
+    stamp = timezone.now()
+
+    queued = 0
+    last_pk = 0
+    while True:
+        batch = list(due.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        queued += _queue_batch(batch, stamp)
+    return queued
@@ -0,0 +1,82 @@
+"""
+Compiled instructor schedules.
+
+`Instructor.available_days` is stored as a comma-separated string. Parsing
+it on every availability check shows up in profiles, so each instructor's
+weekly schedule is compiled once into an InstructorSchedule and reused until
+the schedule fields change.
+"""
+from datetime import time as dt_time
+
+TIME_SLOTS = [
+    ('09:00:00', '9:00 AM'),
+    ('10:30:00', '10:30 AM'),
+    ('12:00:00', '12:00 PM'),
+    ('13:30:00', '1:30 PM'),
+    ('15:00:00', '3:00 PM'),
+    ('16:30:00', '4:30 PM'),
+    ('18:00:00', '6:00 PM'),
+]
+
+# TIME_SLOTS as (index, time, value) triples, parsed once
+PARSED_TIME_SLOTS = tuple(
+    (index, dt_time.fromisoformat(value), value)
+    for index, (value, display) in enumerate(TIME_SLOTS)
+)
+
+_schedule_cache = {}
+
+
+def to_minutes(value):
+    """Convert a time object to minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+
+class InstructorSchedule:
+    """Weekday bitmask plus the TIME_SLOTS that fall inside working hours"""
+    __slots__ = ('version', 'weekday_mask', 'start_time', 'end_time', 'slots')
+
+    def __init__(self, available_days, start_time, end_time):
+        self.version = (available_days, start_time, end_time)
+        self.weekday_mask = 0
+        for day in available_days.split(','):
+            if day.strip():
+                self.weekday_mask |= 1 << int(day)
+        self.start_time = start_time
+        self.end_time = end_time
+        # (TIME_SLOTS index, start minute, slot value) for every slot the
+        # instructor can start
+        self.slots = tuple(
+            (index, to_minutes(slot_time), value)
+            for index, slot_time, value in PARSED_TIME_SLOTS
+            if start_time <= slot_time <= end_time
+        )
+
+    @property
+    def weekdays(self):
+        """Available weekdays as a sorted list of integers (0 = Monday)"""
+        return [day for day in range(7) if self.weekday_mask & (1 << day)]
+
+    def works_weekday(self, day):
+        """Check whether the instructor works on the weekday of `day`"""
+        return bool(self.weekday_mask & (1 << day.weekday()))
+
+    def within_hours(self, start_time):
+        """Check whether a lesson may start at `start_time`"""
+        return self.start_time <= start_time <= self.end_time
+
+
+def get_schedule(instructor):
+    """
+    Return the compiled schedule for an instructor.
+
+    Schedules are cached per process by instructor id and rebuilt only when
+    available_days, start_time or end_time differ from the cached version.
+    """
+    version = (instructor.available_days, instructor.start_time, instructor.end_time)
+    schedule = _schedule_cache.get(instructor.pk)
+    if schedule is None or schedule.version != version:
+        schedule = InstructorSchedule(*version)
+        if instructor.pk is not None:
+            _schedule_cache[instructor.pk] = schedule
+    return schedule
@@ -0,0 +1,570 @@
+"""
+Site search over the FAQ, FAQ comments, training packages and testimonials.
+
+Every searchable item is a document with a title and a body, identified
+by (kind, id); static FAQs (faq_content.py) use their position on the
+page as id. Queries match every word, each as a prefix, so results show
+up while a word is still being typed, and are ranked with BM25, titles
+counting three times as much as bodies.
+
+On SQLite with FTS5 (the default deployment) documents live in the
+lessons_search FTS5 table created by migration 0020. Rows change in the
+same transaction as the objects they index (see signals.py), so every
+worker sees the same index. Elsewhere a pure-Python InvertedIndex is
+built per process on the first search and updated in place by the same
+signals; a change made in another process replaces SEARCH_VERSION_KEY,
+which makes this one rebuild in a background thread while searches keep
+using the index it has. Set SEARCH_BACKEND to 'fts5' or 'python' to
+choose explicitly.
+
+`manage.py rebuild_search_index` rebuilds either from scratch;
+`migrate` resyncs the static FAQs and fills an empty index.
+"""
+import bisect
+from collections import defaultdict
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.urls import reverse
+from django.utils.text import Truncator
+
+from .faq_content import faq_entries
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'lessons_search'
+
+# Kind -> code; a document's FTS rowid is code * KIND_STRIDE + id
+KINDS = {'faq': 1, 'comment': 2, 'package': 3, 'testimonial': 4}
+KIND_STRIDE = 10 ** 12
+
+TITLE_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+
+# Words of a query used; the rest are ignored
+MAX_QUERY_TERMS = 8
+
+# Words shorter than this only match exactly
+MIN_PREFIX_LENGTH = 2
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+SNIPPET_WORDS = 24
+
+# Rebuild the in-process index at least this often (seconds), in case a
+# change made by another worker at the same time as ours was missed
+SEARCH_INDEX_MAX_AGE = 300
+
+# Changes made by other workers within this many seconds share a rebuild
+SEARCH_INDEX_REBUILD_INTERVAL = 10
+
+SEARCH_VERSION_KEY = 'search:version'
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase words of `text` with accents removed"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD.findall(text)
+
+
+def query_terms(query):
+    return tokenize(query or '')[:MAX_QUERY_TERMS]
+
+
+class Document:
+    __slots__ = ('kind', 'object_id', 'title', 'body', 'url')
+
+    def __init__(self, kind, object_id, title, body, url):
+        self.kind = kind
+        self.object_id = object_id
+        self.title = title
+        self.body = body
+        self.url = url
+
+    @property
+    def key(self):
+        return (self.kind, self.object_id)
+
+    @property
+    def rowid(self):
+        return KINDS[self.kind] * KIND_STRIDE + self.object_id
+
+
+# Building documents from objects ----------------------------------------
+
+def faq_documents():
+    return [
+        Document('faq', position, entry['question'], entry['answer'], f"{reverse('faq')}#{entry['anchor']}")
+        for position, entry in enumerate(faq_entries())
+    ]
+
+
+def document_for(instance):
+    """Document indexing `instance`, or None if it should not be searchable"""
+    from .models import FAQComment, Testimonial, TrainingPackage
+
+    if isinstance(instance, FAQComment):
+        if not instance.is_active:
+            return None
+        return Document('comment', instance.pk, '', instance.content, instance.get_absolute_url())
+    if isinstance(instance, TrainingPackage):
+        if not instance.is_active:
+            return None
+        return Document(
+            'package', instance.pk, instance.name, instance.description,
+            reverse('package_detail', args=[instance.pk])
+        )
+    if isinstance(instance, Testimonial):
+        if not instance.is_approved:
+            return None
+        return Document(
+            'testimonial', instance.pk, instance.name, instance.content,
+            f"{reverse('testimonials')}#testimonial-{instance.pk}"
+        )
+    return None
+
+
+def document_key(instance):
+    from .models import FAQComment, Testimonial, TrainingPackage
+
+    kind = {FAQComment: 'comment', TrainingPackage: 'package', Testimonial: 'testimonial'}.get(type(instance))
+    return (kind, instance.pk) if kind else None
+
+
+def all_documents():
+    """Every searchable document, read in pk order a batch at a time"""
+    from .models import FAQComment, Testimonial, TrainingPackage
+
+    yield from faq_documents()
+    querysets = [
+        FAQComment.objects.filter(is_active=True),
+        TrainingPackage.objects.filter(is_active=True),
+        Testimonial.objects.filter(is_approved=True),
+    ]
+    for queryset in querysets:
+        for instance in queryset.order_by('pk').iterator(chunk_size=2000):
+            yield document_for(instance)
+
+
+def snippet(body, terms, words=SNIPPET_WORDS):
+    """About `words` words of `body` starting a little before the first match"""
+    parts = body.split()
+    for index, part in enumerate(parts):
+        if any(token.startswith(term) for token in tokenize(part) for term in terms):
+            start = max(0, index - 4)
+            break
+    else:
+        start = 0
+    text = ' '.join(parts[start:start + words])
+    if start > 0:
+        text = '… ' + text
+    if start + words < len(parts):
+        text += ' …'
+    return text
+
+
+def result_data(document, terms, score):
+    return {
+        'kind': document.kind,
+        'id': document.object_id,
+        'title': document.title or Truncator(document.body).chars(80),
+        'snippet': snippet(document.body, terms),
+        'url': document.url,
+        'score': round(score, 4),
+    }
+
+
+# SQLite FTS5 --------------------------------------------------------------
+
+_fts5_found = False
+
+
+def fts5_available():
+    """
+    True when the database is SQLite built with FTS5 and the table exists.
+
+    Only a positive answer is remembered: a table created by a later
+    migrate is picked up without restarting the workers.
+    """
+    global _fts5_found
+    if _fts5_found:
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts5_found = cursor.fetchone() is not None
+    except DatabaseError:
+        return False
+    return _fts5_found
+
+
+def create_fts_table(cursor, table=FTS_TABLE):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, title, body, url UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+
+def fts_query(terms):
+    """MATCH expression requiring every term as a prefix (or exactly, when short)"""
+    return ' '.join(
+        f'"{term}"*' if len(term) >= MIN_PREFIX_LENGTH else f'"{term}"'
+        for term in terms
+    )
+
+
+class FTSIndex:
+    """The index kept in an FTS5 table of the default database"""
+
+    def __init__(self, table=FTS_TABLE):
+        self.table = table
+
+    # Rows of single objects are blanked and rewritten in place, never
+    # deleted and inserted again: SQLite 3.40 can corrupt an FTS5
+    # table when a row is deleted, the table queried and the same rowid
+    # inserted within one transaction.
+
+    def add(self, documents):
+        missing = []
+        with connection.cursor() as cursor:
+            for d in documents:
+                cursor.execute(
+                    f"UPDATE {self.table} SET kind = %s, object_id = %s, title = %s, body = %s, url = %s "
+                    "WHERE rowid = %s",
+                    [d.kind, d.object_id, d.title, d.body, d.url, d.rowid]
+                )
+                if not cursor.rowcount:
+                    missing.append(d)
+        self.insert(missing)
+
+    def insert(self, documents):
+        """Add documents known not to be in the table yet"""
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, kind, object_id, title, body, url) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                [(d.rowid, d.kind, d.object_id, d.title, d.body, d.url) for d in documents]
+            )
+
+    def remove(self, key):
+        kind, object_id = key
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET title = '', body = '' WHERE rowid = %s",
+                [KINDS[kind] * KIND_STRIDE + object_id]
+            )
+
+    def replace_kind(self, kind, documents):
+        start = KINDS[kind] * KIND_STRIDE
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid >= %s AND rowid < %s",
+                [start, start + KIND_STRIDE]
+            )
+        self.insert(documents)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def count(self, kinds=None):
+        with connection.cursor() as cursor:
+            # Blanked rows of removed objects do not count
+            cursor.execute(f"SELECT kind, COUNT(*) FROM {self.table} WHERE body != '' GROUP BY kind")
+            counts = dict(cursor.fetchall())
+        return sum(count for kind, count in counts.items() if kinds is None or kind in kinds)
+
+    def search(self, terms, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT kind, object_id, title, body, url, "
+                f"bm25({self.table}, 0, 0, {TITLE_WEIGHT}, {BODY_WEIGHT}, 0) AS rank "
+                f"FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s",
+                [fts_query(terms), limit]
+            )
+            # bm25() is lower for better matches
+            return [(Document(*row[:5]), -row[5]) for row in cursor.fetchall()]
+
+
+# Pure-Python fallback -----------------------------------------------------
+
+class InvertedIndex:
+    """
+    In-memory inverted index with prefix matching and BM25 ranking.
+
+    `postings` maps a word to {document key: weighted frequency}; `terms`
+    is the sorted vocabulary, searched with bisect for prefixes.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, documents=()):
+        self.documents = {}
+        self.lengths = {}
+        self.postings = defaultdict(dict)
+        self.terms = []
+        self.total_length = 0.0
+        self.version = None
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.add(documents)
+
+    def _frequencies(self, document):
+        frequencies = defaultdict(float)
+        for term in tokenize(document.title):
+            frequencies[term] += TITLE_WEIGHT
+        for term in tokenize(document.body):
+            frequencies[term] += BODY_WEIGHT
+        return frequencies
+
+    def add(self, documents):
+        with self.lock:
+            for document in documents:
+                self._remove(document.key)
+                frequencies = self._frequencies(document)
+                self.documents[document.key] = document
+                self.lengths[document.key] = sum(frequencies.values())
+                self.total_length += self.lengths[document.key]
+                for term, frequency in frequencies.items():
+                    if term not in self.postings:
+                        bisect.insort(self.terms, term)
+                    self.postings[term][document.key] = frequency
+
+    def _remove(self, key):
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        self.total_length -= self.lengths.pop(key)
+        for term in set(tokenize(document.title)) | set(tokenize(document.body)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def replace_kind(self, kind, documents):
+        with self.lock:
+            for key in [key for key in self.documents if key[0] == kind]:
+                self._remove(key)
+        self.add(documents)
+
+    def count(self, kinds=None):
+        return sum(1 for kind, object_id in self.documents if kinds is None or kind in kinds)
+
+    def expand(self, term):
+        """Vocabulary words `term` matches"""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if term in self.postings else []
+        start = bisect.bisect_left(self.terms, term)
+        end = bisect.bisect_left(self.terms, term + '\uffff', start)
+        return self.terms[start:end]
+
+    def search(self, terms, limit):
+        with self.lock:
+            count = len(self.documents)
+            if not count:
+                return []
+            average = self.total_length / count
+            scores = None
+            # Rarest word first, so the candidate set shrinks fastest
+            expanded = sorted(
+                (self.expand(term) for term in terms),
+                key=lambda words: sum(len(self.postings[word]) for word in words)
+            )
+            for words in expanded:
+                term_scores = defaultdict(float)
+                for word in words:
+                    postings = self.postings[word]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    if scores is None or len(postings) <= len(scores):
+                        matches = postings.items()
+                    else:
+                        # Only documents matching the earlier words can still qualify
+                        matches = ((key, postings[key]) for key in scores if key in postings)
+                    for key, frequency in matches:
+                        if scores is not None and key not in scores:
+                            continue
+                        norm = self.k1 * (1 - self.b + self.b * self.lengths[key] / average)
+                        term_scores[key] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {key: scores[key] + score for key, score in term_scores.items()}
+                if not scores:
+                    return []
+            best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [(self.documents[key], score) for key, score in best]
+
+
+_python_index = None
+_python_index_lock = threading.Lock()
+# Guarded by _python_index_lock
+_python_index_rebuilding = False
+
+
+def _current_version():
+    version = cache.get(SEARCH_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(SEARCH_VERSION_KEY, version, None):
+            version = cache.get(SEARCH_VERSION_KEY, version)
+    return version
+
+
+def _build_python_index(version):
+    index = InvertedIndex(all_documents())
+    index.version = version
+    return index
+
+
+def _rebuild_python_index(version):
+    global _python_index, _python_index_rebuilding
+    try:
+        index = _build_python_index(version)
+        with _python_index_lock:
+            _python_index = index
+    except Exception as e:
+        logger.error(f"Error rebuilding the search index: {str(e)}", exc_info=True)
+    finally:
+        with _python_index_lock:
+            _python_index_rebuilding = False
+        connection.close()
+
+
+def get_python_index():
+    """
+    This process's InvertedIndex, built on the first search.
+
+    When another process changed the data, or the index is older than
+    SEARCH_INDEX_MAX_AGE, a background thread builds a replacement and
+    the current index keeps answering until it is swapped in.
+    """
+    global _python_index, _python_index_rebuilding
+    version = _current_version()
+    index = _python_index
+    if index is None:
+        with _python_index_lock:
+            if _python_index is None:
+                _python_index = _build_python_index(version)
+            return _python_index
+
+    age = time.monotonic() - index.built_at
+    if (index.version != version and age > SEARCH_INDEX_REBUILD_INTERVAL) or age > SEARCH_INDEX_MAX_AGE:
+        with _python_index_lock:
+            start = not _python_index_rebuilding
+            _python_index_rebuilding = True
+        if start:
+            threading.Thread(target=_rebuild_python_index, args=(version,), daemon=True).start()
+    return index
+
+
+def _mark_python_index_current():
+    """Tell other processes to rebuild; this one already applied the change"""
+    version = uuid.uuid4().hex
+    cache.set(SEARCH_VERSION_KEY, version, None)
+    if _python_index is not None:
+        _python_index.version = version
+
+
+# Entry points -------------------------------------------------------------
+
+def use_fts5():
+    backend = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if backend == 'python':
+        return False
+    return backend == 'fts5' or fts5_available()
+
+
+def get_search_index():
+    return FTSIndex() if use_fts5() else get_python_index()
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    """Ranked results for `query` as JSON-ready dicts"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    return [result_data(document, terms, score) for document, score in get_search_index().search(terms, limit)]
+
+
+def update_object(instance):
+    """Index, reindex or unindex one saved object"""
+    key = document_key(instance)
+    if key is None:
+        return
+    document = document_for(instance)
+    if use_fts5():
+        index = FTSIndex()
+    elif _python_index is not None:
+        index = _python_index
+    else:
+        # Built with this object on the first search
+        return
+    if document is None:
+        index.remove(key)
+    else:
+        index.add([document])
+    if index is _python_index:
+        _mark_python_index_current()
+
+
+def remove_object(instance):
+    key = document_key(instance)
+    if key is None:
+        return
+    if use_fts5():
+        FTSIndex().remove(key)
+    elif _python_index is not None:
+        _python_index.remove(key)
+        _mark_python_index_current()
+
+
+def sync_search_index(rebuild=False):
+    """
+    Bring the static FAQs up to date, and index everything when the index
+    holds nothing else (just created) or `rebuild` is set.
+    """
+    global _python_index
+    if not use_fts5():
+        # Every process rebuilds on its next search
+        with _python_index_lock:
+            _python_index = None
+        cache.set(SEARCH_VERSION_KEY, uuid.uuid4().hex, None)
+        return get_python_index().count() if rebuild else 0
+
+    index = FTSIndex()
+    if rebuild or not index.count(kinds={'comment', 'package', 'testimonial'}):
+        index.clear()
+        documents = []
+        for document in all_documents():
+            documents.append(document)
+            if len(documents) >= 2000:
+                index.insert(documents)
+                documents = []
+        index.insert(documents)
+    else:
+        index.replace_kind('faq', faq_documents())
+    return index.count()
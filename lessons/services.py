@@ -0,0 +1,278 @@
+"""
+Transactional booking operations.
+
+Views must not check availability and save in separate steps: two requests
+can both pass the check and the loser then fails on unique_together with a
+500. claim_booking() does both inside one transaction and reports a lost
+race as SlotTaken.
+
+While a customer is in PayPal checkout their slot is protected by a
+SlotHold, which every availability query treats as busy until it expires
+or is converted into the booking.
+
+A payment can be reported by the IPN callback and the JS confirmation, in
+any order and more than once. confirm_paid_booking() turns each draft into
+at most one booking and records each PayPal transaction at most once.
+"""
+from collections import defaultdict
+from datetime import timedelta
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from .availability import is_slot_available, refresh_inventory
+from .models import Instructor, PayPalTransaction, PendingBooking, SlotHold
+
+logger = logging.getLogger(__name__)
+
+# Attempts made when SQLite reports "database is locked"
+LOCK_RETRIES = 5
+LOCK_BACKOFF_SECONDS = 0.05
+
+
+class SlotTaken(Exception):
+    """The requested instructor slot is no longer available"""
+
+
+class TransactionMismatch(Exception):
+    """A PayPal transaction is already recorded against another booking"""
+
+
+def get_hold_ttl():
+    """How long a checkout hold keeps a slot reserved"""
+    return timedelta(minutes=getattr(settings, 'SLOT_HOLD_MINUTES', 15))
+
+
+def _slot_is_free(instructor, day, start_time, duration, exclude_booking_id=None):
+    return is_slot_available(
+        instructor,
+        day,
+        start_time,
+        duration,
+        exclude_booking_id=exclude_booking_id
+    )
+
+
+def _lock_instructor(instructor_id):
+    # Serialises claims for the same instructor on databases with row
+    # locks. SQLite ignores it and serialises writers instead.
+    list(Instructor.objects.select_for_update().filter(
+        pk=instructor_id
+    ).values_list('pk', flat=True))
+
+
+def _retry_when_locked(operation, on_retry=None):
+    """Run `operation`, retrying with jittered backoff while SQLite is locked"""
+    # Inside a transaction the failed statement has broken the enclosing
+    # atomic block, so only the caller that opened it can retry
+    attempts = 1 if transaction.get_connection().in_atomic_block else LOCK_RETRIES
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except OperationalError as e:
+            if on_retry:
+                on_retry()
+            if 'locked' not in str(e) or attempt == attempts - 1:
+                raise
+            delay = LOCK_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.info(f"Database locked, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def _claim_once(booking, hold):
+    with transaction.atomic():
+        _lock_instructor(booking.instructor_id)
+
+        # The customer's own hold must not block the booking it protects
+        if hold is not None:
+            SlotHold.objects.filter(pk=hold.pk).delete()
+
+        duration = booking.duration or booking.package.duration
+        if not _slot_is_free(booking.instructor, booking.date, booking.time, duration):
+            raise SlotTaken()
+
+        try:
+            booking.save()
+        except ValidationError:
+            # Booking.save() runs full_clean(), which sees a claim that
+            # committed since the check above as an unavailable instructor
+            if not _slot_is_free(booking.instructor, booking.date, booking.time, duration):
+                raise SlotTaken()
+            raise
+
+        # Constraint-first check: once our row is written, any concurrent
+        # claim that slipped past the first check is visible here.
+        if not _slot_is_free(booking.instructor, booking.date, booking.time,
+                             duration, exclude_booking_id=booking.pk):
+            raise SlotTaken()
+
+
+def claim_booking(booking, hold=None):
+    """
+    Atomically save a new booking if its slot is still free.
+
+    If `hold` is given it is consumed in the same transaction. Returns the
+    saved booking or raises SlotTaken.
+    """
+    try:
+        _retry_when_locked(lambda: _claim_once(booking, hold), on_retry=lambda: _reset(booking))
+    except SlotTaken:
+        _reset(booking)
+        raise
+    except IntegrityError:
+        _reset(booking)
+        raise SlotTaken()
+    return booking
+
+
+def _reset(booking):
+    """Forget the primary key of a rolled-back insert so it can be retried"""
+    booking.pk = None
+    booking._state.adding = True
+
+
+def _place_hold_once(user, instructor, day, start_time, duration):
+    with transaction.atomic():
+        _lock_instructor(instructor.pk)
+
+        # A customer only ever holds the slot they are currently paying for
+        SlotHold.objects.filter(user=user).delete()
+
+        if not _slot_is_free(instructor, day, start_time, duration):
+            raise SlotTaken()
+
+        return SlotHold.objects.create(
+            user=user,
+            instructor=instructor,
+            date=day,
+            time=start_time,
+            duration=duration,
+            expires_at=timezone.now() + get_hold_ttl()
+        )
+
+
+def place_hold(user, instructor, day, start_time, duration):
+    """
+    Reserve a slot for `user` for the duration of checkout.
+
+    Replaces any previous hold of the same user. Returns the SlotHold or
+    raises SlotTaken.
+    """
+    previous = list(SlotHold.objects.filter(user=user).values_list('instructor_id', 'date'))
+    hold = _retry_when_locked(
+        lambda: _place_hold_once(user, instructor, day, start_time, duration)
+    )
+    _refresh_affected(previous + [(instructor.pk, day)])
+    return hold
+
+
+def release_holds(user):
+    """Drop every hold of a user, e.g. when they cancel checkout"""
+    holds = SlotHold.objects.filter(user=user)
+    affected = list(holds.values_list('instructor_id', 'date'))
+    holds.delete()
+    _refresh_affected(affected)
+
+
+def reap_expired_holds(now=None):
+    """Delete expired holds in bulk and free their inventory slots"""
+    expired = SlotHold.objects.filter(expires_at__lte=now or timezone.now())
+    affected = list(expired.order_by().values_list('instructor_id', 'date').distinct())
+    count, _ = expired.delete()
+    _refresh_affected(affected)
+    return count
+
+
+def _refresh_affected(affected):
+    dates_by_instructor = defaultdict(list)
+    for instructor_id, day in affected:
+        dates_by_instructor[instructor_id].append(day)
+    for instructor in Instructor.objects.filter(pk__in=dates_by_instructor):
+        refresh_inventory(instructor, dates_by_instructor[instructor.pk])
+
+
+def _confirm_once(pending_booking, txn_id, amount, payer_email):
+    with transaction.atomic():
+        # Concurrent confirmations of one draft queue up behind this lock
+        pending = PendingBooking.objects.select_for_update().select_related(
+            'booking', 'hold'
+        ).get(pk=pending_booking.pk)
+
+        created = pending.booking_id is None
+        if created:
+            booking = pending.to_booking()
+            booking.paypal_txn_id = txn_id or ''
+            booking.amount_paid = amount
+            booking.payment_completed = True
+            claim_booking(booking, hold=pending.hold)
+            pending.booking = booking
+            pending.hold = None
+            pending.save(update_fields=['booking', 'hold', 'updated_at'])
+        else:
+            booking = pending.booking
+
+        if txn_id:
+            transaction_record, _ = PayPalTransaction.objects.get_or_create(
+                txn_id=txn_id,
+                defaults={
+                    'booking': booking,
+                    'payment_status': 'Completed',
+                    'payment_amount': amount if amount is not None else booking.package.price,
+                    'payer_email': payer_email or booking.user.email,
+                }
+            )
+            if transaction_record.booking_id != booking.pk:
+                # Recorded for another draft since the fast path looked
+                raise TransactionMismatch()
+    return booking, created
+
+
+def confirm_paid_booking(pending_booking, txn_id=None, amount=None, payer_email=''):
+    """
+    Turn a paid PendingBooking into its confirmed Booking, idempotently.
+
+    Returns (booking, created). Repeated or concurrent calls for the same
+    draft or transaction return the existing booking with created=False
+    and write nothing, so callers only notify the customer when created
+    is True. Raises SlotTaken if the slot was lost before payment arrived,
+    after recording the transaction on the draft.
+    """
+    # Fast path for retries: a known transaction is a read, not a write
+    if txn_id:
+        known = PayPalTransaction.objects.select_related('booking').filter(txn_id=txn_id).first()
+        if known and (
+            known.booking_id == pending_booking.booking_id
+            # Confirmed concurrently since `pending_booking` was loaded
+            or PendingBooking.objects.filter(pk=pending_booking.pk, booking_id=known.booking_id).exists()
+        ):
+            return known.booking, False
+        if known:
+            # One payment cannot pay for two drafts
+            logger.error(f"Transaction {txn_id} already confirmed booking #{known.booking_id}")
+            raise TransactionMismatch()
+    if pending_booking.booking_id:
+        return pending_booking.booking, False
+
+    try:
+        return _retry_when_locked(
+            lambda: _confirm_once(pending_booking, txn_id, amount, payer_email)
+        )
+    except (SlotTaken, IntegrityError):
+        # A concurrent confirmation of the same payment won the race
+        pending_booking.refresh_from_db(fields=['booking'])
+        if pending_booking.booking_id:
+            return pending_booking.booking, False
+        if txn_id:
+            # The money was captured but the booking rolled back: keep the
+            # payment on the draft so it can be refunded or rebooked
+            PendingBooking.objects.filter(pk=pending_booking.pk).update(
+                paid_txn_id=txn_id,
+                paid_amount=amount,
+                paid_at=timezone.now(),
+            )
+        raise SlotTaken()
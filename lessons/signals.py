@@ -0,0 +1,181 @@
+"""
+Keep derived data (slot inventory, catalog and page caches, resized
+images, the search index and question suggestions) in step with
+bookings, schedules and catalog models, and confirm PayPal payments
+reported by IPN.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from paypal.standard.ipn.signals import valid_ipn_received
+from paypal.standard.models import ST_PP_COMPLETED
+
+from .availability import refresh_inventory
+from .catalog import bump_version
+from .images import IMAGE_FIELDS, generate_derivatives, get_derivatives
+from .registration_forms import FORM_BOOKING_FIELDS
+from .search import remove_object, update_object
+from .suggestions import remove_questions, update_questions
+from .models import (
+    Availability, Booking, FAQComment, Instructor, PendingBooking, RangeLocation,
+    SlotInventory, Testimonial, TrainingPackage, Weapon
+)
+from .services import SlotTaken, TransactionMismatch
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_slot(sender, instance, **kwargs):
+    """
+    Stash the slot a booking occupied before this save, in case it moves,
+    and flag its prefilled registration form for a rebuild if details
+    printed on it change.
+    """
+    instance._previous_slot = None
+    if instance.pk:
+        previous = Booking.objects.filter(pk=instance.pk).values(*FORM_BOOKING_FIELDS).first()
+        if previous:
+            instance._previous_slot = (previous['instructor_id'], previous['date'])
+            # The prefilled registration form shows these; have it rebuilt
+            if any(getattr(instance, field) != value for field, value in previous.items()):
+                instance.registration_form_version = ''
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def update_inventory_for_booking(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    refresh_inventory(instance.instructor, [instance.date])
+
+    previous = getattr(instance, '_previous_slot', None)
+    if previous and previous != (instance.instructor_id, instance.date):
+        instructor_id, previous_date = previous
+        refresh_inventory(Instructor.objects.get(pk=instructor_id), [previous_date])
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+def update_inventory_for_availability(sender, instance, **kwargs):
+    # Skip fixture loading and cascades from a deleted instructor
+    if kwargs.get('raw') or isinstance(kwargs.get('origin'), Instructor):
+        return
+    refresh_inventory(instance.instructor, [instance.date])
+
+
+@receiver(post_save, sender=Instructor)
+def update_inventory_for_instructor(sender, instance, created, **kwargs):
+    """Schedule changes affect every precomputed day of the instructor"""
+    if created or kwargs.get('raw'):
+        return
+    dates = SlotInventory.objects.filter(
+        instructor=instance,
+        date__gte=timezone.now().date()
+    ).values_list('date', flat=True)
+    refresh_inventory(instance, list(dates))
+
+
+@receiver([post_save, post_delete], sender=TrainingPackage)
+@receiver([post_save, post_delete], sender=Weapon)
+@receiver([post_save, post_delete], sender=Instructor)
+@receiver([post_save, post_delete], sender=RangeLocation)
+@receiver([post_save, post_delete], sender=Testimonial)
+@receiver([post_save, post_delete], sender=FAQComment)
+def bump_cache_version(sender, **kwargs):
+    """
+    Replace the cache version of the changed model, invalidating the
+    catalog lists and cached pages built from it.
+
+    Bumped right away so this request sees its own change, and again on
+    commit so a worker that rebuilt the list from the not yet committed
+    state cannot keep serving it.
+    """
+    bump_version(sender)
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+@receiver(post_save, sender=TrainingPackage)
+@receiver(post_save, sender=Testimonial)
+@receiver(post_save, sender=FAQComment)
+def update_search_index(sender, instance, **kwargs):
+    """Reindex a searchable object in the same transaction as its change"""
+    if kwargs.get('raw'):
+        return
+    update_object(instance)
+
+
+@receiver(post_delete, sender=TrainingPackage)
+@receiver(post_delete, sender=Testimonial)
+@receiver(post_delete, sender=FAQComment)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_object(instance)
+
+
+@receiver(post_save, sender=FAQComment)
+def update_question_suggestions(sender, instance, **kwargs):
+    """Add an approved question to the suggestions once it is committed"""
+    if kwargs.get('raw') or instance.parent_id:
+        return
+    transaction.on_commit(lambda: update_questions([instance]))
+
+
+@receiver(post_delete, sender=FAQComment)
+def remove_question_suggestion(sender, instance, **kwargs):
+    if instance.parent_id is None:
+        pk = instance.pk
+        transaction.on_commit(lambda: remove_questions([pk]))
+
+
+@receiver(post_save, sender=TrainingPackage)
+@receiver(post_save, sender=Weapon)
+@receiver(post_save, sender=Instructor)
+@receiver(post_save, sender=RangeLocation)
+def build_image_derivatives(sender, instance, **kwargs):
+    """Resize a newly uploaded image once the row pointing at it is committed"""
+    if kwargs.get('raw'):
+        return
+    image = getattr(instance, IMAGE_FIELDS[sender._meta.label])
+    if image and get_derivatives(image.name) is None:
+        name = image.name
+        transaction.on_commit(lambda: generate_derivatives(name))
+
+
+@receiver(valid_ipn_received)
+def confirm_paypal_booking(sender, **kwargs):
+    """Create the booking of a completed PayPal payment from its invoice ID"""
+    ipn = sender
+    if ipn.payment_status != ST_PP_COMPLETED:
+        return
+
+    pending_booking = PendingBooking.objects.select_related(
+        'package', 'booking'
+    ).filter(invoice_id=ipn.invoice).first()
+    if pending_booking is None:
+        logger.warning(f"IPN {ipn.txn_id} references unknown invoice {ipn.invoice}")
+        return
+
+    if ipn.receiver_email != settings.PAYPAL_RECEIVER_EMAIL or ipn.mc_gross != pending_booking.package.price:
+        logger.error(f"IPN {ipn.txn_id} does not match invoice {ipn.invoice}")
+        return
+
+    # Imported here because views pulls in forms and templates at import time
+    from .views import create_actual_booking
+    try:
+        create_actual_booking(
+            pending_booking,
+            txn_id=ipn.txn_id,
+            amount=ipn.mc_gross,
+            payer_email=ipn.payer_email
+        )
+    except SlotTaken:
+        logger.error(
+            f"Paid invoice {ipn.invoice} lost its slot before confirmation; "
+            f"transaction {ipn.txn_id} is recorded on the draft for a refund"
+        )
+    except TransactionMismatch:
+        logger.error(f"IPN {ipn.txn_id} for invoice {ipn.invoice} was already used by another booking")
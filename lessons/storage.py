@@ -0,0 +1,76 @@
+"""
+Static files storage that fingerprints and precompresses at collectstatic.
+
+ManifestStaticFilesStorage copies every file to a name containing a hash
+of its contents (style.css -> style.4f2a9c1b7e3d.css) and {% static %}
+then links the hashed name, so a changed file always gets a new URL and
+the old one can be cached forever. On top of that, text files get .gz
+and (when the brotli package is installed) .br siblings, compressed once
+at deploy time instead of on every request. StaticFilesMiddleware serves
+them.
+"""
+import gzip
+import logging
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Only text formats are worth compressing; images and fonts already are
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map', '.ico')
+
+# A compressed copy is only kept when it saves at least this fraction
+MIN_SAVING = 0.05
+
+
+def compress(data):
+    """Return {encoding: compressed bytes} for every available encoding"""
+    # mtime=0 keeps the output, and so its ETag, identical across deploys
+    encoded = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(data, quality=11)
+    return encoded
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed file names plus precompressed .gz/.br siblings"""
+
+    encoding_suffixes = {'gzip': '.gz', 'br': '.br'}
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.write_compressed(name)
+
+    def write_compressed(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        for encoding, compressed in compress(data).items():
+            path = self.path(name + self.encoding_suffixes[encoding])
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                with open(path, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path):
+                # Left over from an earlier version of the file
+                os.remove(path)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Before the first collectstatic (development, tests) nothing is
+            # hashed yet; after it, a missing file should not take the page down
+            if self.hashed_files:
+                logger.warning(f"Static file {name} is missing from the manifest")
+            return name
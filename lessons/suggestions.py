@@ -0,0 +1,422 @@
+"""
+"Already answered?" suggestions while a question is typed on the FAQ page.
+
+Many posted questions repeat one the FAQ already answers. Every static
+FAQ and every active question is turned into a TF-IDF vector: words are
+stemmed with NLTK's Porter stemmer and hashed into QUESTION_DIMENSIONS
+columns, so the vocabulary never has to be stored or grown. The vectors
+are unit length, so a dot product is their cosine similarity.
+
+The vectors sit in a float32 matrix on disk (QUESTION_INDEX_DIR), next to
+index.json listing what each row is. Each worker memory-maps the matrix
+on its first suggestion, not at import, and maps it again when index.json
+changes; the OS shares the pages between workers. index.json also keeps
+the count and highest id of the active questions it was built from, and
+every journaled save records them anew, so an index built from another
+database, or missing saves that bypassed the signals, is rebuilt.
+
+Saving a question only appends: an approved question (saved active, or
+approved in the admin) adds one row to the matrix, with the IDF weights
+of the last build, and a line to the change journal next to it; edited
+and hidden questions add a line hiding their old row. Readers replay the
+journal over index.json. Rebuilding, which refreshes the weights and
+drops hidden rows, is left to `manage.py build_question_index`; run it
+with --if-needed from cron to rebuild once REBUILD_FRACTION of the rows
+were appended.
+"""
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.urls import reverse
+from nltk.stem import PorterStemmer
+import numpy as np
+
+from .faq_content import FAQ_SECTIONS, faq_entries
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Hashed feature columns; 8 KB per question
+QUESTION_DIMENSIONS = 2 ** 11
+
+# Answers of static FAQs count for less than the question itself
+ANSWER_WEIGHT = 0.5
+
+# Cosine similarity a question needs to be suggested
+MIN_SIMILARITY = 0.3
+
+SUGGESTION_LIMIT = 5
+
+# build_question_index --if-needed rebuilds (refreshing IDF weights) once
+# this share of rows was appended
+REBUILD_FRACTION = 0.2
+MIN_REBUILD_ROWS = 50
+
+FAQ_VERSION = hashlib.sha256(json.dumps(FAQ_SECTIONS).encode()).hexdigest()[:16]
+
+STOP_WORDS = frozenset("""
+a about after all also am an and any are as at be been before being but by can could
+did do does doing for from get had has have how i if in into is it its just me my no
+not of on or our out over should so some than that the their them then there these
+they this to too up us was we were what when where which while who why will with
+would you your
+""".split())
+
+_stemmer = PorterStemmer()
+
+
+def get_index_dir():
+    return getattr(settings, 'QUESTION_INDEX_DIR', os.path.join(settings.BASE_DIR, 'question_index'))
+
+
+@lru_cache(maxsize=50000)
+def _stem(word):
+    return _stemmer.stem(word)
+
+
+def features(text, weight=1.0):
+    """{column: weighted count} of the stemmed content words of `text`"""
+    counts = {}
+    for word in tokenize(text):
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        column = zlib.crc32(_stem(word).encode()) % QUESTION_DIMENSIONS
+        counts[column] = counts.get(column, 0.0) + weight
+    return counts
+
+
+def document_features(question, answer=''):
+    counts = features(question)
+    for column, count in features(answer, ANSWER_WEIGHT).items():
+        counts[column] = counts.get(column, 0.0) + count
+    return counts
+
+
+def vectorize(counts, idf):
+    """Unit-length TF-IDF vector of `counts`, or None when nothing is left"""
+    vector = np.zeros(QUESTION_DIMENSIONS, dtype=np.float32)
+    for column, count in counts.items():
+        vector[column] = math.log1p(count) * idf[column]
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return None
+    return vector / norm
+
+
+def question_documents():
+    """(kind, id, question, answer, url) of every static FAQ and active question"""
+    from .models import FAQComment
+
+    for position, entry in enumerate(faq_entries()):
+        yield 'faq', position, entry['question'], entry['answer'], f"{reverse('faq')}#{entry['anchor']}"
+    questions = FAQComment.objects.filter(parent__isnull=True, is_active=True).order_by('pk')
+    for comment in questions.iterator(chunk_size=2000):
+        yield 'comment', comment.pk, comment.content, '', comment.get_absolute_url()
+
+
+def question_fingerprint():
+    """[count, highest id] of the active questions question_documents() indexes"""
+    from .models import FAQComment
+
+    stats = FAQComment.objects.filter(parent__isnull=True, is_active=True).aggregate(
+        count=Count('pk'), last=Max('pk')
+    )
+    return [stats['count'], stats['last'] or 0]
+
+
+# Files --------------------------------------------------------------------
+
+class _Lock:
+    """Exclusive lock across processes while the index files change"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, '.lock')
+
+    def __enter__(self):
+        self.file = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        else:
+            # Locks the first byte; LK_LOCK gives up after ten seconds
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'index.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(directory, meta):
+    # Readers only ever see a complete index.json
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    # mkstemp creates it private to this user; other workers may run as another
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, os.path.join(directory, 'index.json'))
+
+
+def _read_journal(directory, meta):
+    """Complete lines of the change journal; a line being written is skipped"""
+    try:
+        with open(os.path.join(directory, meta['journal'])) as f:
+            data = f.read()
+    except OSError:
+        return []
+    return [json.loads(line) for line in data.split('\n')[:-1]]
+
+
+def _build(directory):
+    # Taken first: a question saved meanwhile makes the index look stale, not current
+    fingerprint = question_fingerprint()
+    documents = []
+    counts = []
+    frequencies = np.zeros(QUESTION_DIMENSIONS, dtype=np.int64)
+    for kind, object_id, question, answer, url in question_documents():
+        document_counts = document_features(question, answer)
+        documents.append([kind, object_id, question, url, True])
+        counts.append(document_counts)
+        frequencies[list(document_counts)] += 1
+
+    # Smoothed IDF, as scikit-learn computes it
+    idf = np.log((1 + len(documents)) / (1 + frequencies)) + 1
+    token = uuid.uuid4().hex
+    vectors_name = f"vectors-{token}.f32"
+    with open(os.path.join(directory, vectors_name), 'wb') as f:
+        for row, document_counts in zip(documents, counts):
+            vector = vectorize(document_counts, idf)
+            if vector is None:
+                row[4] = False
+                vector = np.zeros(QUESTION_DIMENSIONS, dtype=np.float32)
+            f.write(vector.tobytes())
+
+    previous = _read_meta(directory)
+    _write_meta(directory, {
+        'faq_version': FAQ_VERSION,
+        'dimensions': QUESTION_DIMENSIONS,
+        'vectors': vectors_name,
+        'journal': f"changes-{token}.jsonl",
+        'idf': idf.tolist(),
+        'built_rows': len(documents),
+        'fingerprint': fingerprint,
+        'rows': documents,
+    })
+    if previous:
+        # Workers that mapped them keep their mapping until they reload
+        for name in (previous['vectors'], previous.get('journal')):
+            try:
+                os.remove(os.path.join(directory, name))
+            except (OSError, TypeError):
+                pass
+    return len(documents)
+
+
+def _is_current(directory, meta, check_questions=True):
+    """
+    Whether `meta` is in this version's format and, with `check_questions`,
+    indexes the questions of this database as they are now.
+    """
+    if (
+        meta is None or meta['faq_version'] != FAQ_VERSION
+        or meta['dimensions'] != QUESTION_DIMENSIONS or 'journal' not in meta
+    ):
+        return False
+    if not check_questions:
+        return True
+    fingerprint = meta.get('fingerprint')
+    for change, value in _read_journal(directory, meta):
+        if change == 'fingerprint':
+            fingerprint = value
+    return fingerprint == question_fingerprint()
+
+
+def _needs_rebuild(directory, meta):
+    if not _is_current(directory, meta):
+        return True
+    appended = sum(1 for change in _read_journal(directory, meta) if change[0] == 'add')
+    return appended > max(MIN_REBUILD_ROWS, meta['built_rows'] * REBUILD_FRACTION)
+
+
+def build_question_index(if_needed=False):
+    """
+    Rebuild the matrix from scratch; returns the number of questions, or
+    None when `if_needed` is set and not enough has changed since the last build.
+    """
+    directory = get_index_dir()
+    with _Lock(directory):
+        if if_needed and not _needs_rebuild(directory, _read_meta(directory)):
+            return None
+        return _build(directory)
+
+
+def _update(hidden, added):
+    """Journal hiding the rows of comment ids `hidden` and rows for FAQComments `added`"""
+    directory = get_index_dir()
+    with _Lock(directory):
+        meta = _read_meta(directory)
+        # The database already holds these changes, so its fingerprint cannot match yet
+        if not _is_current(directory, meta, check_questions=False):
+            # Built from scratch, these changes included, on the next suggestion
+            return
+
+        changes = [['hide', pk] for pk in sorted(hidden)]
+        idf = np.asarray(meta['idf'], dtype=np.float32)
+        vectors = []
+        for comment in added:
+            vector = vectorize(features(comment.content), idf)
+            if vector is None:
+                continue
+            vectors.append(vector.tobytes())
+            changes.append(['add', ['comment', comment.pk, comment.content, comment.get_absolute_url(), True]])
+        changes.append(['fingerprint', question_fingerprint()])
+
+        # Rows first: readers only map as many rows as the journal lists
+        with open(os.path.join(directory, meta['vectors']), 'ab') as f:
+            f.write(b''.join(vectors))
+        with open(os.path.join(directory, meta['journal']), 'a') as f:
+            f.write(''.join(json.dumps(change) + '\n' for change in changes))
+
+
+def update_questions(comments):
+    """Index approved FAQComments as they are now; edited or hidden ones lose their old row"""
+    try:
+        _update(
+            {comment.pk for comment in comments},
+            [comment for comment in comments if comment.is_active and not comment.parent_id]
+        )
+    except Exception as e:
+        # Runs after the commit; the next rebuild picks the change up
+        logger.error(f"Error updating question suggestions: {str(e)}", exc_info=True)
+
+
+def remove_questions(comment_ids):
+    try:
+        _update(set(comment_ids), [])
+    except Exception as e:
+        logger.error(f"Error updating question suggestions: {str(e)}", exc_info=True)
+
+
+# Per-worker matrix ---------------------------------------------------------
+
+class QuestionIndex:
+    """One mapping of the matrix and what its rows are"""
+
+    def __init__(self, directory, meta, stamp):
+        self.stamp = stamp
+        self.journal = meta['journal']
+        self.rows = meta['rows']
+        self.idf = np.asarray(meta['idf'], dtype=np.float32)
+        for change, value in _read_journal(directory, meta):
+            if change == 'add':
+                self.rows.append(value)
+            elif change == 'hide':
+                for row in self.rows:
+                    if row[0] == 'comment' and row[1] == value:
+                        row[4] = False
+        self.active = np.array([row[4] for row in self.rows], dtype=bool)
+        if self.rows:
+            self.matrix = np.memmap(
+                os.path.join(directory, meta['vectors']), dtype=np.float32, mode='r',
+                shape=(len(self.rows), meta['dimensions'])
+            )
+        else:
+            self.matrix = np.zeros((0, meta['dimensions']), dtype=np.float32)
+
+    def similar(self, text, limit=SUGGESTION_LIMIT, min_similarity=MIN_SIMILARITY):
+        vector = vectorize(features(text), self.idf)
+        if vector is None or not len(self.rows):
+            return []
+        # Only the columns of the query's words matter
+        columns = np.flatnonzero(vector)
+        scores = self.matrix[:, columns] @ vector[columns]
+        scores[~self.active] = 0
+        best = np.argsort(-scores)[:limit] if len(scores) <= limit else np.argpartition(-scores, limit)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {
+                'kind': self.rows[row][0],
+                'id': self.rows[row][1],
+                'question': self.rows[row][2],
+                'url': self.rows[row][3],
+                'score': round(float(scores[row]), 3),
+            }
+            for row in best if scores[row] >= min_similarity
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _stamp(directory, journal):
+    try:
+        stat = os.stat(os.path.join(directory, 'index.json'))
+    except OSError:
+        return None
+    try:
+        journal_size = os.path.getsize(os.path.join(directory, journal))
+    except OSError:
+        journal_size = 0
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino, journal_size)
+
+
+def get_question_index():
+    """This worker's QuestionIndex, mapped on first use and again after every change"""
+    global _index
+    directory = get_index_dir()
+    index = _index
+    if index is not None and index.stamp == _stamp(directory, index.journal):
+        return index
+
+    with _index_lock:
+        meta = _read_meta(directory)
+        if not _is_current(directory, meta):
+            build_question_index()
+            meta = _read_meta(directory)
+        # Taken before the journal is read, so later lines cause a reload
+        _index = QuestionIndex(directory, meta, _stamp(directory, meta['journal']))
+        return _index
+
+
+def similar_questions(text, limit=SUGGESTION_LIMIT):
+    """Already answered questions closest to `text`, best first"""
+    try:
+        return get_question_index().similar(text, limit)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error finding similar questions: {str(e)}", exc_info=True)
+        return []
@@ -0,0 +1,73 @@
+"""
+Template loader that inlines the shared email stylesheet.
+
+Mail clients mostly ignore <style> blocks, so email templates are written
+with classes from emails/email.css and this loader rewrites them into
+style="" attributes while loading the source. Wrapped in Django's cached
+loader, that happens once per template per process instead of once per
+message.
+"""
+from functools import lru_cache
+from pathlib import Path
+import re
+
+from django.template.loaders.app_directories import Loader as AppDirectoriesLoader
+
+STYLESHEET_PATH = Path(__file__).resolve().parent / 'templates' / 'emails' / 'email.css'
+
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_RULE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+_TAG = re.compile(r'<[a-zA-Z][^>]*\sclass="[^"]*"[^>]*>')
+_CLASS_ATTR = re.compile(r'\sclass="([^"]*)"')
+_STYLE_ATTR = re.compile(r'\sstyle="([^"]*)"')
+
+
+@lru_cache(maxsize=None)
+def load_stylesheet(path=STYLESHEET_PATH):
+    """Parse a stylesheet of single-class rules into {class: declarations}"""
+    css = _COMMENT.sub('', Path(path).read_text(encoding='utf-8'))
+    rules = {}
+    for selectors, body in _RULE.findall(css):
+        declarations = '; '.join(
+            part.strip() for part in body.split(';') if part.strip()
+        )
+        for selector in selectors.split(','):
+            selector = selector.strip()
+            if selector.startswith('.'):
+                existing = rules.get(selector[1:])
+                rules[selector[1:]] = f"{existing}; {declarations}" if existing else declarations
+    return rules
+
+
+def inline_css(source, rules):
+    """Replace class="..." attributes with the matching style="..." declarations"""
+    def rewrite(match):
+        tag = match.group(0)
+        classes = _CLASS_ATTR.search(tag).group(1).split()
+        declarations = [rules[name] for name in classes if name in rules]
+        tag = _CLASS_ATTR.sub('', tag, count=1)
+
+        # Inline style="" written in the template wins over class rules
+        style = _STYLE_ATTR.search(tag)
+        if style:
+            if style.group(1).strip():
+                declarations.append(style.group(1))
+            tag = _STYLE_ATTR.sub('', tag, count=1)
+        if not declarations:
+            return tag
+
+        end = -2 if tag.endswith('/>') else -1
+        return f'{tag[:end]} style="{"; ".join(declarations)}"{tag[end:]}'
+
+    return _TAG.sub(rewrite, source)
+
+
+class EmailLoader(AppDirectoriesLoader):
+    """Load emails/*.html from app directories with email.css inlined"""
+
+    def get_template_sources(self, template_name):
+        if template_name.startswith('emails/') and template_name.endswith('.html'):
+            yield from super().get_template_sources(template_name)
+
+    def get_contents(self, origin):
+        return inline_css(super().get_contents(origin), load_stylesheet())
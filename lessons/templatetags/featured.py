@@ -0,0 +1,19 @@
+from django import template
+
+from lessons.featured import FEATURED_COUNT, select_featured_packages
+
+register = template.Library()
+
+
+@register.simple_tag
+def featured_packages(count=FEATURED_COUNT):
+    """
+    A fresh random pick of active packages.
+
+    Use it inside a {% hole %} on cached pages, so every visitor gets their
+    own pick instead of the one made when the page was cached:
+
+        {% load featured %}
+        {% hole "featured_packages" %}{% featured_packages as packages %}...{% endhole %}
+    """
+    return select_featured_packages(count)
@@ -0,0 +1,55 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from lessons.images import derivative_name, get_derivatives
+
+register = template.Library()
+
+# Default `sizes`: full width on phones, a third of the page in card grids
+DEFAULT_SIZES = '(max-width: 768px) 100vw, 33vw'
+
+
+def _srcset(name, manifest, extension):
+    return ', '.join(
+        f"{default_storage.url(derivative_name(name, width, extension))} {width}w"
+        for width, height in manifest['sizes']
+    )
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=DEFAULT_SIZES, css_class='', loading='lazy'):
+    """
+    Render an uploaded image as a <picture> choosing among its resized copies.
+
+        {% load images %}
+        {% responsive_image package.image alt=package.name sizes="(max-width: 768px) 100vw, 400px" %}
+
+    Images without resized copies yet fall back to a plain <img> of the upload.
+    """
+    if not image:
+        return ''
+    manifest = get_derivatives(image.name)
+    if manifest is None:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            image.url, alt, css_class, loading
+        )
+
+    width, height = manifest['sizes'][-1]
+    fallback = 'jpg' if 'jpg' in manifest['formats'] else manifest['formats'][-1]
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        (
+            (extension, _srcset(image.name, manifest, extension), sizes)
+            for extension in manifest['formats'] if extension != fallback
+        )
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        sources,
+        default_storage.url(derivative_name(image.name, width, fallback)),
+        _srcset(image.name, manifest, fallback),
+        sizes, width, height, alt, css_class, loading
+    )
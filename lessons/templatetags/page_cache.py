@@ -0,0 +1,53 @@
+from django import template
+from django.template.base import token_kwargs
+
+from lessons.page_cache import hole_marker, is_capturing, register_hole, render_hole
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+    def __init__(self, template_name, name, nodelist, kwargs):
+        self.template_name = template_name
+        self.name = name
+        self.nodelist = nodelist
+        self.kwargs = kwargs
+        register_hole(self)
+
+    def resolve_values(self, context):
+        return {key: value.resolve(context) for key, value in self.kwargs.items()}
+
+    def render(self, context):
+        values = self.resolve_values(context)
+        if is_capturing(context):
+            return hole_marker(self, values)
+        with context.push(**values):
+            return self.nodelist.render(context)
+
+    def render_for(self, request, values):
+        return render_hole(self, request, values)
+
+
+@register.tag
+def hole(parser, token):
+    """
+    Mark per-user content of a page served from the page cache.
+
+    {% hole "nav_user" %}...{% endhole %} is left out of the cached page and
+    rendered for every request. Values the contents need from the page are
+    passed as keyword arguments and must be JSON-serialisable:
+
+        {% hole "comment_actions" comment_id=comment.id author_id=comment.user_id %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' requires a hole name")
+    name = bits[1].strip('"\'')
+    kwargs = token_kwargs(bits[2:], parser)
+    if len(kwargs) != len(bits) - 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' only takes keyword arguments after the name")
+
+    nodelist = parser.parse(('endhole',))
+    parser.delete_first_token()
+    template_name = parser.origin.template_name if parser.origin else None
+    return HoleNode(template_name, name, nodelist, kwargs)
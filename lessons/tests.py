@@ -1,17 +1,82 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
+from django.templatetags.static import static
+from django.template import Context, Template
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMultiAlternatives
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from paypal.standard.ipn.models import PayPalIPN
+from paypal.standard.ipn.signals import valid_ipn_received
+from django.core.management.base import CommandError
 from .models import (
     TrainingPackage, Weapon, Instructor, 
-    Booking, FAQComment, Testimonial, RangeLocation
+    Booking, FAQComment, Testimonial, RangeLocation, Availability,
+    SlotInventory, SlotHold, PendingBooking, PayPalTransaction, OutboundEmail
 )
 from .forms import (
     BookingForm, QuickBookingForm, FAQCommentForm,
     TestimonialForm, ContactForm, PackageFilterForm
 )
+from .catalog import bump_version, get_catalog, get_catalog_list
+from .availability import DayIntervals, get_range_availability, is_slot_available
+from .services import (
+    LOCK_RETRIES, SlotTaken, TransactionMismatch, _retry_when_locked, claim_booking, confirm_paid_booking, place_hold
+)
+from .views import handle_paypal_payment, send_contact_email
+from .featured import recent_booking_weights, select_featured_packages, weighted_sample
+from .emails import EMAIL_TEMPLATES, MAX_ATTEMPTS, build_email, queue_email, render_email
+from .reminders import send_due_reminders
+from .storage import CompressedManifestStaticFilesStorage
+from .images import derivative_name, get_derivatives
+from .documents import build_fallback_pdf, render_prefilled_form, resolve_registration_form
+from .registration_forms import build_registration_forms, registration_form_fields
+from .dashboard import PAST_PAGE_SIZE
+from .comments import COMMENT_PAGE_SIZE, comment_threads
+from .search import (
+    SEARCH_INDEX_REBUILD_INTERVAL, SEARCH_VERSION_KEY, Document, FTSIndex, InvertedIndex,
+    _rebuild_python_index, create_fts_table, document_for, fts5_available, get_python_index,
+    sync_search_index, use_fts5
+)
+from .suggestions import build_question_index
+from .query_budgets import QueryBudgetExceeded, budget_problems
+from .query_stats import record_queries
+from .template_loaders import inline_css
+from .management.commands.benchmark_email_rendering import sample_context
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from PIL import Image
+import numpy as np
+import io
+from unittest.mock import patch
+import socket
+import socketserver
+import os
+import tempfile
+import gzip
+import json
+import re
+import threading
+import time
 import datetime
 
+
+def use_temporary_question_index(test):
+    """Point QUESTION_INDEX_DIR of `test` at a directory of its own"""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    settings = override_settings(QUESTION_INDEX_DIR=directory.name)
+    settings.enable()
+    test.addCleanup(settings.disable)
+    return directory.name
+
 class ModelTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -322,4 +387,2088 @@ class BookingModelTests(TestCase):
             payment_status='pending'
         )
         self.assertIn('Booking #', str(booking))
-        self.assertIn('Test User', str(booking))
\ No newline at end of file
+        self.assertIn('Test User', str(booking))
+
+def next_weekday(weekday, min_days=7):
+    """Return the first date at least min_days ahead falling on the given weekday"""
+    day = timezone.now().date() + datetime.timedelta(days=min_days)
+    while day.weekday() != weekday:
+        day += datetime.timedelta(days=1)
+    return day
+
+
+class AvailabilityCalendarTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Test Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.monday = next_weekday(0)
+
+    def get_calendar(self, start, end):
+        return self.client.get(reverse('availability_calendar'), {
+            'instructor': self.instructor.id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+        })
+
+    def test_range_uses_constant_queries(self):
+        Booking.objects.create(
+            user=self.user,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+        )
+        # Instructor, inventory rows, then live bookings, holds and
+        # availability for the days that have not been precomputed
+        with self.assertNumQueries(5):
+            response = self.get_calendar(self.monday, self.monday + datetime.timedelta(days=59))
+        self.assertEqual(response.status_code, 200)
+        days = response.json()['days']
+        self.assertEqual(len(days), 60)
+        self.assertNotIn('10:30:00', days[self.monday.isoformat()])
+        self.assertIn('09:00:00', days[self.monday.isoformat()])
+        # Instructor does not work weekends by default
+        saturday = self.monday + datetime.timedelta(days=5)
+        self.assertEqual(days[saturday.isoformat()], [])
+
+    def test_availability_exception_closes_day(self):
+        Availability.objects.create(instructor=self.instructor, date=self.monday, is_available=False)
+        response = self.get_calendar(self.monday, self.monday)
+        self.assertEqual(response.json()['days'][self.monday.isoformat()], [])
+
+    def test_range_limit(self):
+        response = self.get_calendar(self.monday, self.monday + datetime.timedelta(days=60))
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Long Package',
+            description='Test desc',
+            price=200.00,
+            duration=120,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.monday = next_weekday(0)
+        Booking.objects.create(
+            user=self.user,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(9, 0),
+            duration=120,
+        )
+
+    def test_day_intervals_overlap(self):
+        intervals = DayIntervals([(600, 660), (540, 570)])
+        self.assertEqual(intervals.starts, [540, 600])
+        self.assertTrue(intervals.overlaps(550, 560))
+        self.assertFalse(intervals.overlaps(570, 600))
+        self.assertTrue(intervals.overlaps(570, 600, buffer=1))
+        self.assertFalse(intervals.overlaps(660, 720))
+
+    def test_long_booking_blocks_following_slot(self):
+        self.assertFalse(is_slot_available(self.instructor, self.monday, datetime.time(10, 30), 60))
+        self.assertTrue(is_slot_available(self.instructor, self.monday, datetime.time(12, 0), 60))
+        days = get_range_availability(self.instructor, self.monday, self.monday)
+        self.assertNotIn('10:30:00', days[0]['available_slots'])
+
+    @override_settings(BOOKING_BUFFER_MINUTES=15)
+    def test_buffer_time(self):
+        self.assertFalse(is_slot_available(self.instructor, self.monday, datetime.time(11, 0), 60))
+        self.assertTrue(is_slot_available(self.instructor, self.monday, datetime.time(11, 15), 60))
+
+    def test_model_rejects_overlapping_booking(self):
+        with self.assertRaises(ValidationError):
+            Booking.objects.create(
+                user=self.user,
+                package=self.package,
+                instructor=self.instructor,
+                date=self.monday,
+                time=datetime.time(10, 30),
+                duration=60,
+            )
+
+
+class InstructorScheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            available_days='0, 2,4',
+            start_time=datetime.time(10, 0),
+            end_time=datetime.time(14, 0),
+            is_active=True
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Test Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+
+    def test_compiled_schedule(self):
+        schedule = self.instructor.schedule
+        self.assertEqual(schedule.weekday_mask, 0b10101)
+        self.assertEqual(self.instructor.get_available_days_list(), [0, 2, 4])
+        self.assertEqual([value for index, minute, value in schedule.slots], ['10:30:00', '12:00:00', '13:30:00'])
+        self.assertTrue(schedule.works_weekday(next_weekday(2)))
+        self.assertFalse(schedule.works_weekday(next_weekday(1)))
+
+    def test_schedule_cached_per_version(self):
+        fetched = Instructor.objects.get(pk=self.instructor.pk)
+        self.assertIs(fetched.schedule, self.instructor.schedule)
+        fetched.available_days = '1'
+        self.assertEqual(fetched.get_available_days_list(), [1])
+        self.assertIsNot(fetched.schedule, self.instructor.schedule)
+
+    def test_booking_form_checks_schedule(self):
+        form = BookingForm(data={
+            'package': self.package.id,
+            'instructor': self.instructor.id,
+            'date': next_weekday(1),
+            'time': '10:30:00',
+            'payment_method': 'cash',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('date', form.errors)
+
+
+class SlotInventoryTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Test Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.monday = next_weekday(0)
+
+    def test_signals_maintain_inventory(self):
+        booking = Booking.objects.create(
+            user=self.user,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+        )
+        row = SlotInventory.objects.get(instructor=self.instructor, date=self.monday)
+        self.assertEqual(row.capacity[:3], [90, 0, 240])
+
+        booking.delete()
+        row.refresh_from_db()
+        self.assertEqual(row.capacity[:3], [240, 240, 240])
+
+        Availability.objects.create(instructor=self.instructor, date=self.monday, is_available=False)
+        row.refresh_from_db()
+        self.assertEqual(sum(row.capacity), 0)
+
+    def test_rebuild_command_and_single_read(self):
+        call_command('rebuild_slot_inventory', weeks=2, stdout=StringIO())
+        self.assertEqual(SlotInventory.objects.filter(instructor=self.instructor).count(), 14)
+
+        monday = timezone.now().date() + datetime.timedelta(days=7 - timezone.now().weekday())
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('availability_calendar'), {
+                'instructor': self.instructor.id,
+                'start': monday.isoformat(),
+                'end': (monday + datetime.timedelta(days=5)).isoformat(),
+            })
+        self.assertIn('09:00:00', response.json()['days'][monday.isoformat()])
+
+    def test_verify_detects_stale_rows(self):
+        call_command('rebuild_slot_inventory', weeks=1, stdout=StringIO())
+        SlotInventory.objects.filter(instructor=self.instructor).update(capacity=[0] * 7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_slot_inventory', weeks=1, verify_only=True, stdout=StringIO(), stderr=StringIO())
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Exactly one of several simultaneous claims for a slot may win"""
+    CONCURRENT_REQUESTS = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Test Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.customers = [
+            User.objects.create_user(username=f'customer{i}', password='testpass123')
+            for i in range(self.CONCURRENT_REQUESTS)
+        ]
+        self.monday = next_weekday(0)
+
+    def claim(self, customer, barrier, results):
+        booking = Booking(
+            user=customer,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+            payment_method='cash',
+        )
+        try:
+            barrier.wait()
+            claim_booking(booking)
+            results.append('won')
+        except SlotTaken:
+            results.append('taken')
+        except Exception as e:
+            results.append(repr(e))
+        finally:
+            connection.close()
+
+    def test_exactly_one_concurrent_claim_wins(self):
+        barrier = threading.Barrier(self.CONCURRENT_REQUESTS)
+        results = []
+        threads = [
+            threading.Thread(target=self.claim, args=(customer, barrier, results))
+            for customer in self.customers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('won'), 1, results)
+        self.assertEqual(results.count('taken'), self.CONCURRENT_REQUESTS - 1, results)
+        self.assertEqual(Booking.objects.filter(instructor=self.instructor, date=self.monday).count(), 1)
+
+    def test_overlapping_claim_is_rejected(self):
+        claim_booking(Booking(
+            user=self.customers[0],
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 0),
+            duration=60,
+        ))
+        late = Booking(
+            user=self.customers[1],
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+        )
+        with self.assertRaises(SlotTaken):
+            claim_booking(late)
+        self.assertIsNone(late.pk)
+
+    def test_claim_lost_after_the_check_is_slot_taken(self):
+        claim_booking(Booking(
+            user=self.customers[0],
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 0),
+            duration=60,
+        ))
+        late = Booking(
+            user=self.customers[1],
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+        )
+        # The winner commits between our check and our save
+        with patch('lessons.services._slot_is_free', side_effect=[True, False]):
+            with self.assertRaises(SlotTaken):
+                claim_booking(late)
+        self.assertIsNone(late.pk)
+
+    def test_locked_database_is_retried_outside_the_transaction(self):
+        calls = []
+
+        def locked():
+            calls.append(1)
+            raise OperationalError('database is locked')
+
+        with patch('lessons.services.time.sleep'):
+            with self.assertRaises(OperationalError):
+                with transaction.atomic():
+                    _retry_when_locked(locked)
+            self.assertEqual(len(calls), 1)
+
+            calls.clear()
+            with self.assertRaises(OperationalError):
+                _retry_when_locked(locked)
+            self.assertEqual(len(calls), LOCK_RETRIES)
+
+
+class SlotHoldTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.customer = User.objects.create_user(
+            username='customer',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Test Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.monday = next_weekday(0)
+
+    def start_checkout(self):
+        self.client.login(username='customer', password='testpass123')
+        pending = PendingBooking.objects.create(
+            invoice_id=PendingBooking.make_invoice_id(
+                self.customer.id, self.package.id, self.instructor.id,
+                self.monday, datetime.time(10, 30)
+            ),
+            user=self.customer,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+        )
+        session = self.client.session
+        session['pending_booking_invoice'] = pending.invoice_id
+        session.save()
+        return self.client.get(reverse('process_payment'))
+
+    def test_checkout_places_hold(self):
+        response = self.start_checkout()
+        self.assertEqual(response.status_code, 200)
+        hold = SlotHold.objects.get(user=self.customer)
+        self.assertEqual(PendingBooking.objects.get(user=self.customer).hold, hold)
+        self.assertFalse(is_slot_available(self.instructor, self.monday, datetime.time(10, 30), 60))
+        days = get_range_availability(self.instructor, self.monday, self.monday)
+        self.assertNotIn('10:30:00', days[0]['available_slots'])
+
+        # Someone else cannot start checkout for the same slot
+        with self.assertRaises(SlotTaken):
+            place_hold(self.user, self.instructor, self.monday, datetime.time(10, 30), 60)
+
+    def test_hold_converts_into_booking(self):
+        self.start_checkout()
+        hold = SlotHold.objects.get(user=self.customer)
+        booking = claim_booking(Booking(
+            user=self.customer,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+            status='confirmed',
+        ), hold=hold)
+        self.assertIsNotNone(booking.pk)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_reaper_frees_expired_holds(self):
+        self.start_checkout()
+        SlotHold.objects.update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertTrue(is_slot_available(self.instructor, self.monday, datetime.time(10, 30), 60))
+
+        call_command('reap_slot_holds', stdout=StringIO())
+        self.assertFalse(SlotHold.objects.exists())
+        row = SlotInventory.objects.get(instructor=self.instructor, date=self.monday)
+        self.assertEqual(row.capacity[1], 240)
+
+
+@override_settings(PAYPAL_RECEIVER_EMAIL='merchant@example.com')
+class PendingBookingTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='instructor',
+            password='testpass123'
+        )
+        self.customer = User.objects.create_user(
+            username='customer',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Test Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.monday = next_weekday(0)
+        self.client.login(username='customer', password='testpass123')
+
+    def submit_paypal_booking(self, time=datetime.time(10, 30)):
+        booking = Booking(
+            user=self.customer,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=time,
+            duration=60,
+            payment_method='paypal',
+            notes='',
+        )
+        request = RequestFactory().post('/booking/')
+        request.user = self.customer
+        request.session = self.client.session
+        handle_paypal_payment(request, booking)
+        request.session.save()
+        return request.session['pending_booking_invoice']
+
+    def send_ipn(self, invoice_id, **overrides):
+        fields = {
+            'invoice': invoice_id,
+            'txn_id': 'TXN123',
+            'payment_status': 'Completed',
+            'receiver_email': 'merchant@example.com',
+            'mc_gross': Decimal('100.00'),
+        }
+        fields.update(overrides)
+        ipn = PayPalIPN.objects.create(**fields)
+        valid_ipn_received.send(sender=ipn)
+
+    def test_draft_is_stored_in_database(self):
+        invoice_id = self.submit_paypal_booking()
+        pending = PendingBooking.objects.get(invoice_id=invoice_id)
+        self.assertEqual(pending.user, self.customer)
+
+        # Submitting the same draft again reuses the row
+        self.assertEqual(self.submit_paypal_booking(), invoice_id)
+        self.assertEqual(PendingBooking.objects.count(), 1)
+
+        response = self.client.get(reverse('process_payment'))
+        self.assertContains(response, invoice_id)
+
+    def test_ipn_confirms_booking_by_invoice(self):
+        invoice_id = self.submit_paypal_booking()
+        self.send_ipn(invoice_id)
+
+        pending = PendingBooking.objects.get(invoice_id=invoice_id)
+        self.assertIsNotNone(pending.booking)
+        self.assertEqual(pending.booking.status, 'confirmed')
+
+        response = self.client.get(reverse('payment_success'))
+        self.assertRedirects(response, reverse('booking_confirmation', args=[pending.booking_id]))
+
+    def test_ipn_with_wrong_amount_is_ignored(self):
+        invoice_id = self.submit_paypal_booking()
+        self.send_ipn(invoice_id, mc_gross=Decimal('1.00'))
+        self.assertFalse(Booking.objects.exists())
+
+    def test_js_confirmation_uses_invoice(self):
+        invoice_id = self.submit_paypal_booking()
+        response = self.client.post(
+            reverse('payment_confirm'),
+            data=json.dumps({
+                'orderID': 'ORDER1',
+                'invoice': invoice_id,
+                'details': {'status': 'COMPLETED'},
+            }),
+            content_type='application/json'
+        )
+        # The browser's report alone confirms nothing
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json()['pending'])
+        self.assertFalse(Booking.objects.exists())
+
+        self.send_ipn(invoice_id)
+        response = self.client.post(
+            reverse('payment_confirm'),
+            data=json.dumps({'orderID': 'ORDER1', 'invoice': invoice_id}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(PendingBooking.objects.get(invoice_id=invoice_id).booking_id,
+                         response.json()['booking_id'])
+
+    def test_forged_confirmation_creates_nothing(self):
+        invoice_id = self.submit_paypal_booking()
+        response = self.client.post(
+            reverse('payment_confirm'),
+            data=json.dumps({
+                'orderID': 'ORDER1',
+                'invoice': invoice_id,
+                'details': {
+                    'status': 'COMPLETED',
+                    'purchase_units': [{'payments': {'captures': [{'id': 'TXN123'}]}}],
+                },
+            }),
+            content_type='application/json'
+        )
+        self.assertNotIn('booking_id', response.json())
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(PayPalTransaction.objects.exists())
+
+        # The real IPN for that capture still confirms the draft
+        self.send_ipn(invoice_id)
+        self.assertEqual(PayPalTransaction.objects.get(txn_id='TXN123').booking,
+                         PendingBooking.objects.get(invoice_id=invoice_id).booking)
+
+    def test_repeated_confirmations_are_noops(self):
+        invoice_id = self.submit_paypal_booking()
+        self.send_ipn(invoice_id)
+        emails_queued = OutboundEmail.objects.count()
+        self.assertGreater(emails_queued, 0)
+
+        # PayPal resends the IPN and the browser confirms the same capture
+        valid_ipn_received.send(sender=PayPalIPN.objects.get())
+        for _ in range(2):
+            response = self.client.post(
+                reverse('payment_confirm'),
+                data=json.dumps({
+                    'orderID': 'ORDER1',
+                    'invoice': invoice_id,
+                    'details': {
+                        'status': 'COMPLETED',
+                        'purchase_units': [{'payments': {'captures': [{'id': 'TXN123'}]}}],
+                    },
+                }),
+                content_type='application/json'
+            )
+            self.assertTrue(response.json()['success'])
+
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(PayPalTransaction.objects.filter(txn_id='TXN123').count(), 1)
+        self.assertEqual(OutboundEmail.objects.count(), emails_queued)
+        self.assertEqual(response.json()['booking_id'], Booking.objects.get().id)
+
+    def test_known_transaction_is_read_only(self):
+        invoice_id = self.submit_paypal_booking()
+        self.send_ipn(invoice_id)
+        pending = PendingBooking.objects.get(invoice_id=invoice_id)
+
+        with self.assertNumQueries(1):
+            booking, created = confirm_paid_booking(pending, txn_id='TXN123')
+        self.assertFalse(created)
+        self.assertEqual(booking, pending.booking)
+
+    def test_payment_for_a_lost_slot_is_recorded(self):
+        invoice_id = self.submit_paypal_booking()
+        pending = PendingBooking.objects.get(invoice_id=invoice_id)
+        # Someone else booked the slot after the hold expired
+        SlotHold.objects.all().delete()
+        Booking.objects.create(
+            user=self.customer,
+            package=self.package,
+            instructor=self.instructor,
+            date=self.monday,
+            time=datetime.time(10, 30),
+            duration=60,
+            status='confirmed',
+        )
+
+        self.send_ipn(invoice_id)
+        pending.refresh_from_db()
+        self.assertIsNone(pending.booking_id)
+        self.assertEqual(pending.paid_txn_id, 'TXN123')
+        self.assertEqual(pending.paid_amount, Decimal('100.00'))
+        self.assertIsNotNone(pending.paid_at)
+
+    def test_known_transaction_cannot_confirm_another_draft(self):
+        self.send_ipn(self.submit_paypal_booking())
+        other = self.submit_paypal_booking(time=datetime.time(13, 0))
+        pending = PendingBooking.objects.get(invoice_id=other)
+
+        with self.assertRaises(TransactionMismatch):
+            confirm_paid_booking(pending, txn_id='TXN123')
+        pending.refresh_from_db()
+        self.assertIsNone(pending.booking_id)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal SMTP stand-in that records connections and messages"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.connections = 0
+        self.messages = []
+        super().__init__(('127.0.0.1', 0), LocalSMTPHandler)
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class LocalSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost ready")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply("221 bye")
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply("250 localhost")
+            elif command == 'MAIL':
+                recipients = []
+                self.reply("250 OK")
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip().strip('<>')
+                if address in self.server.rejected:
+                    self.reply("550 mailbox unavailable")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == 'DATA':
+                self.reply("354 end with .")
+                data = []
+                for raw in self.rfile:
+                    if raw.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(raw)
+                self.server.messages.append((recipients, b''.join(data)))
+                self.reply("250 queued")
+            else:
+                self.reply("250 OK")
+
+
+class OutboundEmailTests(TestCase):
+    def setUp(self):
+        self.server = LocalSMTPServer(rejected=['bounce@example.com'])
+        self.addCleanup(self.server.stop)
+        smtp_settings = override_settings(
+            EMAIL_BACKEND='lessons.mail_backends.PooledEmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.server.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        )
+        smtp_settings.enable()
+        self.addCleanup(smtp_settings.disable)
+
+    def queue(self, to='student@example.com', attachment=None):
+        email = EmailMultiAlternatives('Booking Confirmed', 'Plain text', 'range@example.com', [to])
+        email.attach_alternative('<p>HTML</p>', 'text/html')
+        if attachment:
+            email.attach('registration_form.pdf', attachment, 'application/pdf')
+        return queue_email(email)
+
+    def test_views_queue_instead_of_sending(self):
+        send_contact_email({
+            'name': 'Test User',
+            'email': 'shooter@example.com',
+            'phone': '',
+            'subject': 'Question',
+            'message': 'Do you rent ear protection?',
+        })
+        self.assertEqual(self.server.connections, 0)
+        self.assertTrue(OutboundEmail.objects.filter(status='pending').exists())
+
+    def test_worker_sends_batch_over_one_connection(self):
+        self.queue(attachment=b'%PDF-1.4 test')
+        for index in range(4):
+            self.queue(to=f'student{index}@example.com')
+
+        call_command('send_queued_emails', stdout=StringIO())
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+        recipients, data = self.server.messages[0]
+        self.assertEqual(recipients, ['student@example.com'])
+        self.assertIn(b'registration_form.pdf', data)
+
+    def test_failed_message_is_retried_with_backoff(self):
+        bounce = self.queue(to='bounce@example.com')
+        self.queue()
+
+        call_command('send_queued_emails', stdout=StringIO())
+
+        bounce.refresh_from_db()
+        self.assertEqual(bounce.status, 'pending')
+        self.assertEqual(bounce.attempts, 1)
+        self.assertGreater(bounce.next_attempt_at, timezone.now())
+        self.assertTrue(bounce.last_error)
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 1)
+
+        # Once due again it is retried until MAX_ATTEMPTS, then given up
+        for attempt in range(MAX_ATTEMPTS - 1):
+            OutboundEmail.objects.filter(pk=bounce.pk).update(next_attempt_at=timezone.now())
+            call_command('send_queued_emails', stdout=StringIO())
+        bounce.refresh_from_db()
+        self.assertEqual(bounce.status, 'failed')
+        self.assertEqual(bounce.attempts, MAX_ATTEMPTS)
+
+    def test_connection_is_reused_across_batches(self):
+        for index in range(5):
+            self.queue(to=f'student{index}@example.com')
+
+        call_command('send_queued_emails', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 5)
+
+    def test_contact_emails_share_one_send(self):
+        send_contact_email({
+            'name': 'Test User',
+            'email': 'shooter@example.com',
+            'phone': '',
+            'subject': 'Question',
+            'message': 'Do you rent ear protection?',
+        })
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+        call_command('send_queued_emails', stdout=StringIO())
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 2)
+
+    def test_unresponsive_server_times_out(self):
+        # Accepts connections but never sends the SMTP greeting
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen()
+        self.addCleanup(silent.close)
+        email = self.queue()
+
+        with override_settings(EMAIL_PORT=silent.getsockname()[1], EMAIL_CONNECT_TIMEOUT=0.5):
+            start = time.monotonic()
+            call_command('send_queued_emails', stdout=StringIO())
+            elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 5)
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+
+class EmailTemplateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='instructor',
+            first_name='Alex',
+            last_name='Coach',
+            password='testpass123'
+        )
+        self.customer = User.objects.create_user(
+            username='customer',
+            first_name='Sam',
+            last_name='Shooter',
+            email='sam@example.com',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Pistol & Safety',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=self.user,
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.booking = Booking(
+            user=self.customer,
+            package=self.package,
+            instructor=self.instructor,
+            date=datetime.date(2026, 1, 5),
+            time=datetime.time(10, 30),
+            duration=60,
+            payment_method='cash',
+            status='confirmed',
+        )
+
+    def test_every_email_template_renders_with_inlined_css(self):
+        context = sample_context()
+        for name in EMAIL_TEMPLATES:
+            text, html = render_email(name, context)
+            self.assertTrue(text.strip(), name)
+            self.assertNotIn(' class="', html, name)
+            self.assertIn('style="', html, name)
+            self.assertIn('Ready Aim Learn. All rights reserved.', html, name)
+
+    def test_booking_confirmation_content(self):
+        email = build_email('booking_confirmation', 'Subject', ['sam@example.com'], {
+            'booking': self.booking,
+            'customer_name': 'Sam Shooter',
+        })
+        html = email.alternatives[0][0]
+        self.assertIn('Pistol &amp; Safety', html)
+        self.assertIn('Monday, January 05, 2026 at 10:30 AM', html)
+        self.assertIn('Please bring cash to your lesson.', html)
+        # The text part is not HTML-escaped
+        self.assertIn('Package: Pistol & Safety', email.body)
+
+    def test_css_is_inlined_once_per_template(self):
+        context = sample_context()
+        with patch('lessons.template_loaders.inline_css', wraps=inline_css) as inliner:
+            for _ in range(3):
+                render_email('booking_cancellation', context)
+        # Templates were compiled (and inlined) at startup
+        self.assertEqual(inliner.call_count, 0)
+
+    def test_inline_css_merges_class_and_style(self):
+        rules = {'card': 'padding: 25px', 'title': 'margin: 0'}
+        html = inline_css('<td class="card title" style="color: red;"><br class="x"/>', rules)
+        self.assertEqual(html, '<td style="padding: 25px; margin: 0; color: red;"><br/>')
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.instructor = Instructor.objects.create(
+            user=User.objects.create_user(username='instructor', first_name='Alex', last_name='Coach'),
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+        self.customer = User.objects.create_user(
+            username='customer',
+            first_name='Sam',
+            last_name='Shooter',
+            email='sam@example.com',
+            password='testpass123'
+        )
+        self.package = TrainingPackage.objects.create(
+            name='Basic Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.location = RangeLocation.objects.create(name='Main Range', address='1 Range Rd')
+        self.now = timezone.make_aware(datetime.datetime(2026, 3, 10, 14, 0))
+
+    def make_bookings(self, *slots):
+        # bulk_create skips Booking.clean(), which rejects lessons less than 24h away
+        return Booking.objects.bulk_create([
+            Booking(
+                user=self.customer,
+                package=self.package,
+                instructor=self.instructor,
+                location=self.location,
+                date=day,
+                time=start,
+                duration=60,
+                status=status,
+                amount_paid=100,
+            )
+            for day, start, status in slots
+        ])
+
+    def test_reminds_confirmed_bookings_in_next_24_hours(self):
+        today, tomorrow = datetime.date(2026, 3, 10), datetime.date(2026, 3, 11)
+        due = self.make_bookings(
+            (today, datetime.time(15, 0), 'confirmed'),
+            (tomorrow, datetime.time(9, 0), 'confirmed'),
+        )
+        self.make_bookings(
+            (today, datetime.time(13, 0), 'confirmed'),   # already started
+            (tomorrow, datetime.time(14, 0), 'confirmed'),  # 24h away exactly
+            (today, datetime.time(16, 0), 'pending'),
+            (tomorrow, datetime.time(10, 0), 'cancelled'),
+        )
+
+        self.assertEqual(send_due_reminders(now=self.now), 2)
+
+        reminded = Booking.objects.filter(reminder_sent_at__isnull=False)
+        self.assertEqual(set(reminded.values_list('pk', flat=True)), {booking.pk for booking in due})
+        email = OutboundEmail.objects.order_by('pk').first()
+        self.assertEqual(email.to, ['sam@example.com'])
+        self.assertIn('Main Range', email.html_body)
+        self.assertIn('Date: Tuesday, March 10, 2026', email.body)
+
+    def test_rerun_sends_nothing_new(self):
+        self.make_bookings((datetime.date(2026, 3, 11), datetime.time(9, 0), 'confirmed'))
+
+        self.assertEqual(send_due_reminders(now=self.now), 1)
+        self.assertEqual(send_due_reminders(now=self.now), 0)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_queries_do_not_grow_with_bookings(self):
+        self.make_bookings(*[
+            (datetime.date(2026, 3, 11), datetime.time(hour, minute), 'confirmed')
+            for hour in range(8, 13)
+            for minute in (0, 15, 30, 45)
+        ])
+
+        # Per batch: joined SELECT, stamp UPDATE, claimed SELECT, outbox INSERT
+        # (plus savepoint statements); then the SELECT that finds no more rows
+        with self.assertNumQueries(7):
+            self.assertEqual(send_due_reminders(now=self.now, batch_size=50), 20)
+
+    def test_command_reports_count(self):
+        out = StringIO()
+        call_command('send_reminders', stdout=out)
+        self.assertIn('Queued 0 lesson reminders', out.getvalue())
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.package = TrainingPackage.objects.create(
+            name='Basic Package',
+            description='Test desc',
+            price=100.00,
+            duration=60,
+            is_active=True
+        )
+        self.instructor = Instructor.objects.create(
+            user=User.objects.create_user(username='instructor', first_name='Alex', last_name='Coach'),
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5,
+            is_active=True
+        )
+
+    def test_catalog_is_read_from_cache(self):
+        get_catalog('packages', 'weapons', 'instructors', 'locations')
+        with self.assertNumQueries(0):
+            catalog = get_catalog('packages', 'weapons', 'instructors', 'locations')
+            # Instructor names come with the cached objects
+            self.assertEqual(str(catalog['instructors'][0]), 'Instructor Alex Coach')
+        self.assertEqual(catalog['packages'], [self.package])
+
+    def test_save_and_delete_invalidate(self):
+        self.assertEqual(get_catalog_list('packages'), [self.package])
+
+        self.package.is_active = False
+        self.package.save()
+        self.assertEqual(get_catalog_list('packages'), [])
+
+        self.package.delete()
+        TrainingPackage.objects.create(name='Advanced Package', description='d', price=200, duration=90)
+        self.assertEqual([package.name for package in get_catalog_list('packages')], ['Advanced Package'])
+
+    def test_invalidation_goes_through_shared_cache(self):
+        get_catalog_list('packages')
+        # A change made by another worker only replaces the version token
+        TrainingPackage.objects.filter(pk=self.package.pk).update(name='Renamed Package')
+        self.assertEqual(get_catalog_list('packages')[0].name, 'Basic Package')
+
+        bump_version(TrainingPackage)
+        self.assertEqual(get_catalog_list('packages')[0].name, 'Renamed Package')
+
+    def test_booking_form_choices_and_validation_use_catalog(self):
+        get_catalog('packages', 'weapons', 'instructors', 'locations')
+        with self.assertNumQueries(0):
+            form = BookingForm()
+            html = str(form['package']) + str(form['instructor'])
+            package = form.fields['package'].clean(str(self.package.pk))
+            instructor = form.fields['instructor'].clean(str(self.instructor.pk))
+        self.assertIn('Basic Package', html)
+        self.assertEqual(package, self.package)
+        self.assertEqual(instructor, self.instructor)
+
+        form = QuickBookingForm(data={'package': 999999})
+        self.assertFalse(form.is_valid())
+        self.assertIn('package', form.errors)
+
+
+class FeaturedPackageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.packages = [
+            TrainingPackage.objects.create(
+                name=f'Package {index}',
+                description='Test desc',
+                price=100 + index,
+                duration=60,
+                is_active=True
+            )
+            for index in range(10)
+        ]
+
+    def query_plans(self, queries):
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append(' '.join(str(row[-1]) for row in cursor.fetchall()))
+        return plans
+
+    def test_selection_does_not_sort_the_table(self):
+        old = TrainingPackage.objects.filter(is_active=True).order_by('?')[:3]
+        self.assertIn('USE TEMP B-TREE FOR ORDER BY', old.explain())
+
+        with CaptureQueriesContext(connection) as cold:
+            featured = select_featured_packages()
+        with CaptureQueriesContext(connection) as warm:
+            select_featured_packages()
+
+        self.assertEqual(len(featured), 3)
+        self.assertEqual(len(set(featured)), 3)
+        # Once the id list is cached, a hit is a single primary key lookup
+        self.assertEqual(len(warm), 1)
+        for query, plan in zip(cold.captured_queries + warm.captured_queries,
+                               self.query_plans(cold.captured_queries + warm.captured_queries)):
+            self.assertNotIn('RANDOM()', query['sql'])
+            self.assertNotIn('ORDER BY', plan)
+
+    def test_exclude_and_inactive_packages(self):
+        self.packages[1].is_active = False
+        self.packages[1].save()
+        for _ in range(20):
+            picked = select_featured_packages(count=9, exclude=self.packages[0].pk)
+            self.assertEqual(
+                {package.pk for package in picked},
+                {package.pk for package in self.packages[2:]}
+            )
+
+    def test_weighted_sample_skips_zero_weights(self):
+        self.assertEqual(weighted_sample({1: 5, 2: 0, 3: 0}, 3), [1])
+
+    def test_recent_booking_weights(self):
+        user = User.objects.create_user(username='customer')
+        instructor = Instructor.objects.create(
+            user=User.objects.create_user(username='instructor'),
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5
+        )
+        Booking.objects.bulk_create([
+            Booking(
+                user=user,
+                package=self.packages[0],
+                instructor=instructor,
+                date=datetime.date(2030, 1, 7),
+                time=datetime.time(9 + hour, 0),
+                duration=60,
+                amount_paid=100,
+            )
+            for hour in range(2)
+        ])
+        weights = recent_booking_weights([package.pk for package in self.packages[:2]])
+        self.assertEqual(weights, {self.packages[0].pk: 3, self.packages[1].pk: 1})
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client(enforce_csrf_checks=True)
+        self.user = User.objects.create_user(username='shooter', password='testpass123')
+        self.other = User.objects.create_user(username='marksman', password='testpass123')
+
+    def test_page_is_rendered_once_and_served_with_user_holes(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Sign Up')
+
+        self.client.login(username='shooter', password='testpass123')
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, '<span class="user-name">shooter</span>')
+        self.assertNotContains(response, 'Sign Up')
+        self.assertNotContains(response, 'page-hole')
+        # The logout form carries this session's own CSRF token
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        self.assertEqual(
+            self.client.post(reverse('logout'), {'csrfmiddlewaretoken': token}).status_code,
+            302
+        )
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertNotContains(response, '<span class="user-name">shooter</span>')
+        self.assertContains(response, 'Sign Up')
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_featured_packages_are_picked_per_request(self):
+        packages = [
+            TrainingPackage.objects.create(
+                name=f'Package {i}', description='Desc', price=100, duration=60, is_active=True
+            )
+            for i in range(2)
+        ]
+        with patch('lessons.featured.weighted_sample', return_value=[packages[0].pk]):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Package 0')
+
+        with patch('lessons.featured.weighted_sample', return_value=[packages[1].pk]):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Package 1')
+        self.assertNotContains(response, 'Package 0')
+
+    def test_unread_query_params_share_the_cached_page(self):
+        self.client.get(reverse('packages'))
+        for junk in ('utm_source=ad', 'x=1&y=2'):
+            self.assertEqual(self.client.get(f"{reverse('packages')}?{junk}")['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(reverse('packages'), {'sort_by': 'price'})['X-Page-Cache'], 'miss')
+        response = self.client.get(reverse('packages'), {'sort_by': 'price', 'utm_source': 'ad'})
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+    def test_model_changes_invalidate_pages(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('home'))['X-Page-Cache'], 'hit')
+
+        Testimonial.objects.create(name='Sam', content='Great lesson', rating=5, is_approved=True)
+        self.assertEqual(self.client.get(reverse('home'))['X-Page-Cache'], 'miss')
+        # Pages that do not show testimonials stay cached
+        self.client.get(reverse('contact'))
+        Testimonial.objects.create(name='Kim', content='Great lesson', rating=5, is_approved=True)
+        self.assertEqual(self.client.get(reverse('contact'))['X-Page-Cache'], 'hit')
+
+    def test_comment_actions_follow_the_viewer(self):
+        comment = FAQComment.objects.create(user=self.user, content='Is ammo included?')
+        delete_url = reverse('delete_comment', args=[comment.id])
+
+        self.client.login(username='marksman', password='testpass123')
+        response = self.client.get(reverse('faq'))
+        self.assertContains(response, 'Is ammo included?')
+        self.assertNotContains(response, delete_url)
+
+        self.client.login(username='shooter', password='testpass123')
+        response = self.client.get(reverse('faq'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, delete_url)
+
+    def test_flash_messages_are_rendered_per_request(self):
+        self.client.get(reverse('legal'))
+        self.client.login(username='shooter', password='testpass123')
+        page = self.client.get(reverse('legal'))
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page.content.decode()).group(1)
+        with patch('lessons.views.send_legal_confirmation_email'):
+            self.client.post(reverse('legal'), {'terms_agreement': 'on', 'csrfmiddlewaretoken': token})
+
+        response = self.client.get(reverse('legal'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Thank you for accepting our terms and conditions!')
+        self.assertNotContains(self.client.get(reverse('legal')), 'Thank you for accepting')
+
+
+class SiteLayoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_share_layout_and_mark_their_nav_link(self):
+        for name, label in [('home', 'Home'), ('packages', 'Packages'), ('faq', 'FAQ'), ('contact', 'Contact')]:
+            response = self.client.get(reverse(name))
+            self.assertContains(response, 'lessons/css/site.css')
+            self.assertContains(response, f'lessons/css/pages/{name}.css')
+            self.assertContains(response, f'<a href="{reverse(name)}" class="active">{label}</a>', html=True)
+            self.assertEqual(response.content.decode().count('class="active"'), 1)
+            self.assertContains(response, f'href="{reverse("privacy")}"')
+            self.assertNotContains(response, '<style>')
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        self.css = 'body { color: #e8b923; }\n' * 200
+        (Path(source.name) / 'site.css').write_text(self.css)
+        (Path(source.name) / 'logo.png').write_bytes(b'\x89PNG' + b'\0' * 100)
+
+        settings = override_settings(STATIC_ROOT=root.name, STATICFILES_DIRS=[source.name], DEBUG=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.root = Path(root.name)
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        url = static('site.css')
+        self.assertRegex(url, r'^/static/site\.[0-9a-f]{12}\.css$')
+        compressed = self.root / (url[len('/static/'):] + '.gz')
+        self.assertEqual(gzip.decompress(compressed.read_bytes()).decode(), self.css)
+        # Images are not worth compressing
+        self.assertFalse(list(self.root.glob('logo*.gz')))
+
+    def test_hashed_files_are_cached_forever_and_negotiated(self):
+        url = static('site.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.css)
+        self.assertNotIn('Set-Cookie', response)
+
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(b''.join(plain.streaming_content).decode(), self.css)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+
+        revalidated = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_unhashed_names_get_a_short_max_age(self):
+        response = self.client.get('/static/logo.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+
+    def test_missing_file_falls_back_to_unhashed_name(self):
+        storage = CompressedManifestStaticFilesStorage()
+        with self.assertLogs('lessons.storage', 'WARNING'):
+            self.assertEqual(storage.url('missing.css'), '/static/missing.css')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, MEDIA_URL='/media/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, size=(1500, 1000), name='glock.png'):
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 150, 30, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_creates_resized_webp_and_jpeg(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            weapon = Weapon.objects.create(name='Glock 19', caliber='9mm', image=self.upload())
+
+        manifest = get_derivatives(weapon.image.name)
+        self.assertEqual(manifest['sizes'], [[320, 213], [640, 427], [960, 640], [1280, 853]])
+        for width, height in manifest['sizes']:
+            for extension in ('webp', 'jpg'):
+                with default_storage.open(derivative_name(weapon.image.name, width, extension)) as f:
+                    self.assertEqual(Image.open(f).size, (width, height))
+
+        html = Template(
+            '{% load images %}{% responsive_image weapon.image alt=weapon.name sizes="100vw" %}'
+        ).render(Context({'weapon': weapon}))
+        self.assertIn('<source type="image/webp" srcset="/media/weapons/glock.320w.webp 320w, ', html)
+        self.assertIn('src="/media/weapons/glock.1280w.jpg"', html)
+        self.assertIn('width="1280" height="853" alt="Glock 19"', html)
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            weapon = Weapon.objects.create(name='Ruger', caliber='.22', image=self.upload((500, 250)))
+        self.assertEqual(get_derivatives(weapon.image.name)['sizes'], [[320, 160], [500, 250]])
+
+    def test_backfill_command_resizes_existing_images(self):
+        with patch('lessons.signals.generate_derivatives'):
+            with self.captureOnCommitCallbacks(execute=True):
+                weapon = Weapon.objects.create(name='Glock 19', caliber='9mm', image=self.upload())
+        self.assertIsNone(get_derivatives(weapon.image.name))
+        html = Template('{% load images %}{% responsive_image image %}').render(Context({'image': weapon.image}))
+        self.assertIn('src="/media/weapons/glock.png"', html)
+
+        out = StringIO()
+        call_command('build_image_derivatives', workers=1, stdout=out)
+        self.assertIn('Resized 1 of 1 images', out.getvalue())
+        self.assertIsNotNone(get_derivatives(weapon.image.name))
+
+        out = StringIO()
+        call_command('build_image_derivatives', workers=1, stdout=out)
+        self.assertIn('Resized 0 of 0 images', out.getvalue())
+
+    def test_pages_render_uploads_through_resized_copies(self):
+        user = User.objects.create_user(username='luis', first_name='Luis', last_name='Valencia')
+        with self.captureOnCommitCallbacks(execute=True):
+            Instructor.objects.create(
+                user=user, bio='Patient teacher', certifications='NRA Certified',
+                years_experience=10, profile_picture=self.upload(name='luis.png')
+            )
+            TrainingPackage.objects.create(
+                name='Beginner', description='Desc', price=100, duration=60,
+                image=self.upload(name='beginner.png')
+            )
+
+        response = self.client.get(reverse('about'))
+        self.assertContains(response, '<h3 class="instructor-name">Luis Valencia</h3>')
+        self.assertContains(response, 'luis.320w.webp 320w')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'beginner.320w.webp 320w')
+
+
+class RegistrationFormTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fallback = Path(directory.name) / 'registration_form.pdf'
+        settings = override_settings(REGISTRATION_FORM_FALLBACK_PATH=str(self.fallback))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        resolve_registration_form.cache_clear()
+        self.addCleanup(resolve_registration_form.cache_clear)
+
+    def download(self, **headers):
+        response = self.client.get(reverse('download_registration_form'), **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_fallback_is_generated_once(self):
+        with patch('lessons.documents.registration_form_candidates', return_value=[]):
+            with patch('lessons.documents.build_fallback_pdf', wraps=build_fallback_pdf) as build:
+                with self.assertLogs('lessons.documents', 'WARNING'):
+                    self.assertEqual(resolve_registration_form(), str(self.fallback))
+                response, body = self.download()
+                self.download()
+        self.assertEqual(build.call_count, 1)
+        self.assertTrue(body.startswith(b'%PDF-1.4'))
+        self.assertIn(b'(Registration Form) Tj', body)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="registration_form.pdf"')
+
+    def test_validators_and_ranges(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(self.download(HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+        self.assertEqual(
+            self.download(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])[0].status_code, 304
+        )
+
+        partial, chunk = self.download(HTTP_RANGE='bytes=0-7')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(chunk, body[:8])
+        self.assertEqual(partial['Content-Range'], f'bytes 0-7/{len(body)}')
+        self.assertEqual(self.download(HTTP_RANGE='bytes=-6')[1], body[-6:])
+        self.assertEqual(self.download(HTTP_RANGE='bytes=10-')[1], body[10:])
+        self.assertEqual(self.download(HTTP_RANGE=f'bytes={len(body)}-')[0].status_code, 416)
+
+        # A stale copy gets the whole file back
+        stale, full = self.download(HTTP_RANGE='bytes=0-7', HTTP_IF_RANGE='"0-0"')
+        self.assertEqual((stale.status_code, full), (200, body))
+        resumed = self.download(HTTP_RANGE='bytes=0-7', HTTP_IF_RANGE=response['ETag'])[0]
+        self.assertEqual(resumed.status_code, 206)
+
+    def test_front_end_server_offload(self):
+        path = resolve_registration_form()
+        with override_settings(SENDFILE_HEADER='X-Sendfile'):
+            response, body = self.download()
+        self.assertEqual(response['X-Sendfile'], path)
+        self.assertEqual(body, b'')
+
+        root = os.path.dirname(os.path.dirname(path))
+        with override_settings(SENDFILE_HEADER='X-Accel-Redirect', SENDFILE_ROOT=root, SENDFILE_URL_PREFIX='/protected/'):
+            response = self.download()[0]
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected/' + os.path.relpath(path, root).replace(os.sep, '/')
+        )
+        self.assertIn('ETag', response)
+
+
+class PrefilledRegistrationFormTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.customer = User.objects.create_user(
+            username='customer', first_name='Sam', last_name='Shooter',
+            email='sam@example.com', password='testpass123'
+        )
+        instructor = Instructor.objects.create(
+            user=User.objects.create_user(username='instructor', first_name='Alex', last_name='Coach'),
+            bio='Test bio',
+            certifications='Test cert',
+            years_experience=5
+        )
+        package = TrainingPackage.objects.create(
+            name='Basic Package', description='Test desc', price=100.00, duration=60
+        )
+        self.booking = Booking.objects.create(
+            user=self.customer,
+            package=package,
+            instructor=instructor,
+            date=timezone.now().date() + datetime.timedelta(days=30),
+            time=datetime.time(10, 0),
+            duration=60,
+            status='confirmed'
+        )
+        Booking.objects.create(
+            user=self.customer,
+            package=package,
+            instructor=instructor,
+            date=timezone.now().date() + datetime.timedelta(days=31),
+            time=datetime.time(10, 0),
+            duration=60,
+            status='pending'
+        )
+
+    def download(self, booking):
+        response = self.client.get(reverse('download_registration_form'), {'booking': booking.pk})
+        return response, b''.join(response.streaming_content)
+
+    def test_confirmed_bookings_get_a_prefilled_form(self):
+        self.assertEqual(build_registration_forms(), 1)
+        self.booking.refresh_from_db()
+        self.assertRegex(self.booking.registration_form, r'^registration_forms/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(build_registration_forms(), 0)
+
+        self.client.login(username='customer', password='testpass123')
+        response, body = self.download(self.booking)
+        self.assertIn(b'(Full Name: Sam Shooter) Tj', body)
+        self.assertIn(b'(Instructor: Alex Coach) Tj', body)
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        self.assertNotIn(b'Sam Shooter', self.download(self.booking)[1])
+
+    def test_changed_booking_or_layout_is_rebuilt(self):
+        build_registration_forms()
+        self.booking.refresh_from_db()
+        first = self.booking.registration_form
+
+        self.booking.time = datetime.time(14, 0)
+        self.booking.save()
+        self.assertEqual(build_registration_forms(), 1)
+        self.booking.refresh_from_db()
+        self.assertNotEqual(self.booking.registration_form, first)
+
+        self.booking.notes = 'Left-handed'
+        self.booking.save()
+        self.assertEqual(build_registration_forms(), 0)
+
+        with patch('lessons.registration_forms.PREFILLED_VERSION', 'new-layout'):
+            self.assertEqual(build_registration_forms(), 1)
+
+    def test_identical_forms_share_a_file(self):
+        fields = registration_form_fields(self.booking)
+        self.assertEqual(render_prefilled_form(fields), render_prefilled_form(fields))
+
+    def test_non_ascii_names_stay_readable(self):
+        self.customer.first_name = 'Zoë Łucja'
+        self.customer.last_name = 'Ивановa'
+        self.customer.save()
+        fields = registration_form_fields(self.booking)
+        with default_storage.open(render_prefilled_form(fields)) as f:
+            pdf = f.read()
+        self.assertIn(b'/Encoding /WinAnsiEncoding', pdf)
+        self.assertIn(b'(Full Name: Zo\xeb Lucja Ivanova) Tj', pdf)
+        self.assertNotIn(b'?', pdf.split(b'stream')[1])
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(username='regular', password='testpass123')
+        self.instructors = [
+            Instructor.objects.create(
+                user=User.objects.create_user(username=f'coach{index}', first_name='Coach', last_name=str(index)),
+                bio='Test bio',
+                certifications='Test cert',
+                years_experience=5
+            )
+            for index in range(3)
+        ]
+        self.package = TrainingPackage.objects.create(
+            name='Basic Package', description='Test desc', price=100.00, duration=60
+        )
+        self.location = RangeLocation.objects.create(name='Main Range', address='1 Range Rd')
+        self.today = timezone.now().date()
+        self.client.login(username='regular', password='testpass123')
+
+    def make_bookings(self, past, upcoming, at=datetime.time(10, 0)):
+        days = [-offset for offset in range(1, past + 1)] + list(range(2, upcoming + 2))
+        # bulk_create skips Booking.clean(), which rejects past dates
+        return Booking.objects.bulk_create([
+            Booking(
+                user=self.customer,
+                package=self.package,
+                instructor=self.instructors[index % 3],
+                location=self.location,
+                date=self.today + datetime.timedelta(days=offset),
+                time=at,
+                duration=60,
+                status='confirmed',
+                amount_paid=100,
+            )
+            for index, offset in enumerate(days)
+        ])
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        self.make_bookings(past=2, upcoming=1)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(reverse('user_dashboard')).status_code, 200)
+
+        self.make_bookings(past=20, upcoming=8, at=datetime.time(14, 0))
+        with self.assertNumQueries(len(few.captured_queries)):
+            response = self.client.get(reverse('user_dashboard'))
+        self.assertEqual(len(response.context['upcoming_bookings']), 9)
+        self.assertEqual(len(response.context['past_bookings']), PAST_PAGE_SIZE)
+        # Session, user, the sidebar's social account and one joined booking query
+        self.assertLessEqual(len(few.captured_queries), 4)
+
+    def test_keyset_pages_cover_past_bookings_once(self):
+        self.make_bookings(past=12, upcoming=2)
+        seen = []
+        url = reverse('user_dashboard')
+        while url:
+            response = self.client.get(url)
+            self.assertEqual([b.date for b in response.context['upcoming_bookings']],
+                             sorted(b.date for b in response.context['upcoming_bookings']))
+            seen += [booking.date for booking in response.context['past_bookings']]
+            cursor = response.context['next_cursor']
+            url = f"{reverse('user_dashboard')}?before={cursor}" if cursor else None
+        expected = [self.today - datetime.timedelta(days=offset) for offset in range(1, 13)]
+        self.assertEqual(seen, expected)
+        self.assertContains(self.client.get(reverse('user_dashboard') + '?before=garbage'), 'Older Sessions')
+
+
+class QueryBudgetTests(TestCase):
+    """Every named route of lessons/urls.py against its budget in query_budgets.py"""
+
+    def setUp(self):
+        cache.clear()
+        # The walk reaches similar_questions, which builds the question index
+        use_temporary_question_index(self)
+        self.user = User.objects.create_user(username='walker', email='walker@example.com', password='testpass123')
+        self.packages = [
+            TrainingPackage.objects.create(name=f'Package {index}', description='Test desc', price=100, duration=60)
+            for index in range(4)
+        ]
+        self.instructors = [
+            Instructor.objects.create(
+                user=User.objects.create_user(username=f'coach{index}', first_name='Coach', last_name=str(index)),
+                bio='Test bio', certifications='Test cert', years_experience=5
+            )
+            for index in range(3)
+        ]
+        self.location = RangeLocation.objects.create(name='Main Range', address='1 Range Rd')
+        Weapon.objects.create(name='Glock 19', caliber='9mm', type='pistol')
+        today = timezone.now().date()
+        self.bookings = Booking.objects.bulk_create([
+            Booking(
+                user=self.user,
+                package=self.packages[index % 4],
+                instructor=self.instructors[index % 3],
+                location=self.location,
+                date=today + datetime.timedelta(days=offset),
+                time=datetime.time(10, 0),
+                duration=60,
+                status='confirmed',
+                amount_paid=100,
+            )
+            for index, offset in enumerate([-3, -2, -1, 2, 3, 4])
+        ])
+        question = FAQComment.objects.create(user=self.user, content='Question?')
+        for index in range(5):
+            FAQComment.objects.create(
+                user=User.objects.create_user(username=f'asker{index}'),
+                content=f'Reply {index}', parent=question
+            )
+            FAQComment.objects.create(
+                user=User.objects.get(username=f'asker{index}'), content=f'Question {index}?'
+            )
+        self.comment = FAQComment.objects.create(user=self.user, content='Delete me')
+        for index in range(3):
+            Testimonial.objects.create(
+                user=self.user, name='Walker', instructor=self.instructors[index], content='Great', rating=5, is_approved=True
+            )
+
+    def route_kwargs(self):
+        booking = self.bookings[-1]
+        return {
+            'package_detail': {'pk': self.packages[0].pk},
+            'booking_with_package': {'package_id': self.packages[0].pk},
+            'booking_confirmation': {'booking_id': booking.pk},
+            'booking_detail': {'booking_id': booking.pk},
+            'cancel_booking': {'booking_id': booking.pk},
+            'instructor_detail': {'pk': self.instructors[0].pk},
+            'delete_comment': {'comment_id': self.comment.pk},
+        }
+
+    def route_requests(self):
+        """(method, data, extra) of routes that a plain GET without parameters would reject"""
+        tomorrow = (timezone.now() + datetime.timedelta(days=1)).date()
+        slot_query = {'date': tomorrow.isoformat(), 'instructor_id': self.instructors[0].pk}
+        pending = PendingBooking.objects.create(
+            invoice_id='RAL-walk', user=self.user, package=self.packages[0], instructor=self.instructors[0],
+            date=tomorrow, time=datetime.time(10, 0), duration=60, booking=self.bookings[-1]
+        )
+        return {
+            'check_availability': ('post', slot_query, {}),
+            'api_check_availability': ('post', slot_query, {}),
+            'payment_confirm': (
+                'post', json.dumps({'invoice': pending.invoice_id}), {'content_type': 'application/json'}
+            ),
+            'availability_calendar': (
+                'get', {'start': tomorrow.isoformat(), 'instructor': self.instructors[0].pk}, {}
+            ),
+            # The GET confirmation page's template is missing too
+            'delete_comment': ('post', None, {}),
+        }
+
+    # Views whose template is missing from the repository; they answer 500
+    BROKEN_ROUTES = {
+        'package_detail': 'lessons/package_detail.html is missing',
+        'quick_booking': 'lessons/quick_booking.html is missing',
+        'instructor_detail': 'lessons/instructor_detail.html is missing',
+        'password_change_done': 'account/change_password_done.html is missing',
+    }
+
+    def test_named_routes_stay_within_query_budget(self):
+        from . import urls
+        kwargs = self.route_kwargs()
+        route_requests = self.route_requests()
+        names = [pattern.name for pattern in urls.urlpatterns if getattr(pattern, 'name', None)]
+        self.assertIn('home', names)
+
+        for name in dict.fromkeys(names):
+            with self.subTest(route=name):
+                if name in self.BROKEN_ROUTES:
+                    self.skipTest(self.BROKEN_ROUTES[name])
+                self.client.force_login(self.user)
+                url = reverse(name, kwargs=kwargs.get(name))
+                method, data, extra = route_requests.get(name, ('get', None, {}))
+                with record_queries() as stats:
+                    response = getattr(self.client, method)(url, data, **extra)
+                self.assertLess(response.status_code, 400, url)
+                problems = budget_problems(name, stats)
+                self.assertFalse(problems, f"{url}: {', '.join(problems)}\n{stats.report()}")
+
+    @override_settings(QUERY_BUDGET_ENABLED=True)
+    def test_middleware_reports_queries(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('user_dashboard'))
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertEqual(int(response['X-Query-Duplicates']), 0)
+        self.assertIn('X-Query-Time', response)
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_middleware_off_in_production(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('X-Query-Count', response)
+
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_STRICT=True)
+    def test_strict_mode_raises_over_budget(self):
+        with patch.dict('lessons.query_budgets.QUERY_BUDGETS', {'faq': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('faq'))
+
+    def test_repeated_statements_are_fingerprinted_together(self):
+        with record_queries() as stats:
+            for package in self.packages:
+                list(TrainingPackage.objects.filter(pk=package.pk))
+            list(TrainingPackage.objects.filter(pk__in=[p.pk for p in self.packages]))
+            list(TrainingPackage.objects.filter(pk__in=[p.pk for p in self.packages[:2]]))
+        self.assertEqual(stats.count, 6)
+        self.assertEqual(sorted(stats.repeated().values()), [2, 4])
+        self.assertEqual(stats.duplicates, 4)
+
+
+class FAQThreadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_temporary_question_index(self)
+        self.user = User.objects.create_user(username='asker', password='testpass123')
+        self.other = User.objects.create_user(username='answerer', password='testpass123')
+        start = timezone.now() - datetime.timedelta(days=30)
+        self.questions = []
+        for index in range(COMMENT_PAGE_SIZE * 2 + 3):
+            question = FAQComment.objects.create(user=self.user, content=f'Question {index}?')
+            for offset in range(2):
+                FAQComment.objects.create(user=self.other, parent=question, content=f'Answer {index}.{offset}')
+            self.questions.append(question)
+        # Spread creation times; two questions share one to exercise the id tie-break
+        for index, question in enumerate(self.questions):
+            FAQComment.objects.filter(pk=question.pk).update(
+                created_at=start + datetime.timedelta(hours=index - (index == 5))
+            )
+
+    def test_pages_cover_every_question_once(self):
+        seen = []
+        cursor = None
+        while True:
+            comments, cursor = comment_threads(cursor)
+            self.assertLessEqual(len(comments), COMMENT_PAGE_SIZE)
+            seen += [comment.pk for comment in comments]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(q.pk for q in self.questions))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_page_with_replies_loads_in_two_queries(self):
+        with self.assertNumQueries(2):
+            comments, cursor = comment_threads()
+            rendered = [(c.user.username, [r.user.username for r in c.thread_replies]) for c in comments]
+        self.assertEqual(rendered[0], ('asker', ['answerer', 'answerer']))
+
+    def test_faq_page_queries_do_not_grow_with_comments(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('faq'))
+        self.assertContains(response, 'Answer 22.1')
+        self.assertContains(response, "?before=")
+        self.assertLessEqual(len(queries.captured_queries), 3)
+
+    def test_load_more_endpoint(self):
+        self.client.login(username='answerer', password='testpass123')
+        first, cursor = comment_threads()
+        response = self.client.get(reverse('faq_comments'), {'before': cursor})
+        data = response.json()
+        self.assertEqual(len(data['comments']), COMMENT_PAGE_SIZE)
+        self.assertNotIn(first[-1].pk, [c['id'] for c in data['comments']])
+        self.assertTrue(data['next_cursor'])
+        reply = data['comments'][0]['replies'][0]
+        self.assertEqual(reply['author'], 'answerer')
+        self.assertEqual(reply['delete_url'], reverse('delete_comment', args=[reply['id']]))
+        self.assertIsNone(data['comments'][0]['delete_url'])
+        self.assertTrue(data['can_reply'])
+
+    def test_reply_to_reply_joins_the_thread(self):
+        question = self.questions[0]
+        answer = question.replies.first()
+        self.client.login(username='asker', password='testpass123')
+        self.client.post(reverse('faq'), {'content': 'Thanks!', 'parent_id': answer.pk})
+        self.assertEqual(FAQComment.objects.get(content='Thanks!').parent_id, question.pk)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='searcher', password='testpass123')
+        self.package = TrainingPackage.objects.create(
+            name='Concealed Carry Course', description='State approved permit class', price=150, duration=120
+        )
+        TrainingPackage.objects.create(
+            name='Hidden Package', description='Concealed and inactive', price=10, duration=60, is_active=False
+        )
+        self.comment = FAQComment.objects.create(user=self.user, content='Do you rent holsters for concealed carry?')
+        self.testimonial = Testimonial.objects.create(
+            user=self.user, name='Sam', content='Patient instructor, great holster advice', rating=5, is_approved=True
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse('search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(result['kind'], result['id']) for result in response.json()['results']]
+
+    def test_fts5_index_is_used_on_sqlite(self):
+        self.assertTrue(use_fts5())
+
+    def test_missing_fts5_table_is_checked_again(self):
+        with patch('lessons.search._fts5_found', False), patch('lessons.search.FTS_TABLE', 'lessons_search_later'):
+            self.assertFalse(fts5_available())
+            with connection.cursor() as cursor:
+                create_fts_table(cursor, table='lessons_search_later')
+            self.assertTrue(fts5_available())
+
+    def test_prefix_matching_and_title_ranking(self):
+        results = self.search('conceal car')
+        # Title match first; the inactive package is not indexed
+        self.assertEqual(results[:2], [('package', self.package.pk), ('comment', self.comment.pk)])
+        self.assertEqual([kind for kind, pk in results[2:]], ['faq'])
+
+    def test_static_faqs_are_searchable(self):
+        response = self.client.get(reverse('search'), {'q': 'gift certif'})
+        result = response.json()['results'][0]
+        self.assertEqual(result['kind'], 'faq')
+        self.assertEqual(result['title'], 'Do you offer gift certificates?')
+        self.assertTrue(result['url'].startswith(reverse('faq') + '#faq-do-you-offer-gift'))
+        self.assertContains(self.client.get(result['url']), 'id="faq-do-you-offer-gift-certificates"')
+
+    def test_index_follows_model_changes(self):
+        self.assertIn(('testimonial', self.testimonial.pk), self.search('holster'))
+        self.testimonial.is_approved = False
+        self.testimonial.save()
+        self.assertNotIn(('testimonial', self.testimonial.pk), self.search('holster'))
+
+        self.comment.content = 'Can I rent ear protection?'
+        self.comment.save()
+        self.assertEqual(self.search('holster'), [])
+        self.assertEqual(self.search('protect'), [('comment', self.comment.pk)] + [
+            result for result in self.search('protect') if result[0] == 'faq'
+        ])
+
+        self.package.delete()
+        self.assertNotIn(('package', self.package.pk), self.search('concealed'))
+
+
+    def test_testimonial_results_link_to_their_card(self):
+        result = next(
+            result for result in self.client.get(reverse('search'), {'q': 'holster'}).json()['results']
+            if result['kind'] == 'testimonial'
+        )
+        path, anchor = result['url'].split('#')
+        self.assertContains(self.client.get(path), f'id="{anchor}"')
+
+    def test_fts_rows_are_rewritten_in_place(self):
+        index = FTSIndex()
+        document = document_for(self.testimonial)
+        index.remove(document.key)
+        index.search(['holster'], 10)
+        index.add([document])
+        found = [(d.kind, d.object_id) for d, score in index.search(['holster'], 10)]
+        self.assertEqual(sorted(found), [('comment', self.comment.pk), ('testimonial', self.testimonial.pk)])
+        self.assertEqual(index.count(kinds={'testimonial'}), 1)
+
+    def test_admin_actions_update_the_index(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'testpass123'))
+        changelist = reverse('admin:lessons_testimonial_changelist')
+        self.client.post(changelist + '?is_approved__exact=1', {
+            'action': 'disapprove_testimonials', '_selected_action': [self.testimonial.pk]
+        })
+        self.assertNotIn(('testimonial', self.testimonial.pk), self.search('holster'))
+
+        self.client.post(changelist + '?is_approved__exact=0', {
+            'action': 'approve_testimonials', '_selected_action': [self.testimonial.pk]
+        })
+        self.assertIn(('testimonial', self.testimonial.pk), self.search('holster'))
+
+    def test_empty_and_hostile_queries(self):
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('   '), [])
+        # FTS5 syntax in the query is treated as words
+        self.assertIn(('package', self.package.pk), self.search('conceal* "carry'))
+
+    def test_search_api_runs_one_query(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse('search'), {'q': 'holster'})
+
+    @override_settings(SEARCH_BACKEND='python')
+    def test_python_index_matches_fts5_results(self):
+        queries = ['conceal car', 'holster', 'gift certif', 'instr']
+        with override_settings(SEARCH_BACKEND='fts5'):
+            expected = [sorted(self.search(query)) for query in queries]
+        sync_search_index()
+        # BM25 ties can break differently; the matches are the same
+        self.assertEqual([sorted(self.search(query)) for query in queries], expected)
+        self.assertEqual(self.search('conceal car')[0], ('package', self.package.pk))
+
+        # Updated in place by the signals once built
+        self.comment.delete()
+        self.assertNotIn(('comment', self.comment.pk), self.search('holster'))
+        FAQComment.objects.create(user=self.user, content='Holster sizes for revolvers?')
+        self.assertEqual(len([r for r in self.search('holster') if r[0] == 'comment']), 1)
+
+    @override_settings(SEARCH_BACKEND='python')
+    def test_python_index_is_rebuilt_outside_the_request(self):
+        sync_search_index()
+        index = get_python_index()
+        # Another worker changed the data a while ago
+        cache.set(SEARCH_VERSION_KEY, 'elsewhere', None)
+        index.built_at -= SEARCH_INDEX_REBUILD_INTERVAL + 1
+
+        with patch('lessons.search.threading.Thread') as thread, patch('lessons.search.all_documents') as documents:
+            self.assertIs(get_python_index(), index)
+            self.assertIs(get_python_index(), index)
+        documents.assert_not_called()
+        thread.assert_called_once_with(target=_rebuild_python_index, args=('elsewhere',), daemon=True)
+
+        with patch.object(connection, 'close'):
+            _rebuild_python_index('elsewhere')
+        rebuilt = get_python_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.version, 'elsewhere')
+        self.assertIn(('testimonial', self.testimonial.pk), self.search('holster'))
+
+    def test_inverted_index_prefixes_and_removal(self):
+        index = InvertedIndex([
+            Document('comment', 1, '', 'pistol safety basics', '/1'),
+            Document('comment', 2, 'Pistols', 'for beginners', '/2'),
+            Document('comment', 3, '', 'rifle safety', '/3'),
+        ])
+        self.assertEqual([d.object_id for d, score in index.search(['pis'], 10)], [2, 1])
+        self.assertEqual([d.object_id for d, score in index.search(['pis', 'saf'], 10)], [1])
+        self.assertEqual(index.search(['p'], 10), [])
+        index.remove(('comment', 2))
+        self.assertEqual([d.object_id for d, score in index.search(['pis'], 10)], [1])
+        self.assertNotIn('pistols', index.terms)
+
+
+class QuestionSuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = use_temporary_question_index(self)
+        self.user = User.objects.create_user(username='asker', password='testpass123')
+
+    def suggest(self, text):
+        response = self.client.get(reverse('similar_questions'), {'q': text})
+        return [(question['kind'], question['question']) for question in response.json()['questions']]
+
+    def test_static_faq_is_suggested(self):
+        suggestions = self.suggest('Are the instructors certified?')
+        self.assertEqual(suggestions[0], ('faq', 'Are your instructors certified?'))
+        # Stemming matches other forms of the same words
+        self.assertIn(('faq', 'Do you offer gift certificates?'), self.suggest('Offering a gift certificate'))
+        self.assertEqual(self.suggest('zzz qqq'), [])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_matrix_loads_lazily_and_once(self):
+        import lessons.suggestions as suggestions
+        suggestions._index = None
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'index.json')))
+        first = suggestions.get_question_index()
+        self.assertIsInstance(first.matrix, np.memmap)
+        self.assertIs(suggestions.get_question_index(), first)
+
+    def test_approved_questions_are_added_incrementally(self):
+        import lessons.suggestions as suggestions
+        suggestions.get_question_index()
+        built = json.load(open(os.path.join(self.directory, 'index.json')))['vectors']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = FAQComment.objects.create(user=self.user, content='Is there parking for trailers at the range?')
+        self.assertEqual(self.suggest('parking trailers'), [('comment', comment.content)])
+        # Appended to the same matrix and journaled rather than rebuilt
+        meta = json.load(open(os.path.join(self.directory, 'index.json')))
+        self.assertEqual(meta['vectors'], built)
+        with open(os.path.join(self.directory, meta['journal'])) as f:
+            self.assertEqual([json.loads(line)[0] for line in f], ['hide', 'add', 'fingerprint'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.content = 'Do you sell targets and ammunition boxes?'
+            comment.save()
+        self.assertEqual(self.suggest('parking trailers'), [])
+        self.assertEqual(self.suggest('sell ammunition boxes'), [('comment', comment.content)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.delete()
+        self.assertEqual(self.suggest('sell ammunition boxes'), [])
+
+    def test_saving_never_rebuilds_or_raises(self):
+        import lessons.suggestions as suggestions
+        # No index yet: saving leaves building to the first suggestion
+        with patch('lessons.suggestions._build') as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                FAQComment.objects.create(user=self.user, content='Can I bring a friend along?')
+        build.assert_not_called()
+
+        suggestions.get_question_index()
+        with patch('lessons.suggestions._build') as build, patch('lessons.suggestions.REBUILD_FRACTION', 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                FAQComment.objects.create(user=self.user, content='Is eye protection provided?')
+        build.assert_not_called()
+
+        with patch('lessons.suggestions.features', side_effect=OSError('disk full')):
+            with self.assertLogs('lessons.suggestions', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    FAQComment.objects.create(user=self.user, content='Do you have gift cards?')
+
+    def test_rebuild_if_needed(self):
+        call_command('build_question_index', stdout=StringIO())
+        out = StringIO()
+        call_command('build_question_index', if_needed=True, stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = FAQComment.objects.create(user=self.user, content='Is there parking for trailers at the range?')
+        with patch('lessons.suggestions.MIN_REBUILD_ROWS', 0), patch('lessons.suggestions.REBUILD_FRACTION', 0):
+            out = StringIO()
+            call_command('build_question_index', if_needed=True, stdout=out)
+        self.assertIn('Indexed', out.getvalue())
+        meta = json.load(open(os.path.join(self.directory, 'index.json')))
+        self.assertEqual(meta['rows'][-1][1], comment.pk)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, meta['journal'])))
+        self.assertEqual(self.suggest('parking trailers'), [('comment', comment.content)])
+
+    def test_stale_index_is_rebuilt(self):
+        import lessons.suggestions as suggestions
+        build_question_index()
+        meta_path = os.path.join(self.directory, 'index.json')
+        self.assertEqual(os.stat(meta_path).st_mode & 0o777, 0o644)
+
+        # Saved without the signals, as another database or a bulk update would
+        FAQComment.objects.bulk_create([FAQComment(user=self.user, content='Is there parking for trailers?')])
+        suggestions._index = None
+        self.assertEqual(self.suggest('parking trailers'), [('comment', 'Is there parking for trailers?')])
+        self.assertEqual(json.load(open(meta_path))['fingerprint'][0], 1)
+
+    def test_replies_are_not_suggested(self):
+        question = FAQComment.objects.create(user=self.user, content='Where do I park?')
+        with self.captureOnCommitCallbacks(execute=True):
+            FAQComment.objects.create(user=self.user, parent=question, content='Trailer lot behind the range')
+        self.assertEqual(self.suggest('trailer lot behind'), [])
+
+    def test_admin_approval_updates_matrix(self):
+        comment = FAQComment.objects.create(user=self.user, content='Can I film my lesson on video?', is_active=False)
+        build_question_index()
+        self.assertEqual(self.suggest('film lesson video'), [])
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'testpass123')
+        self.client.force_login(admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:lessons_faqcomment_changelist'), {
+                'action': 'approve_comments', '_selected_action': [comment.pk]
+            })
+        self.assertEqual(self.suggest('film lesson video'), [('comment', comment.content)])
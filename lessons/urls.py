@@ -30,6 +30,8 @@ urlpatterns = [
     # FAQ system
     path('faq/', views.faq, name='faq'),
     path('comments/delete/<int:comment_id>/', views.delete_comment, name='delete_comment'),
+    path('api/faq/comments/', views.faq_comments, name='faq_comments'),
+    path('api/faq/similar/', views.similar_questions, name='similar_questions'),
     
     # Testimonials
     path('testimonials/', views.testimonials, name='testimonials'),
@@ -65,6 +67,8 @@ urlpatterns = [
     
     # API endpoints
     path('api/check-availability/', views.check_availability, name='api_check_availability'),
+    path('api/availability/', views.availability_calendar, name='availability_calendar'),
+    path('api/search/', views.search_api, name='search'),
 ]
 
 # Error handlers
@@ -8,38 +8,45 @@ from django.core.mail import EmailMultiAlternatives, send_mail
 from django.conf import settings
 from django.utils import timezone
 from django.urls import path
-from django.http import JsonResponse
-from django.db.models import Count, Q
+from django.http import Http404, JsonResponse
+from django.core.files.storage import default_storage
+from django.db.models import Q
 from paypal.standard.forms import PayPalPaymentsForm
-from paypal.standard.models import ST_PP_COMPLETED
-from paypal.standard.ipn.models import PayPalIPN
 from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import User
 import logging
 from datetime import time as dt_time, datetime, date
+from decimal import Decimal
 from .models import (
     FAQComment, Booking, TrainingPackage, Instructor,
-    Testimonial, RangeLocation, Weapon, Availability
+    Testimonial, RangeLocation, Weapon, Availability, PendingBooking
 )
 from .forms import (
     FAQCommentForm, BookingForm, QuickBookingForm,
     TestimonialForm, ContactForm, PackageFilterForm,
     AvailabilityCheckForm
 )
+from .availability import (
+    TIME_SLOTS, MAX_RANGE_DAYS, DEFAULT_SLOT_DURATION,
+    get_range_availability, is_slot_available
+)
+from .catalog import find_in_catalog, get_catalog, get_catalog_list
+from .comments import comment_data, comment_threads, thread_root
+from .dashboard import dashboard_bookings, decode_cursor
+from .documents import REGISTRATION_FORM_NAME, file_response, resolve_registration_form
+from .emails import build_email, queue_email, queue_emails
+from .faq_content import faq_sections
+from .featured import select_featured_packages
+from .page_cache import cache_public_page
+from .search import DEFAULT_LIMIT, search
+from .suggestions import similar_questions as find_similar_questions
+from .services import (
+    SlotTaken, claim_booking, confirm_paid_booking, place_hold, release_holds
+)
 
 logger = logging.getLogger(__name__)
 
-TIME_SLOTS = [
-    ('09:00:00', '9:00 AM'),
-    ('10:30:00', '10:30 AM'),
-    ('12:00:00', '12:00 PM'),
-    ('13:30:00', '1:30 PM'),
-    ('15:00:00', '3:00 PM'),
-    ('16:30:00', '4:30 PM'),
-    ('18:00:00', '6:00 PM'),
-]
-
 def parse_date(date_input):
     if isinstance(date_input, date):
         return date_input
@@ -58,23 +65,34 @@ def parse_time(time_input):
         logger.error(f"Time parsing error: {e}")
         raise ValueError("Invalid time format")
 
+def parse_duration(duration_input):
+    """Parse a lesson length in minutes, falling back to the shortest slot"""
+    try:
+        return min(max(int(duration_input), 30), 240)
+    except (TypeError, ValueError):
+        return DEFAULT_SLOT_DURATION
+
 def get_active_resources():
-    return {
-        'packages': TrainingPackage.objects.filter(is_active=True),
-        'weapons': Weapon.objects.filter(is_active=True),
-        'instructors': Instructor.objects.filter(is_active=True),
-        'locations': RangeLocation.objects.filter(is_active=True),
-    }
+    return get_catalog('packages', 'weapons', 'instructors', 'locations')
+
+def get_catalog_object_or_404(name, pk):
+    """Active catalog object by primary key, read from the catalog cache"""
+    obj = find_in_catalog(name, pk)
+    if obj is None:
+        raise Http404(f"No active {name} entry with id {pk}")
+    return obj
 
+@cache_public_page(TrainingPackage, Testimonial)
 def home(request):
+    # Featured packages are picked per request in a hole of the template
     context = {
-        'featured_packages': TrainingPackage.objects.filter(is_active=True).order_by('?')[:3],
         'testimonials': Testimonial.objects.filter(is_approved=True).order_by('-created_at')[:4],
     }
     return render(request, 'lessons/home.html', context)
 
+@cache_public_page(TrainingPackage, query_params=(*PackageFilterForm.base_fields, 'page'))
 def packages(request):
-    packages = TrainingPackage.objects.filter(is_active=True)
+    packages = get_catalog_list('packages')
     filter_form = PackageFilterForm(request.GET)
     
     if filter_form.is_valid():
@@ -94,28 +112,28 @@ def apply_package_filters(packages, cleaned_data):
     price_range = cleaned_data.get('price_range')
     sort_by = cleaned_data.get('sort_by')
     
+    # Packages come from the catalog cache, so filter the list in Python
     if duration:
-        packages = packages.filter(duration=duration)
+        packages = [package for package in packages if package.duration == int(duration)]
     
     if price_range:
         min_price, max_price = price_range.split('-') if '-' in price_range else (price_range, None)
         if min_price:
-            packages = packages.filter(price__gte=min_price)
+            packages = [package for package in packages if package.price >= Decimal(min_price)]
         if max_price:
-            packages = packages.filter(price__lte=max_price)
+            packages = [package for package in packages if package.price <= Decimal(max_price)]
     
     if sort_by:
-        packages = packages.order_by(sort_by)
+        field = sort_by.lstrip('-')
+        packages = sorted(packages, key=lambda package: getattr(package, field), reverse=sort_by.startswith('-'))
     
     return packages
 
 def package_detail(request, pk):
-    package = get_object_or_404(TrainingPackage, pk=pk, is_active=True)
+    package = get_catalog_object_or_404('packages', pk)
     return render(request, 'lessons/package_detail.html', {
         'package': package,
-        'related_packages': TrainingPackage.objects.filter(
-            is_active=True
-        ).exclude(pk=pk).order_by('?')[:3],
+        'related_packages': select_featured_packages(exclude=package.pk),
     })
 
 def quick_booking(request):
@@ -164,17 +182,12 @@ def handle_booking_post(request, resources, min_date):
 
 def validate_booking_availability(booking):
     try:
-        if not is_instructor_available(booking.instructor, booking.date, booking.time):
-            return False
-        
-        conflicting_bookings = Booking.objects.filter(
-            date=booking.date,
-            time=booking.time,
-            instructor=booking.instructor,
-            status__in=['pending', 'confirmed']
-        ).exists()
-        
-        return not conflicting_bookings
+        return is_slot_available(
+            booking.instructor,
+            booking.date,
+            booking.time,
+            booking.duration or booking.package.duration
+        )
         
     except Exception as e:
         logger.error(f"Availability validation failed: {str(e)}", exc_info=True)
@@ -188,10 +201,13 @@ def process_booking_confirmation(request, booking):
     else:
         # For cash payments, save immediately and send email
         try:
-            booking.save()
+            claim_booking(booking)
             send_booking_confirmation(booking, request.user)
             messages.success(request, "Your booking has been confirmed!")
             return redirect('booking_confirmation', booking_id=booking.id)
+        except SlotTaken:
+            messages.error(request, "Sorry, someone just booked this time slot. Please choose another time.")
+            return redirect('booking')
         except Exception as e:
             logger.error(f"Booking confirmation failed: {str(e)}", exc_info=True)
             messages.error(request, "Failed to save your booking. Please contact support.")
@@ -199,17 +215,37 @@ def process_booking_confirmation(request, booking):
 
 def handle_paypal_payment(request, booking):
     try:
-        request.session['pending_booking'] = {
-            'package_id': booking.package.id,
-            'weapon_id': booking.weapon.id if booking.weapon else None,
-            'instructor_id': booking.instructor.id,
-            'location_id': booking.location.id if booking.location else None,
-            'date': booking.date.isoformat(),
-            'time': booking.time.isoformat(),
-            'duration': booking.duration,
-            'payment_method': 'paypal',
-            'notes': booking.notes,
-        }
+        invoice_id = PendingBooking.make_invoice_id(
+            request.user.id,
+            booking.package.id,
+            booking.instructor.id,
+            booking.date,
+            booking.time
+        )
+        existing = PendingBooking.objects.filter(
+            invoice_id=invoice_id
+        ).select_related('booking').first()
+        if existing and existing.booking and existing.booking.status != 'cancelled':
+            messages.info(request, "You have already paid for this booking.")
+            return redirect('booking_confirmation', booking_id=existing.booking_id)
+
+        # The draft lives in the database; the session only keeps its key
+        PendingBooking.objects.update_or_create(
+            invoice_id=invoice_id,
+            defaults={
+                'user': request.user,
+                'package': booking.package,
+                'weapon': booking.weapon,
+                'instructor': booking.instructor,
+                'location': booking.location,
+                'date': booking.date,
+                'time': booking.time,
+                'duration': booking.duration,
+                'notes': booking.notes,
+                'booking': None,
+            }
+        )
+        request.session['pending_booking_invoice'] = invoice_id
         return redirect('process_payment')
         
     except Exception as e:
@@ -221,7 +257,7 @@ def render_booking_form(request, package_id=None, quick_booking_date=None, resou
     initial = {}
     
     if package_id:
-        package = get_object_or_404(TrainingPackage, pk=package_id)
+        package = get_catalog_object_or_404('packages', package_id)
         initial.update({
             'package': package,
             'duration': package.duration,
@@ -252,28 +288,9 @@ def handle_invalid_form(request, form, resources, min_date):
             
     return render_booking_form_with_context(request, form, resources, min_date)
     
-def is_instructor_available(instructor, date, time):
+def is_instructor_available(instructor, date, time, duration=DEFAULT_SLOT_DURATION):
     try:
-        date_obj = parse_date(date)
-        weekday = date_obj.weekday()
-        available_days = [int(d) for d in instructor.available_days.split(',') if d.strip()]
-        if weekday not in available_days:
-            return False
-        
-        time_obj = parse_time(time)
-        if (time_obj < instructor.start_time or 
-            time_obj > instructor.end_time):
-            return False
-        
-        try:
-            availability = Availability.objects.get(
-                instructor=instructor,
-                date=date_obj
-            )
-            return availability.is_available
-        except Availability.DoesNotExist:
-            return True
-            
+        return is_slot_available(instructor, parse_date(date), parse_time(time), duration)
     except Exception as e:
         logger.error(f"Instructor availability check failed: {str(e)}", exc_info=True)
         return False
@@ -287,155 +304,16 @@ def send_booking_confirmation(booking, user=None):
         if user and hasattr(user, 'email'):
             recipients.append(user.email)
         
-        subject = f"Booking Confirmation: {booking.package.name}"
-        text_content = f"""Thank you for booking with us!
-
-Booking Details:
-Package: {booking.package.name}
-Instructor: {booking.instructor.user.get_full_name()}
-Date: {booking.date.strftime('%A, %B %d, %Y')}
-Time: {booking.time.strftime('%I:%M %p')}
-Duration: {booking.duration} minutes
-Location: {booking.location.name if booking.location else 'To be determined'}
-Total: ${booking.package.price}
-
-Payment Method: {booking.get_payment_method_display()}
-Status: {booking.get_status_display()}
-"""
-        if booking.payment_method == 'cash':
-            text_content += "\nPlease bring cash to your lesson.\n"
-        
-        text_content += "\nIf you need to cancel or reschedule, please contact us at least 24 hours in advance."
-
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Booking Confirmation</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#1a365d" style="padding: 30px; text-align: center; border-bottom: 4px solid #e53e3e;">
-                                    <h1 style="color: white; margin: 0; font-size: 28px; font-weight: 600;">🔫 Shooting Lesson Confirmation</h1>
-                                    <p style="color: #cbd5e0; margin: 10px 0 0; font-size: 16px;">Ready Aim Learn - Firearms Training</p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Greeting -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <h2 style="color: #2d3748; margin-top: 0;">Hello {user.get_full_name() if user else 'Customer'},</h2>
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Thank you for booking with Ready Aim Learn! Your shooting lesson has been confirmed with the details below.</p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Booking Details -->
-                            <tr>
-                                <td style="padding: 0 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                                        <tr>
-                                            <td bgcolor="#f8fafc" style="padding: 25px; border-radius: 8px; border-left: 5px solid #e53e3e;">
-                                                <h3 style="color: #2d3748; margin-top: 0; font-size: 20px;">📋 Lesson Details</h3>
-                                                
-                                                <table width="100%" cellpadding="8" cellspacing="0" border="0">
-                                                    <tr>
-                                                        <td width="30%" style="color: #4a5568; font-weight: 600;">Package:</td>
-                                                        <td width="70%" style="color: #2d3748;">{booking.package.name}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Instructor:</td>
-                                                        <td style="color: #2d3748;">{booking.instructor.user.get_full_name()}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Date & Time:</td>
-                                                        <td style="color: #2d3748;">{booking.date.strftime('%A, %B %d, %Y')} at {booking.time.strftime('%I:%M %p')}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Duration:</td>
-                                                        <td style="color: #2d3748;">{booking.duration} minutes</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Location:</td>
-                                                        <td style="color: #2d3748;">{booking.location.name if booking.location else 'To be determined'}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Total:</td>
-                                                        <td style="color: #2d3748; font-weight: 600; color: #2b6cb0;">${booking.package.price}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Payment Method:</td>
-                                                        <td style="color: #2d3748;">{booking.get_payment_method_display()}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Status:</td>
-                                                        <td style="color: #38a169; font-weight: 600;">{booking.get_status_display()}</td>
-                                                    </tr>
-                                                </table>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Important Notes -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <div style="background-color: #fffbeb; padding: 20px; border-radius: 8px; border-left: 5px solid #d69e2e;">
-                                        <h3 style="color: #744210; margin-top: 0; font-size: 18px;">⚠️ Important Information</h3>
-                                        <p style="color: #744210; margin: 0; line-height: 1.6;">
-                                            Please arrive <strong>15 minutes early</strong> for safety briefing and equipment setup.
-                                            { 'Please bring cash to your lesson.' if booking.payment_method == 'cash' else '' }
-                                            If you need to cancel or reschedule, please contact us at least 24 hours in advance.
-                                        </p>
-                                    </div>
-                                </td>
-                            </tr>
-                            
-                            <!-- Contact Info -->
-                            <tr>
-                                <td style="padding: 0 30px 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#edf2f7" style="border-radius: 8px;">
-                                        <tr>
-                                            <td style="padding: 20px; text-align: center;">
-                                                <p style="color: #4a5568; margin: 0; font-weight: 600;">Questions? Contact us at:</p>
-                                                <p style="color: #2b6cb0; margin: 8px 0; font-size: 18px; font-weight: 600;">support@readyaimlearn.com</p>
-                                                <p style="color: #4a5568; margin: 0;">(555) 123-4567</p>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 25px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0 0 10px;">© {datetime.now().year} Ready Aim Learn. All rights reserved.</p>
-                                    <p style="margin: 0; font-size: 12px;">123 Shooting Range Rd, Firearm City, FC 12345</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients
+        email = build_email(
+            'booking_confirmation',
+            f"Booking Confirmation: {booking.package.name}",
+            recipients,
+            {
+                'booking': booking,
+                'customer_name': user.get_full_name() if user else 'Customer',
+            }
         )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
+        queue_email(email)
             
     except Exception as e:
         logger.error(f"Failed to send booking confirmation: {str(e)}", exc_info=True)
@@ -443,341 +321,95 @@ Status: {booking.get_status_display()}
 def send_contact_email(form_data):
     """Send email for contact form submissions"""
     try:
-        subject = f"New Contact Form Submission from {form_data['name']}"
-        
-        text_content = f"""
-        Name: {form_data['name']}
-        Email: {form_data['email']}
-        Phone: {form_data.get('phone', 'Not provided')}
-        
-        Message:
-        {form_data['message']}
-        """
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Contact Form Submission</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#2c5282" style="padding: 30px; text-align: center;">
-                                    <h1 style="color: white; margin: 0; font-size: 24px; font-weight: 600;">📧 New Contact Form Submission</h1>
-                                </td>
-                            </tr>
-                            
-                            <!-- Content -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <p style="color: #4a5568; font-size: 16px; margin-top: 0;">A visitor has submitted the contact form on your website. Here are the details:</p>
-                                    
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f8fafc" style="border-radius: 8px; padding: 20px;">
-                                        <tr>
-                                            <td width="30%" style="color: #4a5568; font-weight: 600; padding: 8px 0;">Name:</td>
-                                            <td width="70%" style="color: #2d3748; padding: 8px 0;">{form_data['name']}</td>
-                                        </tr>
-                                        <tr>
-                                            <td style="color: #4a5568; font-weight: 600; padding: 8px 0;">Email:</td>
-                                            <td style="color: #2b6cb0; padding: 8px 0;">{form_data['email']}</td>
-                                        </tr>
-                                        <tr>
-                                            <td style="color: #4a5568; font-weight: 600; padding: 8px 0;">Phone:</td>
-                                            <td style="color: #2d3748; padding: 8px 0;">{form_data.get('phone', 'Not provided')}</td>
-                                        </tr>
-                                    </table>
-                                    
-                                    <h3 style="color: #2d3748; margin: 25px 0 15px; font-size: 18px;">Message Content:</h3>
-                                    <div style="background-color: #edf2f7; padding: 20px; border-radius: 8px; border-left: 4px solid #2c5282;">
-                                        <p style="color: #4a5568; margin: 0; line-height: 1.6; font-style: italic;">{form_data['message']}</p>
-                                    </div>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 20px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0;">© {datetime.now().year} Ready Aim Learn. All rights reserved.</p>
-                                    <p style="margin: 10px 0 0; font-size: 12px;">This message was sent from the contact form on your website.</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-        
         # Send to both admin emails
         recipients = ["vviiddaa2@gmail.com", "luisdavid313@gmail.com"]
         
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients
+        email = build_email(
+            'contact',
+            f"New Contact Form Submission from {form_data['name']}",
+            recipients,
+            {'form_data': form_data}
         )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
         
-        # Send confirmation to the user who submitted the form
-        send_contact_confirmation_email(form_data)
+        # Queue the notification together with the confirmation to the user
+        # who submitted the form, so both go out in one send_messages() call
+        queue_emails([email, build_contact_confirmation_email(form_data)])
             
     except Exception as e:
         logger.error(f"Failed to send contact email: {str(e)}", exc_info=True)
 
-def send_contact_confirmation_email(form_data):
-    """Send confirmation email to the user who submitted the contact form"""
-    try:
-        subject = "Thank you for contacting Ready Aim Learn"
-        
-        text_content = f"""
-        Hi {form_data['name']},
-        
-        Thank you for reaching out to us! We've received your message and will get back to you within 24 hours.
-        
-        Here's a copy of your message:
-        {form_data['message']}
-        
-        If you have any urgent questions, please call us at (555) 123-4567.
-        
-        Best regards,
-        The Ready Aim Learn Team
-        """
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Thank You for Contacting Us</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#38a169" style="padding: 30px; text-align: center;">
-                                    <h1 style="color: white; margin: 0; font-size: 24px; font-weight: 600;">✉️ Thank You for Contacting Us</h1>
-                                </td>
-                            </tr>
-                            
-                            <!-- Content -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <h2 style="color: #2d3748; margin-top: 0;">Hello {form_data['name']},</h2>
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Thank you for reaching out to Ready Aim Learn! We've received your message and will get back to you within 24 hours.</p>
-                                    
-                                    <div style="background-color: #f0fff4; padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #38a169;">
-                                        <h3 style="color: #2f855a; margin-top: 0; font-size: 18px;">Your Message:</h3>
-                                        <p style="color: #2d3748; margin: 0; line-height: 1.6; font-style: italic;">{form_data['message']}</p>
-                                    </div>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">If you have any urgent questions, please call us at <strong style="color: #2b6cb0;">(555) 123-4567</strong>.</p>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Best regards,<br><strong>The Ready Aim Learn Team</strong></p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Contact Info -->
-                            <tr>
-                                <td style="padding: 0 30px 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#e6fffa" style="border-radius: 8px;">
-                                        <tr>
-                                            <td style="padding: 15px; text-align: center;">
-                                                <p style="color: #234e52; margin: 0; font-size: 14px;">📍 123 Shooting Range Rd, Firearm City, FC 12345</p>
-                                                <p style="color: #234e52; margin: 5px 0 0; font-size: 14px;">📞 (555) 123-4567 | ✉️ info@readyaimlearn.com</p>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 20px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0;">© {datetime.now().year} Ready Aim Learn. All rights reserved.</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-        
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            [form_data['email']]
-        )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
-            
-    except Exception as e:
-        logger.error(f"Failed to send contact confirmation email: {str(e)}", exc_info=True)
+def build_contact_confirmation_email(form_data):
+    """Build the confirmation email for the user who submitted the contact form"""
+    return build_email(
+        'contact_confirmation',
+        "Thank you for contacting Ready Aim Learn",
+        [form_data['email']],
+        {'form_data': form_data}
+    )
 
 def send_registration_email(user):
     """Send welcome email after user registration"""
     try:
-        subject = "Welcome to Ready Aim Learn!"
-        
-        text_content = f"""
-        Hi {user.get_full_name() or user.username},
-        
-        Welcome to Ready Aim Learn! Your account has been successfully created.
-        
-        With your account, you can:
-        - Book shooting lessons online
-        - View your upcoming lessons
-        - Manage your booking history
-        - Update your profile information
-        
-        If you have any questions, don't hesitate to contact us.
-        
-        Happy shooting!
-        
-        The Ready Aim Learn Team
-        """
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Welcome to Ready Aim Learn</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#3182ce" style="padding: 30px; text-align: center;">
-                                    <h1 style="color: white; margin: 0; font-size: 28px; font-weight: 600;">🎯 Welcome to Ready Aim Learn!</h1>
-                                </td>
-                            </tr>
-                            
-                            <!-- Content -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <h2 style="color: #2d3748; margin-top: 0;">Hi {user.get_full_name() or user.username},</h2>
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Welcome to Ready Aim Learn! Your account has been successfully created and you're now part of our firearms training community.</p>
-                                    
-                                    <div style="background-color: #ebf8ff; padding: 25px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #3182ce;">
-                                        <h3 style="color: #2c5282; margin-top: 0; font-size: 20px;">What you can do with your account:</h3>
-                                        <table width="100%" cellpadding="10" cellspacing="0" border="0">
-                                            <tr>
-                                                <td width="10%" valign="top" style="color: #3182ce; font-size: 18px;">📅</td>
-                                                <td width="90%" style="color: #2d3748;">Book shooting lessons online</td>
-                                            </tr>
-                                            <tr>
-                                                <td valign="top" style="color: #3182ce; font-size: 18px;">👁️</td>
-                                                <td style="color: #2d3748;">View your upcoming lessons</td>
-                                            </tr>
-                                            <tr>
-                                                <td valign="top" style="color: #3182ce; font-size: 18px;">📋</td>
-                                                <td style="color: #2d3748;">Manage your booking history</td>
-                                            </tr>
-                                            <tr>
-                                                <td valign="top" style="color: #3182ce; font-size: 18px;">👤</td>
-                                                <td style="color: #2d3748;">Update your profile information</td>
-                                            </tr>
-                                        </table>
-                                    </div>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">If you have any questions, don't hesitate to contact our support team.</p>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Happy shooting!<br><strong>The Ready Aim Learn Team</strong></p>
-                                </td>
-                            </tr>
-                            
-                            <!-- CTA Button -->
-                            <tr>
-                                <td style="padding: 0 30px 30px; text-align: center;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                                        <tr>
-                                            <td align="center">
-                                                <a href="{settings.SITE_URL}/packages" style="background-color: #3182ce; color: white; padding: 14px 28px; text-decoration: none; border-radius: 6px; font-weight: 600; display: inline-block; font-size: 16px;">Browse Training Packages</a>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 20px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0;">© {datetime.now().year} Ready Aim Learn. All rights reserved.</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-        
         # Send to both admin emails and the new user
         recipients = ["vviiddaa2@gmail.com", "luisdavid313@gmail.com", user.email]
         
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients
+        email = build_email(
+            'registration',
+            "Welcome to Ready Aim Learn!",
+            recipients,
+            {
+                'customer_name': user.get_full_name() or user.username,
+                'packages_url': f"{settings.SITE_URL}/packages",
+            }
         )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
+        queue_email(email)
             
     except Exception as e:
         logger.error(f"Failed to send registration email: {str(e)}", exc_info=True)
 
 
 
+def get_pending_booking(request, invoice_id=None):
+    """Return the current user's PendingBooking for an invoice ID (default: the session's)"""
+    invoice_id = invoice_id or request.session.get('pending_booking_invoice')
+    if not invoice_id:
+        return None
+    return PendingBooking.objects.select_related(
+        'package', 'instructor', 'booking'
+    ).filter(invoice_id=invoice_id, user=request.user).first()
+
 @login_required
 def process_payment(request):
-    pending_booking = request.session.get('pending_booking')
+    pending_booking = get_pending_booking(request)
     if not pending_booking:
         messages.error(request, "No booking found to process payment.")
         return redirect('packages')
     
     try:
-        booking_data = {
-            'date': parse_date(pending_booking['date']),
-            'time': parse_time(pending_booking['time']),
-            'package_id': pending_booking['package_id'],
-            'instructor_id': pending_booking['instructor_id'],
-            'location_id': pending_booking.get('location_id'),
-            'weapon_id': pending_booking.get('weapon_id'),
-            'duration': pending_booking['duration'],
-            'payment_method': 'paypal',
-            'notes': pending_booking['notes'],
-        }
-
-        package = get_object_or_404(TrainingPackage, id=booking_data['package_id'])
+        package = pending_booking.package
+        
+        # Keep the slot reserved while the customer is in PayPal
+        try:
+            hold = place_hold(
+                request.user,
+                pending_booking.instructor,
+                pending_booking.date,
+                pending_booking.time,
+                pending_booking.duration
+            )
+        except SlotTaken:
+            pending_booking.delete()
+            del request.session['pending_booking_invoice']
+            messages.error(request, "Sorry, this time slot was just taken. Please choose another time.")
+            return redirect('booking')
+        pending_booking.hold = hold
+        pending_booking.save(update_fields=['hold', 'updated_at'])
         
         paypal_dict = {
             "business": settings.PAYPAL_RECEIVER_EMAIL,
             "amount": str(package.price),
             "item_name": f"Training: {package.name}",
-            "invoice": f"booking-{timezone.now().timestamp()}",
+            "invoice": pending_booking.invoice_id,
             "currency_code": "USD",
             "notify_url": request.build_absolute_uri(reverse('paypal-ipn')),
             "return_url": request.build_absolute_uri(reverse('payment_success')),
@@ -791,6 +423,7 @@ def process_payment(request):
             'package': package,
             'paypal_form': paypal_form,
             'pending_booking': pending_booking,
+            'hold_expires_at': hold.expires_at,
             'paypal_amount': package.price,
             "PAYPAL_CLIENT_ID": settings.PAYPAL_CLIENT_ID,
         }
@@ -805,24 +438,13 @@ def process_payment(request):
 @login_required
 def payment_success(request):
     try:
-        # Check for successful PayPal payment
-        latest_ipn = PayPalIPN.objects.filter(
-            payment_status="Completed",
-            custom=str(request.user.id)
-        ).order_by('-created_at').first()
-        
-        if latest_ipn:
-            pending_booking = request.session.get('pending_booking')
-            if pending_booking:
-                # Create the actual booking in database
-                booking = create_actual_booking(request.user, pending_booking)
-                
-                # Clear the pending booking from session
-                if 'pending_booking' in request.session:
-                    del request.session['pending_booking']
-                
-                messages.success(request, "Payment successful! Your booking has been confirmed.")
-                return redirect('booking_confirmation', booking_id=booking.id)
+        # The IPN callback or the JS confirmation may already have turned
+        # the draft into a booking
+        pending_booking = get_pending_booking(request, request.GET.get('invoice'))
+        if pending_booking and pending_booking.booking_id:
+            request.session.pop('pending_booking_invoice', None)
+            messages.success(request, "Payment successful! Your booking has been confirmed.")
+            return redirect('booking_confirmation', booking_id=pending_booking.booking_id)
         
         messages.warning(request, "Your payment was successful but we're processing your booking. You'll receive a confirmation email shortly.")
         return redirect('user_dashboard')
@@ -834,46 +456,36 @@ def payment_success(request):
 
 @login_required
 def payment_cancel(request):
+    release_holds(request.user)
     messages.warning(request, "Your payment was canceled. You can try again or choose another payment method.")
     return redirect('booking')
 
 @login_required
 def booking_confirmation(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = get_object_or_404(
+        Booking.objects.select_related('package', 'instructor__user', 'location'),
+        id=booking_id, user=request.user
+    )
     return render(request, 'booking/confirmation.html', {'booking': booking})
 
-def create_actual_booking(user, booking_data):
-    """Create an actual booking record in the database"""
-    package = get_object_or_404(TrainingPackage, id=booking_data['package_id'])
-    instructor = get_object_or_404(Instructor, id=booking_data['instructor_id'])
-    
-    # Handle optional fields
-    location = None
-    if booking_data.get('location_id'):
-        location = get_object_or_404(RangeLocation, id=booking_data['location_id'])
-    
-    weapon = None
-    if booking_data.get('weapon_id'):
-        weapon = get_object_or_404(Weapon, id=booking_data['weapon_id'])
-    
-    # Create the booking
-    booking = Booking.objects.create(
-        user=user,
-        package=package,
-        weapon=weapon,
-        instructor=instructor,
-        location=location,
-        date=parse_date(booking_data['date']),
-        time=parse_time(booking_data['time']),
-        duration=booking_data['duration'],
-        payment_method='paypal',
-        notes=booking_data.get('notes', ''),
-        status='confirmed',
-        payment_status='completed',
+def create_actual_booking(pending_booking, txn_id=None, amount=None, payer_email=''):
+    """
+    Turn a paid PendingBooking into a confirmed Booking.
+
+    Safe to call from every confirmation path: repeated calls return the
+    existing booking and only the first one sends the confirmation email.
+    """
+    # Claim the slot; raises SlotTaken if someone booked it during checkout
+    booking, created = confirm_paid_booking(
+        pending_booking,
+        txn_id=txn_id,
+        amount=amount,
+        payer_email=payer_email
     )
     
     # Send confirmation email
-    send_booking_confirmation(booking, user)
+    if created:
+        send_booking_confirmation(booking, pending_booking.user)
     
     return booking
 def check_availability(request):
@@ -890,33 +502,20 @@ def check_availability(request):
                         'error': 'Instructor not specified'
                     }, status=400)
                 
-                try:
-                    instructor = Instructor.objects.get(id=instructor_id)
-                except Instructor.DoesNotExist:
+                instructor = find_in_catalog('instructors', instructor_id)
+                if instructor is None:
                     return JsonResponse({
                         'success': False, 
                         'error': 'Invalid instructor'
                     }, status=400)
                 
-                existing_bookings = Booking.objects.filter(
-                    date=date_obj,
-                    instructor=instructor,
-                    status__in=['pending', 'confirmed']
-                ).values_list('time', flat=True)
-                
-                available_slots = []
-                for slot_value, slot_display in TIME_SLOTS:
-                    if slot_value not in existing_bookings:
-                        try:
-                            slot_time = parse_time(slot_value)
-                            if (slot_time >= instructor.start_time and 
-                                slot_time <= instructor.end_time):
-                                available_slots.append({
-                                    'value': slot_value,
-                                    'display': slot_display
-                                })
-                        except ValueError:
-                            continue
+                slot_labels = dict(TIME_SLOTS)
+                duration = parse_duration(request.POST.get('duration'))
+                day = get_range_availability(instructor, date_obj, date_obj, duration=duration)[0]
+                available_slots = [
+                    {'value': value, 'display': slot_labels[value]}
+                    for value in day['available_slots']
+                ]
                 
                 return JsonResponse({
                     'success': True,
@@ -938,14 +537,65 @@ def check_availability(request):
         'error': 'Invalid request method'
     }, status=405)
 
+def availability_calendar(request):
+    """Return slot availability for one instructor over a date range (max 60 days)"""
+    if request.method != 'GET':
+        return JsonResponse({
+            'success': False, 
+            'error': 'Invalid request method'
+        }, status=405)
+    
+    try:
+        start_date = parse_date(request.GET.get('start'))
+        end_date = parse_date(request.GET.get('end', request.GET.get('start')))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    if end_date < start_date:
+        return JsonResponse({
+            'success': False, 
+            'error': 'End date must not be before start date'
+        }, status=400)
+    
+    if (end_date - start_date).days >= MAX_RANGE_DAYS:
+        return JsonResponse({
+            'success': False, 
+            'error': f'Date range cannot exceed {MAX_RANGE_DAYS} days'
+        }, status=400)
+    
+    instructor = find_in_catalog('instructors', request.GET.get('instructor'))
+    if instructor is None:
+        return JsonResponse({
+            'success': False, 
+            'error': 'Invalid instructor'
+        }, status=400)
+    
+    min_date = (timezone.now() + timezone.timedelta(days=1)).date()
+    duration = parse_duration(request.GET.get('duration'))
+    days = get_range_availability(
+        instructor, start_date, end_date,
+        min_date=min_date, duration=duration
+    )
+    
+    return JsonResponse({
+        'success': True,
+        'instructor': instructor.id,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'time_slots': dict(TIME_SLOTS),
+        'days': {
+            day['date'].isoformat(): day['available_slots']
+            for day in days
+        },
+    })
+
+@cache_public_page(Instructor, Testimonial)
 def about(request):
-    instructors = Instructor.objects.filter(is_active=True).annotate(
-        num_reviews=Count('testimonials')
-    ).order_by('-years_experience')
+    instructors = get_catalog_list('instructor_profiles')
     return render(request, 'lessons/about.html', {'instructors': instructors})
 
 def instructor_detail(request, pk):
-    instructor = get_object_or_404(Instructor, pk=pk, is_active=True)
+    instructor = get_catalog_object_or_404('instructors', pk)
     testimonials = Testimonial.objects.filter(
         instructor=instructor,
         is_approved=True
@@ -955,16 +605,8 @@ def instructor_detail(request, pk):
         'testimonials': testimonials,
     })
 
+@cache_public_page(FAQComment, query_params=('before',))
 def faq(request):
-    faqs = [
-        {"q": "Do I need to bring my own firearm or ammo?", 
-         "a": "No. All necessary firearms, ammunition, eye and ear protection, and targets are provided."},
-        {"q": "Is it safe for beginners with no experience?", 
-         "a": "Absolutely. Our lessons are tailored for beginners with step-by-step safety instruction."},
-    ]
-
-    comments = FAQComment.objects.filter(parent__isnull=True, is_active=True).order_by('-created_at')
-    
     if request.method == 'POST':
         if not request.user.is_authenticated:
             messages.error(request, "You must be logged in to post a comment.")
@@ -979,8 +621,10 @@ def faq(request):
             parent_id = request.POST.get('parent_id')
             if parent_id:
                 try:
-                    comment.parent = FAQComment.objects.get(id=parent_id)
-                except FAQComment.DoesNotExist:
+                    comment.parent = thread_root(
+                        FAQComment.objects.select_related('parent').get(id=parent_id)
+                    )
+                except (FAQComment.DoesNotExist, ValueError):
                     messages.error(request, "Invalid comment reference.")
                     return redirect('faq')
             
@@ -990,12 +634,71 @@ def faq(request):
     else:
         form = FAQCommentForm()
 
+    comments, next_cursor = comment_threads(request.GET.get('before'))
     return render(request, 'lessons/faq.html', {
-        'faqs': faqs,
+        'faq_sections': faq_sections(),
         'comments': comments,
+        'next_cursor': next_cursor,
         'form': form,
     })
 
+def faq_comments(request):
+    """Next page of FAQ threads for the load more button"""
+    if request.method != 'GET':
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid request method'
+        }, status=405)
+
+    comments, next_cursor = comment_threads(request.GET.get('before'))
+    user_id = request.user.id if request.user.is_authenticated else None
+    return JsonResponse({
+        'success': True,
+        'comments': [
+            dict(
+                comment_data(comment, user_id),
+                replies=[comment_data(reply, user_id) for reply in comment.thread_replies]
+            )
+            for comment in comments
+        ],
+        'next_cursor': next_cursor,
+        'can_reply': user_id is not None,
+    })
+
+def similar_questions(request):
+    """Already answered questions resembling the one being typed (?q=)"""
+    if request.method != 'GET':
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid request method'
+        }, status=405)
+
+    text = request.GET.get('q', '')[:1000]
+    return JsonResponse({
+        'success': True,
+        'questions': find_similar_questions(text),
+    })
+
+def search_api(request):
+    """Ranked FAQ, comment, package and testimonial matches for ?q=, prefixes included"""
+    if request.method != 'GET':
+        return JsonResponse({
+            'success': False,
+            'error': 'Invalid request method'
+        }, status=405)
+
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'results': search(query, limit),
+    })
+
+@cache_public_page(RangeLocation)
 def contact(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
@@ -1010,12 +713,13 @@ def contact(request):
     
     return render(request, 'lessons/contact.html', {
         'form': form,
-        'locations': RangeLocation.objects.filter(is_active=True),
+        'locations': get_catalog_list('locations'),
     })
 
 def legal(request):
     return render(request, 'lessons/legal.html')
 
+@cache_public_page()
 def privacy(request):
     return render(request, 'lessons/privacy.html')
 
@@ -1097,23 +801,14 @@ def user_logout(request):
 def user_dashboard(request):
     try:
         now = timezone.now().date()
-        upcoming_bookings = Booking.objects.filter(
-            user=request.user,
-            date__gte=now
-        ).order_by('date', 'time')
-        
-        past_bookings = Booking.objects.filter(
-            user=request.user,
-            date__lt=now
-        ).order_by('-date', '-time')
-        
-        paginator = Paginator(past_bookings, 5)
-        page_number = request.GET.get('page')
-        past_bookings_page = paginator.get_page(page_number)
+        cursor = request.GET.get('before')
+        upcoming_bookings, past_bookings, next_cursor = dashboard_bookings(request.user, now, cursor)
         
         context = {
             'upcoming_bookings': upcoming_bookings,
-            'past_bookings': past_bookings_page,
+            'past_bookings': past_bookings,
+            'next_cursor': next_cursor,
+            'is_first_page': not decode_cursor(cursor),
             'now': now
         }
         
@@ -1127,7 +822,10 @@ def user_dashboard(request):
 @login_required
 def booking_detail(request, booking_id):
     try:
-        booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
+        booking = get_object_or_404(
+            Booking.objects.select_related('package', 'instructor__user', 'location'),
+            pk=booking_id, user=request.user
+        )
         cutoff_time = timezone.make_aware(datetime.combine(booking.date, dt_time(0, 0)))
         can_cancel = (cutoff_time - timezone.now()) > timezone.timedelta(hours=24)
         
@@ -1147,7 +845,10 @@ def booking_detail(request, booking_id):
 @login_required
 def cancel_booking(request, booking_id):
     try:
-        booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
+        booking = get_object_or_404(
+            Booking.objects.select_related('package', 'instructor__user', 'location'),
+            pk=booking_id, user=request.user
+        )
         cutoff_time = timezone.make_aware(datetime.combine(booking.date, dt_time(0, 0)))
         
         # Check if cancellation is allowed (at least 24 hours in advance)
@@ -1186,170 +887,16 @@ def send_booking_cancellation_email(booking, user=None):
         if user and hasattr(user, 'email') and user.email:
             recipients.append(user.email)
         
-        subject = f"Booking Cancellation: {booking.package.name}"
-        
-        # Determine refund message based on payment method
-        refund_message = ""
-        if booking.payment_method == 'paypal':
-            refund_message = "\nSince you paid via PayPal, please contact our support to process your refund."
-        elif booking.payment_method == 'cash':
-            refund_message = "\nAs you selected cash payment, no refund processing is needed."
-        
-        # Text content
-        text_content = f"""Your booking has been successfully cancelled.
-
-Cancellation Details:
-Package: {booking.package.name}
-Instructor: {booking.instructor.user.get_full_name()}
-Original Date: {booking.date.strftime('%A, %B %d, %Y')}
-Original Time: {booking.time.strftime('%I:%M %p')}
-Duration: {booking.duration} minutes
-Location: {booking.location.name if booking.location else 'To be determined'}
-Total: ${booking.package.price}
-
-Payment Method: {booking.get_payment_method_display()}
-Status: Cancelled
-{refund_message}
-
-If this cancellation was a mistake or you need to reschedule, please contact us.
-
-Thank you,
-The Ready Aim Learn Team
-"""
-
-        # HTML content
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Booking Cancellation Confirmation</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#718096" style="padding: 30px; text-align: center; border-bottom: 4px solid #e53e3e;">
-                                    <h1 style="color: white; margin: 0; font-size: 28px; font-weight: 600;">❌ Booking Cancelled</h1>
-                                    <p style="color: #cbd5e0; margin: 10px 0 0; font-size: 16px;">Ready Aim Learn - Firearms Training</p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Greeting -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <h2 style="color: #2d3748; margin-top: 0;">Hello {user.get_full_name() if user else 'Customer'},</h2>
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Your booking has been successfully cancelled. Details of the cancelled booking are below.</p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Cancellation Details -->
-                            <tr>
-                                <td style="padding: 0 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                                        <tr>
-                                            <td bgcolor="#f8fafc" style="padding: 25px; border-radius: 8px; border-left: 5px solid #718096;">
-                                                <h3 style="color: #2d3748; margin-top: 0; font-size: 20px;">📋 Cancelled Booking Details</h3>
-                                                
-                                                <table width="100%" cellpadding="8" cellspacing="0" border="0">
-                                                    <tr>
-                                                        <td width="30%" style="color: #4a5568; font-weight: 600;">Package:</td>
-                                                        <td width="70%" style="color: #2d3748;">{booking.package.name}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Instructor:</td>
-                                                        <td style="color: #2d3748;">{booking.instructor.user.get_full_name()}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Date & Time:</td>
-                                                        <td style="color: #2d3748;">{booking.date.strftime('%A, %B %d, %Y')} at {booking.time.strftime('%I:%M %p')}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Duration:</td>
-                                                        <td style="color: #2d3748;">{booking.duration} minutes</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Location:</td>
-                                                        <td style="color: #2d3748;">{booking.location.name if booking.location else 'To be determined'}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Total:</td>
-                                                        <td style="color: #2d3748; font-weight: 600; color: #2b6cb0;">${booking.package.price}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Payment Method:</td>
-                                                        <td style="color: #2d3748;">{booking.get_payment_method_display()}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Status:</td>
-                                                        <td style="color: #e53e3e; font-weight: 600;">Cancelled</td>
-                                                    </tr>
-                                                </table>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Refund Information -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <div style="background-color: #fffbeb; padding: 20px; border-radius: 8px; border-left: 5px solid #d69e2e;">
-                                        <h3 style="color: #744210; margin-top: 0; font-size: 18px;">💰 Refund Information</h3>
-                                        <p style="color: #744210; margin: 0; line-height: 1.6;">
-                                            {"Since you paid via PayPal, please contact our support at support@readyaimlearn.com to process your refund."
-                                             if booking.payment_method == 'paypal' 
-                                             else "As you selected cash payment, no refund processing is needed."}
-                                        </p>
-                                        <p style="color: #744210; margin: 10px 0 0; line-height: 1.6;">
-                                            If this cancellation was a mistake or you need to reschedule, please contact us.
-                                        </p>
-                                    </div>
-                                </td>
-                            </tr>
-                            
-                            <!-- Contact Info -->
-                            <tr>
-                                <td style="padding: 0 30px 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#edf2f7" style="border-radius: 8px;">
-                                        <tr>
-                                            <td style="padding: 20px; text-align: center;">
-                                                <p style="color: #4a5568; margin: 0; font-weight: 600;">Questions? Contact us at:</p>
-                                                <p style="color: #2b6cb0; margin: 8px 0; font-size: 18px; font-weight: 600;">support@readyaimlearn.com</p>
-                                                <p style="color: #4a5568; margin: 0;">(555) 123-4567</p>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 25px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0 0 10px;">© {datetime.now().year} Ready Aim Learn. All rights reserved.</p>
-                                    <p style="margin: 0; font-size: 12px;">123 Shooting Range Rd, Firearm City, FC 12345</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients
+        email = build_email(
+            'booking_cancellation',
+            f"Booking Cancellation: {booking.package.name}",
+            recipients,
+            {
+                'booking': booking,
+                'customer_name': user.get_full_name() if user else 'Customer',
+            }
         )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
+        queue_email(email)
             
     except Exception as e:
         logger.error(f"Failed to send booking cancellation email: {str(e)}", exc_info=True)
@@ -1498,6 +1045,7 @@ from django.urls import reverse
 
 logger = logging.getLogger(__name__)
 
+@cache_public_page()
 def legal(request):
     """Render the legal terms page and handle acceptance"""
     if request.method == 'POST' and request.user.is_authenticated:
@@ -1524,66 +1072,22 @@ def legal(request):
     return render(request, 'lessons/legal.html')
 
 def download_registration_form(request):
-    """Serve the registration form PDF for download"""
+    """
+    Serve the registration form PDF for download.
+
+    With ?booking=<id>, the owner of a confirmed booking gets the copy
+    prefilled by build_registration_forms, once it has been built.
+    """
     try:
-        # Try multiple possible paths for the PDF file
-        possible_paths = [
-            os.path.join(settings.MEDIA_ROOT, 'documents', 'registration_form.pdf'),
-            os.path.join(settings.BASE_DIR, 'media', 'documents', 'registration_form.pdf'),
-            os.path.join(settings.BASE_DIR, 'static', 'documents', 'registration_form.pdf'),
-            os.path.join(settings.STATIC_ROOT, 'documents', 'registration_form.pdf') if settings.STATIC_ROOT else None,
-            os.path.join(settings.BASE_DIR, 'registration_form.pdf'),
-        ]
-        
-        # Filter out None paths
-        possible_paths = [path for path in possible_paths if path]
-        
-        pdf_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                pdf_path = path
-                break
-        
-        if pdf_path:
-            return FileResponse(open(pdf_path, 'rb'), 
-                              as_attachment=True, 
-                              filename='registration_form.pdf')
-        else:
-            # Create a simple PDF file on the fly if not found
-            from io import BytesIO
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import letter
-            
-            buffer = BytesIO()
-            p = canvas.Canvas(buffer, pagesize=letter)
-            p.drawString(100, 750, "Registration Form")
-            p.drawString(100, 730, "Ready Aim Learn")
-            p.drawString(100, 710, "=" * 50)
-            p.drawString(100, 690, "Student Information:")
-            p.drawString(100, 670, "Full Name: ___________________________")
-            p.drawString(100, 650, "Email: ___________________________")
-            p.drawString(100, 630, "Phone: ___________________________")
-            p.drawString(100, 610, "=" * 50)
-            p.drawString(100, 590, "Course Details:")
-            p.drawString(100, 570, "Course Name: ___________________________")
-            p.drawString(100, 550, "Start Date: ___________________________")
-            p.drawString(100, 530, "=" * 50)
-            p.drawString(100, 510, "Instructor Section:")
-            p.drawString(100, 490, "Instructor Signature: ___________________________")
-            p.drawString(100, 470, "Date: ___________________________")
-            p.drawString(100, 450, "Approval Stamp: ___________________________")
-            p.drawString(100, 400, "Instructions:")
-            p.drawString(100, 380, "1. Please fill out all sections completely")
-            p.drawString(100, 360, "2. Send the completed form to luisdavid313@gmail.com")
-            p.drawString(100, 340, "3. Bring the signed form to your instructor for final approval")
-            p.showPage()
-            p.save()
-            
-            buffer.seek(0)
-            return FileResponse(buffer, 
-                              as_attachment=True, 
-                              filename='registration_form.pdf')
-            
+        booking_id = request.GET.get('booking', '')
+        if booking_id.isdigit() and request.user.is_authenticated:
+            form = Booking.objects.filter(
+                pk=booking_id,
+                user=request.user
+            ).values_list('registration_form', flat=True).first()
+            if form:
+                return file_response(request, default_storage.path(form), REGISTRATION_FORM_NAME, private=True)
+        return file_response(request, resolve_registration_form(), REGISTRATION_FORM_NAME)
     except Exception as e:
         logger.error(f"Error serving PDF file: {str(e)}")
         messages.error(request, "Error downloading the form. Please contact support.")
@@ -1629,26 +1133,6 @@ def get_user_email_safely(user):
     
     return None
 
-def find_pdf_file():
-    """Find the PDF file in multiple possible locations"""
-    possible_paths = [
-        os.path.join(settings.MEDIA_ROOT, 'documents', 'registration_form.pdf'),
-        os.path.join(settings.BASE_DIR, 'media', 'documents', 'registration_form.pdf'),
-        os.path.join(settings.BASE_DIR, 'static', 'documents', 'registration_form.pdf'),
-        os.path.join(settings.STATIC_ROOT, 'documents', 'registration_form.pdf') if settings.STATIC_ROOT else None,
-        os.path.join(settings.BASE_DIR, 'registration_form.pdf'),
-        os.path.join(settings.BASE_DIR, 'assets', 'registration_form.pdf'),
-    ]
-    
-    # Filter out None paths
-    possible_paths = [path for path in possible_paths if path]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            return path
-    
-    return None
-
 def send_legal_confirmation_email(user, timestamp, request):
     """Send email confirmation of legal terms acceptance"""
     try:
@@ -1663,138 +1147,13 @@ def send_legal_confirmation_email(user, timestamp, request):
             logger.warning(f"No valid email address found for user {user.username}, skipping email notification")
             return
         
-        # Find PDF file
-        pdf_path = find_pdf_file()
-        has_pdf_attachment = pdf_path is not None
+        # Real form, or the fallback generated once at startup
+        pdf_path = resolve_registration_form()
+        has_pdf_attachment = True
         
         # Get absolute URL for download link
         download_url = request.build_absolute_uri(reverse('download_registration_form'))
         
-        text_content = f"""
-        Terms and Conditions Acceptance Confirmation
-        
-        Dear {user_full_name},
-        
-        This email confirms that you have accepted the Ready Aim Learn Terms and Conditions.
-        
-        Acceptance Details:
-        - User: {user.username}
-        - Email: {user_email}
-        - Date: {timestamp.strftime('%B %d, %Y')}
-        - Time: {timestamp.strftime('%I:%M %p %Z')}
-        
-        Your acceptance has been recorded in our system. Please keep this email for your records.
-        
-        IMPORTANT: Please fill out the registration except the final paragraph and send it to 
-        luisdavid313@gmail.com to be signed by your instructor in person 
-        for final approval.
-        
-        {"The registration form is attached to this email." if has_pdf_attachment else "Please download the registration form from our website."}
-        
-        Download link: {download_url}
-        
-        If you have any questions about our terms and conditions, please contact us at legal@readyaimlearn.com.
-        
-        Thank you,
-        The Ready Aim Learn Team
-        """
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Terms Acceptance Confirmation</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#2c5282" style="padding: 30px; text-align: center;">
-                                    <h1 style="color: white; margin: 0; font-size: 24px; font-weight: 600;">✅ Terms Acceptance Confirmed</h1>
-                                </td>
-                            </tr>
-                            
-                            <!-- Content -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <h2 style="color: #2d3748; margin-top: 0;">Hello {user_full_name},</h2>
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">This email confirms that you have accepted the Ready Aim Learn Terms and Conditions.</p>
-                                    
-                                    <div style="background-color: #f8fafc; padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #2c5282;">
-                                        <h3 style="color: #2d3748; margin-top: 0;">Acceptance Details:</h3>
-                                        <table width="100%" cellpadding="8" cellspacing="0" border="0">
-                                            <tr>
-                                                <td width="30%" style="color: #4a5568; font-weight: 600;">User:</td>
-                                                <td width="70%" style="color: #2d3748;">{user.username}</td>
-                                            </tr>
-                                            <tr>
-                                                <td style="color: #4a5568; font-weight: 600;">Email:</td>
-                                                <td style="color: #2b6cb0;">{user_email}</td>
-                                            </tr>
-                                            <tr>
-                                                <td style="color: #4a5568; font-weight: 600;">Date:</td>
-                                                <td style="color: #2d3748;">{timestamp.strftime('%B %d, %Y')}</td>
-                                            </tr>
-                                            <tr>
-                                                <td style="color: #4a5568; font-weight: 600;">Time:</td>
-                                                <td style="color: #2d3748;">{timestamp.strftime('%I:%M %p %Z')}</td>
-                                            </tr>
-                                        </table>
-                                    </div>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Your acceptance has been recorded in our system. Please keep this email for your records.</p>
-                                    
-                                    <!-- Important Notice Section -->
-                                    <div style="background-color: #fff5f5; padding: 20px; border-radius: 8px; margin: 25px 0; border-left: 4px solid #e53e3e;">
-                                        <h3 style="color: #c53030; margin-top: 0; font-size: 18px;">📋 Important Next Steps:</h3>
-                                        <p style="color: #742a2a; font-size: 15px; line-height: 1.5; margin-bottom: 10px;">
-                                            Please fill out the registration form except the final paragraph and send it to 
-                                            <strong style="color: #2b6cb0;">luisdavid313@gmail.com</strong> to be signed by your instructor 
-                                            in person for final approval.
-                                        </p>
-                                        <p style="color: #742a2a; font-size: 15px; line-height: 1.5; margin: 0;">
-                                            <strong>Note:</strong> This step is required to complete your registration process.
-                                        </p>
-                                    </div>
-                                    
-                                    <!-- PDF Download Button -->
-                                    <div style="text-align: center; margin: 30px 0;">
-                                        <a href="{download_url}" 
-                                           style="display: inline-block; background-color: #2c5282; color: white; 
-                                                  padding: 15px 30px; text-decoration: none; border-radius: 8px; 
-                                                  font-weight: 600; font-size: 16px; transition: background-color 0.3s;">
-                                            📄 Download Registration Form (PDF)
-                                        </a>
-                                        <p style="color: #4a5568; font-size: 14px; margin-top: 10px;">
-                                            {"The form has also been attached to this email." if has_pdf_attachment else "Please download the form using the button above."}
-                                        </p>
-                                    </div>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">If you have any questions about our terms and conditions, please contact us at <strong>legal@readyaimlearn.com</strong>.</p>
-                                    
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Thank you,<br><strong>The Ready Aim Learn Team</strong></p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 20px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0;">© {timestamp.year} Ready Aim Learn. All rights reserved.</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-        
         # Send to user and admin
         recipients = [user_email, "vviiddaa2@gmail.com", "luisdavid313@gmail.com"]
         
@@ -1805,52 +1164,30 @@ def send_legal_confirmation_email(user, timestamp, request):
             logger.warning("No valid recipients found for legal confirmation email")
             return
             
-        email = EmailMultiAlternatives(
+        email = build_email(
+            'terms_confirmation',
             subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients
+            recipients,
+            {
+                'user': user,
+                'user_email': user_email,
+                'customer_name': user_full_name,
+                'timestamp': timestamp,
+                'download_url': download_url,
+                'has_pdf_attachment': has_pdf_attachment,
+            }
         )
-        email.attach_alternative(html_content, "text/html")
         
-        # Attach PDF file if it exists
-        if pdf_path:
-            try:
-                with open(pdf_path, 'rb') as pdf_file:
-                    email.attach('registration_form.pdf', pdf_file.read(), 'application/pdf')
-                logger.info(f"PDF file attached successfully: {pdf_path}")
-            except Exception as e:
-                logger.error(f"Error attaching PDF file: {str(e)}")
-        else:
-            logger.warning("PDF file not found for attachment. Creating a simple one...")
-            # Create a simple PDF attachment
-            from io import BytesIO
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.pagesizes import letter
-            
-            buffer = BytesIO()
-            p = canvas.Canvas(buffer, pagesize=letter)
-            p.drawString(100, 750, "Registration Form - Ready Aim Learn")
-            p.drawString(100, 730, "Please fill out and send to luisdavid313@gmail.com")
-            p.drawString(100, 700, "=" * 60)
-            p.drawString(100, 680, "Student Information:")
-            p.drawString(100, 660, "Full Name: ___________________________")
-            p.drawString(100, 640, "Email: ___________________________")
-            p.drawString(100, 620, "Course: ___________________________")
-            p.drawString(100, 600, "=" * 60)
-            p.drawString(100, 580, "Instructor Approval Section:")
-            p.drawString(100, 560, "Signature: ___________________________")
-            p.drawString(100, 540, "Date: ___________________________")
-            p.drawString(100, 520, "Approval Stamp: ___________________________")
-            p.showPage()
-            p.save()
-            
-            buffer.seek(0)
-            email.attach('registration_form.pdf', buffer.getvalue(), 'application/pdf')
+        try:
+            with open(pdf_path, 'rb') as pdf_file:
+                email.attach(REGISTRATION_FORM_NAME, pdf_file.read(), 'application/pdf')
+            logger.info(f"PDF file attached successfully: {pdf_path}")
+        except Exception as e:
+            logger.error(f"Error attaching PDF file: {str(e)}")
         
-        email.send()
+        queue_email(email)
         
-        logger.info(f"Successfully sent legal confirmation email to {user_email} for user {user.username}")
+        logger.info(f"Queued legal confirmation email to {user_email} for user {user.username}")
             
     except Exception as e:
         logger.error(f"Failed to send legal confirmation email: {str(e)}", exc_info=True)
@@ -1860,8 +1197,7 @@ from django.http import FileResponse
 import os
 
 def serve_registration_form(request):
-    file_path = os.path.join(settings.STATIC_ROOT, 'lessons', 'documents', 'registration_form.pdf')
-    return FileResponse(open(file_path, 'rb'), content_type='application/pdf')
+    return file_response(request, resolve_registration_form(), REGISTRATION_FORM_NAME, as_attachment=False)
 
 # در urls.py
 from . import views
@@ -1872,40 +1208,6 @@ urlpatterns = [
 
 from django.views.decorators.csrf import csrf_exempt
 import json
-@csrf_exempt
-@login_required
-def payment_confirm(request):
-    """
-    این ویو بعد از پرداخت موفق PayPal صدا زده میشه.
-    دیتای پرداخت رو از فرانت‌اند می‌گیره و بوکینگ واقعی رو می‌سازه.
-    """
-    if request.method == "POST":
-        try:
-            data = json.loads(request.body)
-            logger.info(f"PayPal confirmation received: {data}")
-
-            # گرفتن pending_booking از session
-            pending_booking = request.session.get('pending_booking')
-            if not pending_booking:
-                logger.warning("No pending booking found in session")
-                return JsonResponse({"error": "No pending booking found"}, status=400)
-
-            # ایجاد بوکینگ واقعی
-            booking = create_actual_booking(request.user, pending_booking)
-
-            # پاک کردن session
-            if 'pending_booking' in request.session:
-                del request.session['pending_booking']
-
-            logger.info(f"Booking created successfully: {booking.id}")
-            return JsonResponse({"success": True, "booking_id": booking.id})
-
-        except Exception as e:
-            logger.error(f"Error in payment_confirm: {str(e)}", exc_info=True)
-            return JsonResponse({"error": str(e)}, status=500)
-
-    return JsonResponse({"error": "Invalid request method"}, status=405)
-
 
 def send_paypal_booking_confirmation(booking, user=None):
     """Send booking confirmation email for PayPal payments"""
@@ -1917,174 +1219,16 @@ def send_paypal_booking_confirmation(booking, user=None):
         if user and hasattr(user, 'email'):
             recipients.append(user.email)
         
-        subject = f"PayPal Payment Received: {booking.package.name}"
-        
-        # Text content
-        text_content = f"""Thank you for your PayPal payment!
-
-Booking Details:
-Package: {booking.package.name}
-Instructor: {booking.instructor.user.get_full_name()}
-Date: {booking.date.strftime('%A, %B %d, %Y')}
-Time: {booking.time.strftime('%I:%M %p')}
-Duration: {booking.duration} minutes
-Location: {booking.location.name if booking.location else 'To be determined'}
-Total: ${booking.package.price}
-
-Payment Method: PayPal
-Status: {booking.get_status_display()}
-
-Your payment has been successfully processed. We're looking forward to seeing you at your lesson!
-
-If you need to cancel or reschedule, please contact us at least 24 hours in advance.
-"""
-
-        # HTML content
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>PayPal Payment Confirmation</title>
-        </head>
-        <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f7f7f7;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#f7f7f7">
-                <tr>
-                    <td align="center" style="padding: 40px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" bgcolor="#ffffff" style="border-radius: 12px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.1);">
-                            <!-- Header -->
-                            <tr>
-                                <td bgcolor="#1a365d" style="padding: 30px; text-align: center; border-bottom: 4px solid #0070ba;">
-                                    <h1 style="color: white; margin: 0; font-size: 28px; font-weight: 600;">✅ PayPal Payment Confirmed</h1>
-                                    <p style="color: #cbd5e0; margin: 10px 0 0; font-size: 16px;">Ready Aim Learn - Firearms Training</p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Greeting -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <h2 style="color: #2d3748; margin-top: 0;">Hello {user.get_full_name() if user else 'Customer'},</h2>
-                                    <p style="color: #4a5568; font-size: 16px; line-height: 1.6;">Thank you for your PayPal payment! Your shooting lesson has been confirmed with the details below.</p>
-                                </td>
-                            </tr>
-                            
-                            <!-- Payment Confirmation -->
-                            <tr>
-                                <td style="padding: 0 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                                        <tr>
-                                            <td bgcolor="#e6fffa" style="padding: 15px; border-radius: 8px; text-align: center; margin-bottom: 20px;">
-                                                <p style="color: #234e52; margin: 0; font-weight: 600; font-size: 16px;">
-                                                    ✅ Your PayPal payment of ${booking.package.price} has been successfully processed.
-                                                </p>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Booking Details -->
-                            <tr>
-                                <td style="padding: 0 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0">
-                                        <tr>
-                                            <td bgcolor="#f8fafc" style="padding: 25px; border-radius: 8px; border-left: 5px solid #0070ba;">
-                                                <h3 style="color: #2d3748; margin-top: 0; font-size: 20px;">📋 Lesson Details</h3>
-                                                
-                                                <table width="100%" cellpadding="8" cellspacing="0" border="0">
-                                                    <tr>
-                                                        <td width="30%" style="color: #4a5568; font-weight: 600;">Package:</td>
-                                                        <td width="70%" style="color: #2d3748;">{booking.package.name}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Instructor:</td>
-                                                        <td style="color: #2d3748;">{booking.instructor.user.get_full_name()}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Date & Time:</td>
-                                                        <td style="color: #2d3748;">{booking.date.strftime('%A, %B %d, %Y')} at {booking.time.strftime('%I:%M %p')}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Duration:</td>
-                                                        <td style="color: #2d3748;">{booking.duration} minutes</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Location:</td>
-                                                        <td style="color: #2d3748;">{booking.location.name if booking.location else 'To be determined'}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Total Paid:</td>
-                                                        <td style="color: #2d3748; font-weight: 600; color: #38a169;">${booking.package.price}</td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Payment Method:</td>
-                                                        <td style="color: #2d3748;">
-                                                            <span style="color: #0070ba; font-weight: 600;">PayPal</span>
-                                                        </td>
-                                                    </tr>
-                                                    <tr>
-                                                        <td style="color: #4a5568; font-weight: 600;">Status:</td>
-                                                        <td style="color: #38a169; font-weight: 600;">{booking.get_status_display()}</td>
-                                                    </tr>
-                                                </table>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Important Notes -->
-                            <tr>
-                                <td style="padding: 30px;">
-                                    <div style="background-color: #fffbeb; padding: 20px; border-radius: 8px; border-left: 5px solid #d69e2e;">
-                                        <h3 style="color: #744210; margin-top: 0; font-size: 18px;">⚠️ Important Information</h3>
-                                        <p style="color: #744210; margin: 0; line-height: 1.6;">
-                                            Please arrive <strong>15 minutes early</strong> for safety briefing and equipment setup.
-                                            If you need to cancel or reschedule, please contact us at least 24 hours in advance.
-                                        </p>
-                                    </div>
-                                </td>
-                            </tr>
-                            
-                            <!-- Contact Info -->
-                            <tr>
-                                <td style="padding: 0 30px 30px;">
-                                    <table width="100%" cellpadding="0" cellspacing="0" border="0" bgcolor="#edf2f7" style="border-radius: 8px;">
-                                        <tr>
-                                            <td style="padding: 20px; text-align: center;">
-                                                <p style="color: #4a5568; margin: 0; font-weight: 600;">Questions? Contact us at:</p>
-                                                <p style="color: #2b6cb0; margin: 8px 0; font-size: 18px; font-weight: 600;">support@readyaimlearn.com</p>
-                                                <p style="color: #4a5568; margin: 0;">(555) 123-4567</p>
-                                            </td>
-                                        </tr>
-                                    </table>
-                                </td>
-                            </tr>
-                            
-                            <!-- Footer -->
-                            <tr>
-                                <td bgcolor="#2d3748" style="padding: 25px; text-align: center; color: #cbd5e0; font-size: 14px;">
-                                    <p style="margin: 0 0 10px;">© {datetime.now().year} Ready Aim Learn. All rights reserved.</p>
-                                    <p style="margin: 0; font-size: 12px;">123 Shooting Range Rd, Firearm City, FC 12345</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
-
-        email = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients
+        email = build_email(
+            'paypal_confirmation',
+            f"PayPal Payment Received: {booking.package.name}",
+            recipients,
+            {
+                'booking': booking,
+                'customer_name': user.get_full_name() if user else 'Customer',
+            }
         )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
+        queue_email(email)
             
     except Exception as e:
         logger.error(f"Failed to send PayPal booking confirmation: {str(e)}", exc_info=True)
@@ -2094,36 +1238,34 @@ If you need to cancel or reschedule, please contact us at least 24 hours in adva
 @csrf_exempt
 @login_required
 def payment_confirm(request):
-    """Handle PayPal payment confirmation from frontend"""
+    """
+    Report whether the frontend's PayPal payment has been confirmed.
+
+    Only the verified IPN confirms a payment; what the browser reports
+    about it (status, capture or order IDs) can be forged, so this view
+    just reads the draft's booking once the IPN created it.
+    """
     if request.method != "POST":
         return JsonResponse({"success": False, "error": "Invalid request method"}, status=405)
 
     try:
         data = json.loads(request.body.decode("utf-8"))
-        order_id = data.get("orderID")
-        details = data.get("details", {})
-
-        # Check PayPal status in details
-        status = details.get("status", "").lower()
-        if status != "completed":
-            return JsonResponse({"success": False, "error": "Payment not completed"})
-
 
-        # Get pending booking from session
-        pending_booking = request.session.get("pending_booking")
+        # Find the draft by the invoice ID sent to PayPal
+        pending_booking = get_pending_booking(request, data.get("invoice"))
         if not pending_booking:
             return JsonResponse({"success": False, "error": "No pending booking found"})
 
-        # Create the actual booking in DB
-        booking = create_actual_booking(request.user, pending_booking)
+        if not pending_booking.booking_id:
+            # The IPN has not arrived yet; the client polls or moves on to payment_success
+            return JsonResponse({"success": True, "pending": True}, status=202)
 
         # Remove pending booking from session
-        if "pending_booking" in request.session:
-            del request.session["pending_booking"]
+        request.session.pop("pending_booking_invoice", None)
 
         return JsonResponse({
             "success": True,
-            "booking_id": booking.id
+            "booking_id": pending_booking.booking_id
         })
 
     except Exception as e:
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.security.SecurityMiddleware',
+    # Answers /static/ requests before sessions, CSRF and URL resolution
+    'lessons.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,8 +53,15 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    # Query count/time headers and budget checks; removes itself unless enabled
+    'lessons.middleware.QueryBudgetMiddleware',
 ]
 
+# See lessons/query_budgets.py
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", str(DEBUG)) == "True"
+# Raise instead of logging when a view goes over its budget
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "False") == "True"
+
 ROOT_URLCONF = 'ready_aim_learn.urls'
 
 # ==============================================
@@ -62,13 +71,21 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are cached per process; email templates get
+            # their stylesheet inlined once, when first loaded
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'lessons.template_loaders.EmailLoader',
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -85,6 +102,23 @@ DATABASES = {
     }
 }
 
+# ==============================================
+# Cache
+# ==============================================
+# The catalog cache is invalidated through version tokens stored here, so
+# every worker must share this cache: in production set CACHE_BACKEND to
+# e.g. django.core.cache.backends.redis.RedisCache and CACHE_LOCATION to
+# the server URL. The per-process default is only fit for development.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("CACHE_LOCATION", 'ready-aim-learn'),
+    }
+}
+# Longest time a public page is served from the cache before re-rendering;
+# model changes invalidate it sooner
+PAGE_CACHE_SECONDS = int(os.getenv("PAGE_CACHE_SECONDS", 3600))
+
 # ==============================================
 # Password validation
 # ==============================================
@@ -109,12 +143,38 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+# collectstatic writes hashed file names plus .gz/.br copies, served by
+# lessons.middleware.StaticFilesMiddleware
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'lessons.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# Let the front-end server send downloads such as the registration form:
+# 'X-Sendfile' (Apache/lighttpd) or 'X-Accel-Redirect' (nginx, which maps
+# SENDFILE_URL_PREFIX as an internal location onto SENDFILE_ROOT)
+SENDFILE_HEADER = os.getenv("SENDFILE_HEADER") or None
+SENDFILE_ROOT = os.getenv("SENDFILE_ROOT", str(BASE_DIR))
+SENDFILE_URL_PREFIX = os.getenv("SENDFILE_URL_PREFIX", "/protected/")
 
 # Fix JS MIME type
 mimetypes.add_type("text/javascript", ".js", True)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# ==============================================
+# Booking
+# ==============================================
+# Minutes kept free between two lessons of the same instructor
+BOOKING_BUFFER_MINUTES = int(os.getenv("BOOKING_BUFFER_MINUTES", 0))
+# Weeks of slot inventory precomputed by `manage.py rebuild_slot_inventory`
+SLOT_INVENTORY_WEEKS = int(os.getenv("SLOT_INVENTORY_WEEKS", 8))
+# How long a slot stays reserved while the customer pays with PayPal
+SLOT_HOLD_MINUTES = int(os.getenv("SLOT_HOLD_MINUTES", 15))
+# Function weighting the random featured packages, e.g.
+# 'lessons.featured.recent_booking_weights' (unset: all equally likely)
+FEATURED_PACKAGE_WEIGHTS = os.getenv("FEATURED_PACKAGE_WEIGHTS") or None
+
 # ==============================================
 # Authentication & Allauth
 # ==============================================
@@ -173,13 +233,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Email Configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'lessons.mail_backends.PooledEmailBackend'
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER)
+# Seconds allowed for connecting (incl. TLS and login) and for each SMTP command
+EMAIL_CONNECT_TIMEOUT = float(os.getenv("EMAIL_CONNECT_TIMEOUT", 10))
+EMAIL_SEND_TIMEOUT = float(os.getenv("EMAIL_SEND_TIMEOUT", 30))
+# A worker reconnects instead of reusing a connection idle for longer than this
+EMAIL_POOL_IDLE_SECONDS = int(os.getenv("EMAIL_POOL_IDLE_SECONDS", 60))
 
 # ==============================================
 # Security for production
@@ -2,8 +2,6 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.contrib.staticfiles.views import serve
-from django.views.decorators.cache import never_cache
 from django.http import JsonResponse
 from allauth.socialaccount.models import SocialApp
 from django.contrib.sites.models import Site
@@ -27,9 +25,7 @@ urlpatterns = [
     path('', include('lessons.urls')),  # Your main app
 ]
 
-# Development-only URLs
+# Development-only URLs; static files are served by
+# lessons.middleware.StaticFilesMiddleware
 if settings.DEBUG:
-    urlpatterns += [
-        path('static/<path:path>', never_cache(serve)),
-    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file